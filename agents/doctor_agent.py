@@ -1,22 +1,24 @@
 # agents/doctor_agent.py
+import asyncio
 from typing import Dict, Any
 from agents.base_agent import BaseAgent
+from services.config import load_config
 from services.mcp import MCPAssembler
 from services.reasoner import MCPReasoner
 from services.utils import format_agent_message
-from services.kg_service import KGService
-from services.vdb_service import VDBService
-
-vdb_service = VDBService()
-kg_service = KGService()
+from services.vdb_service import merge_hits
 
 class DoctorAgent(BaseAgent):
-    def __init__(self, kg_service, vdb_service, assembler: MCPAssembler, reasoner: MCPReasoner, a2a_client=None):
+    def __init__(self, kg_service, vdb_service, assembler: MCPAssembler, reasoner: MCPReasoner, a2a_client=None, reranker=None):
         super().__init__("doctor")
         self.kg = kg_service
         self.vdb = vdb_service
         self.assembler = assembler
         self.reasoner = reasoner
+        # optional second stage (services/reranker.py): wider first-stage search, cross-encoder re-order
+        self.reranker = reranker
+        # default metadata filter for evidence search; a request can override it with state['vdb_filters']
+        self.vdb_filters = (load_config()["faiss"].get("agent_filters") or {}).get("doctor") or None
         self.a2a = a2a_client
 
     async def handle(self, state: Dict[str,Any]) -> Dict[str,Any]:
@@ -40,14 +42,21 @@ class DoctorAgent(BaseAgent):
         # Retrieve in parallel - use different methods based on symptom count
         if len(symptoms) > 1:
             # Use the new method for multiple symptoms - find diseases with ALL symptoms
-            kg_triples = self.kg.retrieve_diseases_with_all_symptoms(symptoms, limit=100)
+            kg_call = self.kg.aretrieve_diseases_with_all_symptoms(symptoms, limit=100)
             print(f"[Doctor] Using multi-symptom search for: {symptoms}")
         else:
             # Use original method for single symptom or general search
-            kg_triples = self.kg.retrieve_triples(search_q, limit=20)
+            kg_call = self.kg.aretrieve_triples(search_q, limit=20)
             print(f"[Doctor] Using single-symptom search for: {search_q}")
         
-        vdb_hits = self.vdb.query(search_q, top_k=8)
+        # One batched search covering each symptom separately, overlapping the KG round trip
+        filters = state.get("vdb_filters") or self.vdb_filters
+        first_k = self.reranker.first_stage_k(8) if self.reranker else 8
+        kg_triples, vdb_hits = await asyncio.gather(
+            kg_call, self.vdb.aquery_batch(symptoms or [search_q], top_k=first_k, filters=filters))
+        vdb_hits = merge_hits(vdb_hits, top_k=first_k)
+        if self.reranker and self.reranker.enabled:
+            vdb_hits = await self.reranker.arerank(search_q, vdb_hits, top_k=8)
         vdb_evs = self.assembler.from_vdb(vdb_hits)
         kg_evs = self.assembler.from_kg(kg_triples)
         combined = self.assembler.dedupe_and_rank(vdb_evs + kg_evs)
@@ -61,6 +70,7 @@ class DoctorAgent(BaseAgent):
         # Ask research for evidence notes via A2A if configured
         research_notes = []
         if self.a2a:
-            r = self.a2a.send("doctor","research","evidence_hints", state.get("thread_id",""), {"query":search_q})
+            from services.aio import run_blocking
+            r = await run_blocking(self.a2a.send, "doctor","research","evidence_hints", state.get("thread_id",""), {"query":search_q, "filters": filters})
             research_notes = r.get("notes", [])
         return {"type":"answer","mcp":mcp,"answer":answer,"differential": differential,"research_notes":research_notes,"kg_triples": kg_triples, "messages": [msg]}
\ No newline at end of file
@@ -3,7 +3,7 @@
 from typing import List, Dict, Any
 from services.llm_adapter import LLMAdapter
 from services.slot_extractor import REQUIRED_SLOTS
-from services.kg_service import KGService
+from services.container import get_container
 import json
 
 class ReasonerAgent:
@@ -11,8 +11,9 @@ class ReasonerAgent:
     Fuses multi-agent outputs (Doctor, Research, Nurse).
     Performs reasoning, resolves conflicts, before ComplianceAgent sees them.
     """
-    def __init__(self, llm: LLMAdapter):
+    def __init__(self, llm: LLMAdapter, kg_service=None):
         self.llm = llm
+        self.kg = kg_service
 
     async def reason(self, messages: List, slots: Dict[str, Any]):
         """
@@ -47,11 +48,8 @@ class ReasonerAgent:
                         for item in triples:
                             if isinstance(item, (list, tuple)) and len(item) == 3:
                                 all_triples.append((str(item[0]), str(item[1]), str(item[2])))
-                kg = KGService()
-                try:
-                    disease_to_symptoms = kg.get_all_symptoms_for_diseases_from_triples(all_triples)
-                finally:
-                    kg.close()
+                kg = self.kg or get_container().kg
+                disease_to_symptoms = await kg.aget_all_symptoms_for_diseases_from_triples(all_triples)
 
             # 1) If all required slots are filled, produce probable diseases with symptoms
             all_filled = all(bool(slots.get(k)) for k in REQUIRED_SLOTS)
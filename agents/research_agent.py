@@ -1,11 +1,14 @@
 # agents/research_agent.py
 from typing import Dict, Any
 from agents.base_agent import BaseAgent
+from services.config import load_config
+from services.vdb_service import merge_hits
 
 class ResearchAgent(BaseAgent):
     def __init__(self, vdb_service):
         super().__init__("research")
         self.vdb = vdb_service
+        self.vdb_filters = (load_config()["faiss"].get("agent_filters") or {}).get("research") or None
 
     def handle_a2a(self, envelope: Dict[str,Any]) -> Dict[str,Any]:
         # envelope.payload may contain 'slots' or 'query'
@@ -14,8 +17,9 @@ class ResearchAgent(BaseAgent):
         notes = []
         if not q:
             return {"status":"ok","notes":[]}
-        # quick evidence from VDB using query text
-        hits = self.vdb.query(q, top_k=3)
+        # quick evidence from VDB: one batched search per comma-separated term
+        terms = [t.strip() for t in str(q).split(",") if t.strip()] or [q]
+        hits = merge_hits(self.vdb.query_batch(terms, top_k=3, filters=p.get("filters") or self.vdb_filters), top_k=3)
         for t,s in hits:
             notes.append(t)
         return {"status":"ok","notes": notes}
@@ -23,6 +27,6 @@ class ResearchAgent(BaseAgent):
     async def handle(self, state: Dict[str,Any]) -> str:
         # return research notes if invoked directly
         q = state.get("query","")
-        hits = self.vdb.query(q, top_k=3)
+        hits = await self.vdb.aquery(q, top_k=3, filters=state.get("vdb_filters") or self.vdb_filters)
         notes = [t for t,s in hits]
         return "\n".join(notes) if notes else "No research notes found."
@@ -5,9 +5,9 @@ import os
 sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
 
 # frontend/app.py
-import streamlit as st, yaml, asyncio, uuid
-from services.vdb_service import VDBService
-from services.kg_service import KGService
+import streamlit as st, asyncio, uuid
+from services.config import load_config
+from services.container import get_container
 from orchestrator.orchestrator import Orchestrator
 from services.a2a import A2AClient
 from services.slot_extractor import SlotExtractor
@@ -17,9 +17,7 @@ from langchain_core.messages import HumanMessage, AIMessage  # ✅ import
 import nest_asyncio
 nest_asyncio.apply()
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_dir, "..", "config", "config.yaml")
-CFG = yaml.safe_load(open(config_path, "r", encoding="utf-8"))
+CFG = load_config()
 
 st.set_page_config(page_title=CFG["app"]["ui_title"], layout="centered")
 st.title(CFG["app"]["ui_title"])
@@ -29,10 +27,9 @@ st.markdown(
 
 @st.cache_resource
 def init_system():
-    vdb = VDBService()
-    kg = KGService()
+    # Orchestrator resolves the shared VDB/KG/LLM services from the container
     orch = Orchestrator()
-    return {"kg": kg, "orch": orch}
+    return {"kg": get_container().kg, "orch": orch}
 
 SYS = init_system()
 
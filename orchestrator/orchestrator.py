@@ -28,11 +28,9 @@ from agents.router_agent import RouterAgent
 from agents.reasoner_agent import ReasonerAgent
 
 # Services
-from services.llm_adapter import LLMAdapter
+from services.container import get_container
 from services.mcp import MCPAssembler
 from services.reasoner import MCPReasoner
-from services.vdb_service import VDBService
-from services.kg_service import KGService
 
 
 def normalize_messages(messages) -> List[BaseMessage]:
@@ -80,19 +78,22 @@ class Orchestrator:
     """
 
     def __init__(self):
-        # Init shared services
-        self.llm = LLMAdapter(model_name="gpt-4o")
-        self.kg = KGService()
-        self.vdb = VDBService()
+        # Shared services come from the process-wide container (built once, on first use)
+        services = get_container()
+        self.llm = services.llm
+        self.kg = services.kg
+        # general / nursing / research indexes behind one embedding model; each agent searches its own subset
+        self.vdb = services.vdb
         assembler = MCPAssembler()
         reasoner = MCPReasoner(self.llm)
 
         # Agents
         self.router = RouterAgent(self.llm)
         self.nurse = NurseAgent(SlotExtractor())
-        self.doctor = DoctorAgent(self.kg, self.vdb, assembler=assembler, reasoner=reasoner)
-        self.research = ResearchAgent(self.vdb)
-        self.reasoner = ReasonerAgent(self.llm)
+        self.doctor = DoctorAgent(self.kg, self.vdb.for_agent("doctor"), assembler=assembler, reasoner=reasoner,
+                                  reranker=services.reranker)
+        self.research = ResearchAgent(self.vdb.for_agent("research"))
+        self.reasoner = ReasonerAgent(self.llm, kg_service=self.kg)
         self.compliance = ComplianceAgent()
 
         # Persist triage slots per thread across turns
@@ -140,28 +141,30 @@ class Orchestrator:
                 if len(symptoms) > 1:
                     # Use the new method for multiple symptoms - find diseases with ALL symptoms
                     try:
-                        kg_triples = self.kg.retrieve_diseases_with_all_symptoms(symptoms) or []
+                        kg_triples = await self.kg.aretrieve_diseases_with_all_symptoms(symptoms) or []
                         print(f"[nurse_node] Using multi-symptom search for: {symptoms}")
                     except Exception as e:
                         print(f"[nurse_node] Multi-symptom KG lookup failed: {e}")
-                        # Fallback to individual symptom search
+                    if not kg_triples:
+                        # Fallback to individual symptom search: one batched query for all symptoms
+                        try:
+                            grouped = await self.kg.aretrieve_triples_many(symptoms)
+                        except Exception as e:
+                            print(f"[nurse_node] Per-symptom KG lookup failed: {e}")
+                            grouped = {}
                         aggregated = []
                         seen = set()
                         for s in symptoms:
-                            try:
-                                triples = self.kg.retrieve_triples(s) or []
-                                for tup in triples:
-                                    key = tuple(map(str, tup))
-                                    if key not in seen:
-                                        seen.add(key)
-                                        aggregated.append(tup)
-                            except Exception as e:
-                                print(f"[nurse_node] KG lookup failed for '{s}': {e}")
+                            for tup in grouped.get(s) or []:
+                                key = tuple(map(str, tup))
+                                if key not in seen:
+                                    seen.add(key)
+                                    aggregated.append(tup)
                         kg_triples = aggregated
                 else:
                     # Single symptom - use original method
                     try:
-                        kg_triples = self.kg.retrieve_triples(symptom_query) or []
+                        kg_triples = await self.kg.aretrieve_triples(symptom_query) or []
                         print(f"[nurse_node] Using single-symptom search for: {symptom_query}")
                     except Exception as e:
                         print(f"[nurse_node] Single-symptom KG lookup failed for '{symptom_query}': {e}")
@@ -0,0 +1,15 @@
+# services/aio.py
+import asyncio, functools
+from typing import Any, Callable, TypeVar
+from services.container import get_container
+
+T = TypeVar("T")
+
+async def run_blocking(fn: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """
+    Run a blocking call (transformer forward pass, FAISS search, Neo4j round trip) on the
+    process-wide bounded thread pool and await its result, so the event loop keeps serving
+    other sessions meanwhile. The pool is sized by orchestration.blocking_workers.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_container().executor, functools.partial(fn, *args, **kwargs))
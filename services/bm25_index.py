@@ -0,0 +1,124 @@
+# services/bm25_index.py
+import math, os, re, sqlite3, threading
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+import numpy as np
+
+TOKEN_RE = re.compile(r"[a-z0-9]+(?:[-'][a-z0-9]+)*")
+
+def tokenize(text: str) -> List[str]:
+    return TOKEN_RE.findall(str(text).lower())
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the same chunk ids as the FAISS index.
+
+    Postings live in `<prefix>.bm25.sqlite` (term -> doc, tf), document frequencies in a
+    terms table, so appends are incremental like the vector segments and a query only
+    reads the posting lists of its own terms.
+    """
+    def __init__(self, prefix: str, k1: float = 1.2, b: float = 0.75):
+        self.path = prefix + ".bm25.sqlite"
+        self.k1 = k1
+        self.b = b
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (doc INTEGER PRIMARY KEY, len INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS terms (term TEXT PRIMARY KEY, df INTEGER NOT NULL);
+            CREATE TABLE IF NOT EXISTS postings (term TEXT NOT NULL, doc INTEGER NOT NULL, tf INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS postings_term ON postings(term);
+        """)
+        self.db.commit()
+        self._load_stats()
+
+    def _load_stats(self):
+        n, total = self.db.execute("SELECT COUNT(*), COALESCE(SUM(len), 0) FROM docs").fetchone()
+        self.n_docs, self.total_len = int(n), int(total)
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def add(self, start_id: int, texts: Sequence[str], commit: bool = True):
+        """Index texts as docs start_id, start_id + 1, ..."""
+        docs, postings, df = [], [], Counter()
+        for offset, text in enumerate(texts):
+            tf = Counter(tokenize(text))
+            doc = start_id + offset
+            docs.append((doc, sum(tf.values())))
+            postings.extend((t, doc, c) for t, c in tf.items())
+            df.update(tf.keys())
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO docs (doc, len) VALUES (?, ?)", docs)
+            self.db.executemany("INSERT INTO postings (term, doc, tf) VALUES (?, ?, ?)", postings)
+            self.db.executemany("INSERT INTO terms (term, df) VALUES (?, ?) ON CONFLICT(term) DO UPDATE SET df = df + excluded.df",
+                                list(df.items()))
+            if commit:
+                self.db.commit()
+            self.n_docs += len(docs)
+            self.total_len += sum(l for _, l in docs)
+
+    def truncate(self, n: int):
+        """Drop docs with id >= n (left behind by a write that never reached the chunk store)."""
+        with self.lock:
+            rows = self.db.execute("SELECT term, COUNT(*) FROM postings WHERE doc >= ? GROUP BY term", (n,)).fetchall()
+            self.db.executemany("UPDATE terms SET df = df - ? WHERE term = ?", [(c, t) for t, c in rows])
+            self.db.execute("DELETE FROM postings WHERE doc >= ?", (n,))
+            self.db.execute("DELETE FROM docs WHERE doc >= ?", (n,))
+            self.db.commit()
+            self._load_stats()
+
+    def sync(self, texts) -> int:
+        """Bring the index in line with a ChunkStore-like sequence; returns docs (re)indexed."""
+        n = len(texts)
+        if self.n_docs > n:
+            self.truncate(n)
+        added = 0
+        for start in range(self.n_docs, n, 5000):
+            batch = [texts[i] for i in range(start, min(start + 5000, n))]
+            self.add(start, batch)
+            added += len(batch)
+        return added
+
+    def doc_freqs(self, terms: Iterable[str]) -> Dict[str, int]:
+        terms = list(dict.fromkeys(terms))
+        if not terms:
+            return {}
+        with self.lock:
+            rows = self.db.execute(f"SELECT term, df FROM terms WHERE term IN ({','.join('?' * len(terms))})", terms).fetchall()
+        return {t: int(df) for t, df in rows if df > 0}
+
+    def search(self, query: str, k: int, ids: Optional[np.ndarray] = None) -> List[Tuple[int, float]]:
+        """Top-k (doc id, BM25 score), best first; `ids` (sorted) restricts scoring to those docs."""
+        terms = tokenize(query)
+        if not terms or not self.n_docs:
+            return []
+        dfs = self.doc_freqs(terms)
+        if not dfs:
+            return []
+        avgdl = self.total_len / float(self.n_docs) or 1.0
+        scores: Dict[int, float] = {}
+        with self.lock:
+            for term, qtf in Counter(t for t in terms if t in dfs).items():
+                idf = math.log(1.0 + (self.n_docs - dfs[term] + 0.5) / (dfs[term] + 0.5))
+                rows = self.db.execute(
+                    "SELECT p.doc, p.tf, d.len FROM postings p JOIN docs d ON d.doc = p.doc WHERE p.term = ?", (term,)).fetchall()
+                if ids is not None:
+                    docs = np.fromiter((d for d, _, _ in rows), dtype="int64", count=len(rows))
+                    keep = np.isin(docs, ids, assume_unique=True)
+                    rows = [r for r, k in zip(rows, keep) if k]
+                for doc, tf, dl in rows:
+                    denom = tf + self.k1 * (1.0 - self.b + self.b * dl / avgdl)
+                    scores[doc] = scores.get(doc, 0.0) + qtf * idf * tf * (self.k1 + 1.0) / denom
+        return sorted(scores.items(), key=lambda x: -x[1])[:k]
+
+    def close(self):
+        self.db.close()
+
+def rrf_fuse(rankings: List[List[int]], k: int, rrf_k: int = 60) -> List[Tuple[int, float]]:
+    """Reciprocal rank fusion of several ranked id lists; returns (id, fused score), best first."""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking):
+            scores[doc] = scores.get(doc, 0.0) + 1.0 / (rrf_k + rank + 1)
+    return sorted(scores.items(), key=lambda x: -x[1])[:k]
@@ -0,0 +1,157 @@
+# services/build_index.py
+"""
+Offline FAISS index builder.
+
+Trains (IVF) and fills an index of the configured faiss.index_type from a corpus
+file, then writes it with its chunk store (`.offsets`/`.blob`), metadata (`.chunkmeta.sqlite`),
+BM25 (`.bm25.sqlite`) and near-duplicate (`.dedup.sqlite`) sidecars into a new version
+directory of `<index_file>` (see services/index_versions.py) and makes that version live.
+
+    python -m services.build_index --input corpus.jsonl --index-type ivf_pq
+"""
+import argparse, glob, json, os, random, time
+from typing import Callable, Dict, List, Optional, Tuple
+import faiss
+import numpy as np
+from services import index_versions
+from services.chunk_store import ChunkStore
+from services.faiss_index import INDEX_TYPES, make_index, set_search_params, train_index
+from services.vdb_service import CFG, embed
+
+def read_corpus(path: str) -> Tuple[List[str], List[Dict]]:
+    """Load chunk texts and metadata: JSONL rows with a 'text' field (+ metadata fields), or one chunk per line."""
+    from services.ingest import row_metadata
+    texts, metas = [], []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                row = json.loads(line)
+                line = str(row.get("text") or "").strip()
+                if not line:
+                    continue
+                metas.append(row_metadata(row))
+            else:
+                metas.append({})
+            texts.append(line)
+    return texts, metas
+
+def build(texts: List[str], index_file: str, index_type: str, model_name: str, batch_size: int = 256, train_size: int = None,
+          metadata: Optional[List[Dict]] = None, model=None, encode: Optional[Callable[[List[str]], np.ndarray]] = None):
+    """
+    Build `index_file` and its sidecars from texts. `model` reuses an already loaded
+    SentenceTransformer and `encode` (e.g. VDBService.embed_documents) replaces the default
+    embedding call.
+    """
+    fcfg = dict(CFG["faiss"])
+    train_size = train_size or int(fcfg.get("train_size", 100000))
+    if model is None:
+        from sentence_transformers import SentenceTransformer
+        model = SentenceTransformer(model_name)
+    encode = encode or (lambda batch: embed(model, batch, batch_size))
+    dim = model.get_sentence_embedding_dimension()
+    index = make_index(dim, index_type, fcfg)
+    t0 = time.time()
+    if not index.is_trained:
+        sample = random.Random(0).sample(texts, min(train_size, len(texts)))
+        print(f"[build_index] training {index_type} on {len(sample)} vectors")
+        train_index(index, encode(sample))
+    os.makedirs(os.path.dirname(index_file) or ".", exist_ok=True)
+    store_vectors = bool(fcfg.get("rerank", False))
+    vec_file = open(index_file + ".tmp.vectors", "wb") if store_vectors else None
+    for start in range(0, len(texts), batch_size):
+        embs = encode(texts[start:start + batch_size])
+        index.add(embs)
+        if vec_file:
+            vec_file.write(embs.tobytes())
+        if (start // batch_size) % 50 == 0:
+            print(f"[build_index] added {index.ntotal}/{len(texts)}")
+    if vec_file:
+        vec_file.close()
+    set_search_params(index, fcfg)
+    # write next to the target and rename so a running service never sees a half-written file
+    faiss.write_index(index, index_file + ".tmp")
+    # a fresh build supersedes any append-only segments of the previous index
+    if os.path.exists(index_file + ".segments"):
+        os.remove(index_file + ".segments")
+    for path in glob.glob(glob.escape(index_file) + ".seg.*"):
+        os.remove(path)
+    if not store_vectors and os.path.exists(index_file + ".vectors"):
+        os.remove(index_file + ".vectors")
+    for ext in (".offsets", ".blob"):
+        if os.path.exists(index_file + ".tmp" + ext):
+            os.remove(index_file + ".tmp" + ext)
+    ChunkStore(index_file + ".tmp").append(texts)
+    from services.chunk_meta import ChunkMeta
+    if os.path.exists(index_file + ".tmp.chunkmeta.sqlite"):
+        os.remove(index_file + ".tmp.chunkmeta.sqlite")
+    meta = ChunkMeta(index_file + ".tmp")
+    meta.add(0, metadata or []); meta.close()
+    bcfg = CFG.get("bm25") or {}
+    if os.path.exists(index_file + ".tmp.bm25.sqlite"):
+        os.remove(index_file + ".tmp.bm25.sqlite")
+    if bcfg.get("enabled", False):
+        from services.bm25_index import BM25Index
+        bm25 = BM25Index(index_file + ".tmp", float(bcfg.get("k1", 1.2)), float(bcfg.get("b", 0.75)))
+        for start in range(0, len(texts), 5000):
+            bm25.add(start, texts[start:start + 5000], commit=False)
+        bm25.db.commit(); bm25.close()
+    if not bcfg.get("enabled", False) and os.path.exists(index_file + ".bm25.sqlite"):
+        os.remove(index_file + ".bm25.sqlite")
+    # near-duplicate signatures ship with the build, so loading (or hot-swapping to) it does not recompute them
+    dcfg = CFG.get("dedup") or {}
+    if os.path.exists(index_file + ".tmp.dedup.sqlite"):
+        os.remove(index_file + ".tmp.dedup.sqlite")
+    if dcfg.get("enabled", True):
+        from services.dedup import NearDupIndex
+        dedup = NearDupIndex(index_file + ".tmp", float(dcfg.get("threshold", 0.85)), int(dcfg.get("num_perm", 64)),
+                             int(dcfg.get("bands", 16)), int(dcfg.get("shingle", 5)))
+        dedup.sync(texts); dedup.close()
+    elif os.path.exists(index_file + ".dedup.sqlite"):
+        os.remove(index_file + ".dedup.sqlite")
+    sidecars = (".offsets", ".blob", ".chunkmeta.sqlite") + ((".vectors",) if store_vectors else ()) \
+        + ((".bm25.sqlite",) if bcfg.get("enabled", False) else ()) + ((".dedup.sqlite",) if dcfg.get("enabled", True) else ())
+    for ext in sidecars:
+        os.replace(index_file + ".tmp" + ext, index_file + ext)
+    os.replace(index_file + ".tmp", index_file)
+    print(f"[build_index] wrote {index.ntotal} vectors (dim={dim}, type={index_type}) to {index_file} in {time.time() - t0:.1f}s")
+    return index
+
+def build_version(texts: List[str], index_file: str, index_type: str, model_name: str, batch_size: int = 256,
+                  train_size: int = None, metadata: Optional[List[Dict]] = None, model=None,
+                  encode: Optional[Callable[[List[str]], np.ndarray]] = None, activate: bool = True) -> Tuple[str, str]:
+    """
+    Build into a new version directory of `index_file`, record its manifest and (unless
+    activate=False) publish it as the live version. Returns (version, prefix).
+    """
+    version, prefix = index_versions.new_version(index_file)
+    index = build(texts, prefix, index_type, model_name, batch_size, train_size, metadata, model, encode)
+    index_versions.write_manifest(prefix, version=version, model=model_name, dim=index.d, count=index.ntotal,
+                                  index_type=index_type)
+    if activate:
+        index_versions.activate(index_file, version)
+        index_versions.prune(index_file, int(CFG["faiss"].get("keep_versions", 2)))
+        print(f"[build_index] {index_file} now serves {version}")
+    return version, prefix
+
+def main():
+    ap = argparse.ArgumentParser(description="Build a FAISS index for VDBService")
+    ap.add_argument("--input", required=True, help="corpus file (.jsonl with 'text', or plain text one chunk per line)")
+    ap.add_argument("--index-file", default=CFG["faiss"]["general_index"])
+    ap.add_argument("--index-type", default=CFG["faiss"].get("index_type", "flat"), choices=INDEX_TYPES)
+    ap.add_argument("--model", default=CFG["faiss"]["embedding_model"])
+    ap.add_argument("--batch-size", type=int, default=256)
+    ap.add_argument("--train-size", type=int, default=None)
+    ap.add_argument("--no-activate", action="store_true", help="build the new version without making it live")
+    args = ap.parse_args()
+    texts, metas = read_corpus(args.input)
+    if not texts:
+        raise SystemExit(f"[build_index] no texts found in {args.input}")
+    # running services pick the new version up within faiss.reload_check_seconds
+    build_version(texts, args.index_file, args.index_type, args.model, args.batch_size, args.train_size, metas,
+                  activate=not args.no_activate)
+
+if __name__ == "__main__":
+    main()
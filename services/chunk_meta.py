@@ -0,0 +1,91 @@
+# services/chunk_meta.py
+import json, sqlite3, threading
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+META_FIELDS = ("source", "specialty", "language", "year")
+OPS = {"=": "=", "==": "=", "!=": "!=", ">": ">", ">=": ">=", "<": "<", "<=": "<="}
+
+class ChunkMeta:
+    """
+    Structured metadata per chunk id (source, specialty, language, year + free-form extras),
+    stored in `<prefix>.chunkmeta.sqlite` with an index per field, so a filter resolves to
+    the matching chunk ids in one query and can be handed to FAISS as an id selector.
+    """
+    def __init__(self, prefix: str):
+        self.path = prefix + ".chunkmeta.sqlite"
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS meta (doc INTEGER PRIMARY KEY, source TEXT, specialty TEXT,
+                                             language TEXT, year INTEGER, extra TEXT);
+            CREATE INDEX IF NOT EXISTS meta_source ON meta(source);
+            CREATE INDEX IF NOT EXISTS meta_specialty ON meta(specialty);
+            CREATE INDEX IF NOT EXISTS meta_language ON meta(language);
+            CREATE INDEX IF NOT EXISTS meta_year ON meta(year);
+        """)
+        self.db.commit()
+
+    def add(self, start_id: int, metas: Sequence[Optional[Dict[str, Any]]], commit: bool = True):
+        """Store metadata for chunks start_id, start_id + 1, ...; None / {} entries are skipped."""
+        rows = []
+        for offset, m in enumerate(metas):
+            if not m:
+                continue
+            extra = {k: v for k, v in m.items() if k not in META_FIELDS}
+            year = m.get("year")
+            rows.append((start_id + offset, m.get("source"), m.get("specialty"), m.get("language"),
+                         int(year) if year not in (None, "") else None, json.dumps(extra) if extra else None))
+        with self.lock:
+            if rows:
+                self.db.executemany("INSERT OR REPLACE INTO meta VALUES (?, ?, ?, ?, ?, ?)", rows)
+            if commit:
+                self.db.commit()
+
+    def get(self, doc: int) -> Dict[str, Any]:
+        with self.lock:
+            row = self.db.execute("SELECT source, specialty, language, year, extra FROM meta WHERE doc = ?", (int(doc),)).fetchone()
+        if row is None:
+            return {}
+        out = {k: v for k, v in zip(META_FIELDS, row[:4]) if v is not None}
+        if row[4]:
+            out.update(json.loads(row[4]))
+        return out
+
+    def truncate(self, n: int):
+        """Drop metadata for ids >= n (left behind by a write that never reached the chunk store)."""
+        with self.lock:
+            self.db.execute("DELETE FROM meta WHERE doc >= ?", (n,))
+            self.db.commit()
+
+    def select(self, filters: Dict[str, Any]) -> np.ndarray:
+        """
+        Chunk ids matching every predicate, ascending. A predicate is a value (equality),
+        a list (any of) or {op: value} with op in =, !=, >, >=, <, <=; e.g.
+        {"source": "pubmed", "specialty": ["cardiology", "nursing"], "year": {">=": 2018}}.
+        Keys other than the indexed fields match the JSON extras.
+        """
+        where, args = [], []
+        for key, cond in filters.items():
+            if not key.replace("_", "").isalnum():
+                raise ValueError(f"Invalid metadata filter key '{key}'")
+            col = key if key in META_FIELDS else f"json_extract(extra, '$.{key}')"
+            if isinstance(cond, dict):
+                for op, val in cond.items():
+                    if op not in OPS:
+                        raise ValueError(f"Unsupported filter operator '{op}' for '{key}', expected one of {sorted(OPS)}")
+                    where.append(f"{col} {OPS[op]} ?"); args.append(val)
+            elif isinstance(cond, (list, tuple, set)):
+                cond = list(cond)
+                if not cond:
+                    return np.empty(0, dtype="int64")
+                where.append(f"{col} IN ({','.join('?' * len(cond))})"); args.extend(cond)
+            else:
+                where.append(f"{col} = ?"); args.append(cond)
+        sql = "SELECT doc FROM meta" + (" WHERE " + " AND ".join(where) if where else "") + " ORDER BY doc"
+        with self.lock:
+            rows = self.db.execute(sql, args).fetchall()
+        return np.fromiter((r[0] for r in rows), dtype="int64", count=len(rows))
+
+    def close(self):
+        self.db.close()
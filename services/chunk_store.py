@@ -0,0 +1,105 @@
+# services/chunk_store.py
+import os, mmap, pickle
+from typing import List, Iterable, Iterator
+import numpy as np
+
+class ChunkStore:
+    """
+    Append-only on-disk store for chunk texts.
+
+    `<prefix>.offsets` holds little-endian int64 byte offsets (n+1 entries, starting at 0)
+    and `<prefix>.blob` the concatenated UTF-8 texts. Both are opened read-only with mmap,
+    so lookups only touch the pages of the requested chunks and several worker processes
+    share one copy through the OS page cache.
+    """
+    def __init__(self, prefix: str):
+        self.prefix = prefix
+        self.offsets_path = prefix + ".offsets"
+        self.blob_path = prefix + ".blob"
+        self._tail: List[str] = []   # appended with persist=False, not yet on disk
+        self._blob = None
+        self._offsets = np.zeros(1, dtype="<i8")
+        self._open()
+
+    @classmethod
+    def exists(cls, prefix: str) -> bool:
+        return os.path.exists(prefix + ".offsets") and os.path.exists(prefix + ".blob")
+
+    @classmethod
+    def from_pickle(cls, prefix: str, meta_path: str) -> "ChunkStore":
+        """One-off migration from the legacy pickled `<index>.meta` text list."""
+        with open(meta_path, "rb") as f:
+            texts = pickle.load(f)
+        store = cls(prefix)
+        store.append(texts)
+        return store
+
+    def _open(self):
+        self.close()
+        if not self.exists(self.prefix):
+            self._offsets = np.zeros(1, dtype="<i8")
+            return
+        blob_size = os.path.getsize(self.blob_path)
+        offsets = np.fromfile(self.offsets_path, dtype="<i8") if os.path.getsize(self.offsets_path) >= 8 else np.zeros(1, dtype="<i8")
+        # a crash between the blob and offsets writes leaves trailing bytes in the blob; ignore them
+        valid = int(np.searchsorted(offsets, blob_size, side="right"))
+        self._offsets = offsets[:max(1, valid)]
+        if blob_size:
+            with open(self.blob_path, "rb") as f:
+                self._blob = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def close(self):
+        if self._blob is not None:
+            self._blob.close()
+            self._blob = None
+
+    def __len__(self) -> int:
+        return len(self._offsets) - 1 + len(self._tail)
+
+    def __getitem__(self, i: int) -> str:
+        n_disk = len(self._offsets) - 1
+        if i < 0:
+            i += len(self)
+        if i < 0 or i >= len(self):
+            raise IndexError(i)
+        if i >= n_disk:
+            return self._tail[i - n_disk]
+        start, end = int(self._offsets[i]), int(self._offsets[i + 1])
+        return self._blob[start:end].decode("utf-8") if end > start else ""
+
+    def __iter__(self) -> Iterator[str]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def get_many(self, ids: Iterable[int]) -> List[str]:
+        return [self[int(i)] for i in ids]
+
+    def append(self, texts: List[str], persist: bool = True):
+        self._tail.extend(texts)
+        if persist:
+            self.flush()
+
+    def flush(self):
+        """Write buffered texts: blob first, then offsets, so readers never see a dangling offset."""
+        if not self._tail:
+            return
+        encoded = [t.encode("utf-8") for t in self._tail]
+        base = int(self._offsets[-1])
+        ends = base + np.cumsum([len(b) for b in encoded], dtype="<i8")
+        self.close()
+        if self.exists(self.prefix):
+            # drop leftovers of an interrupted flush before appending
+            if os.path.getsize(self.blob_path) != base:
+                os.truncate(self.blob_path, base)
+            if os.path.getsize(self.offsets_path) != 8 * len(self._offsets):
+                os.truncate(self.offsets_path, 8 * len(self._offsets))
+        with open(self.blob_path, "ab") as f:
+            f.write(b"".join(encoded))
+            f.flush(); os.fsync(f.fileno())
+        with open(self.offsets_path, "ab") as f:
+            if f.tell() == 0:
+                np.zeros(1, dtype="<i8").tofile(f)
+            ends.astype("<i8").tofile(f)
+            f.flush(); os.fsync(f.fileno())
+        self._tail = []
+        self._open()
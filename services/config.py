@@ -0,0 +1,16 @@
+# services/config.py
+import os
+from functools import lru_cache
+from typing import Any, Dict
+import yaml
+from services.startup import timed
+
+base_dir = os.path.dirname(os.path.abspath(__file__))
+CONFIG_PATH = os.path.normpath(os.path.join(base_dir, "..", "config", "config.yaml"))
+
+@lru_cache(maxsize=None)
+def load_config(path: str = CONFIG_PATH) -> Dict[str, Any]:
+    """Parse config.yaml once per process; every module shares the same dict."""
+    with timed("config"):
+        with open(path, "r", encoding="utf-8") as f:
+            return yaml.safe_load(f)
@@ -0,0 +1,130 @@
+# services/container.py
+import atexit, threading
+from services.startup import timed
+from typing import Any, Callable, Dict, List, Optional
+
+class ServiceContainer:
+    """
+    Process-wide registry of shared services.
+
+    Each service is built by its factory on first access and reused afterwards, so a
+    process holds one embedding model and one pooled Neo4j driver no matter how many
+    agents, orchestrators or UI reruns ask for them. close() tears them down in reverse
+    creation order and runs automatically at interpreter exit.
+    """
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._closers: Dict[str, Optional[Callable[[Any], None]]] = {}
+        self._instances: Dict[str, Any] = {}
+        self._order: List[str] = []
+        self._lock = threading.RLock()
+
+    def register(self, name: str, factory: Callable[[], Any], closer: Optional[Callable[[Any], None]] = None):
+        with self._lock:
+            self._factories[name] = factory
+            self._closers[name] = closer
+
+    def get(self, name: str) -> Any:
+        inst = self._instances.get(name)
+        if inst is not None:
+            return inst
+        with self._lock:
+            if name not in self._instances:
+                if name not in self._factories:
+                    raise KeyError(f"service '{name}' is not registered")
+                with timed(f"service {name}"):
+                    self._instances[name] = self._factories[name]()
+                self._order.append(name)
+            return self._instances[name]
+
+    def set(self, name: str, instance: Any):
+        """Install a ready-made instance (e.g. a test double) under name."""
+        with self._lock:
+            if name not in self._instances:
+                self._order.append(name)
+            self._instances[name] = instance
+
+    def is_loaded(self, name: str) -> bool:
+        return name in self._instances
+
+    def close(self):
+        with self._lock:
+            for name in reversed(self._order):
+                inst = self._instances.pop(name, None)
+                closer = self._closers.get(name)
+                if inst is None or closer is None:
+                    continue
+                try:
+                    closer(inst)
+                except Exception as e:
+                    print(f"[container] error closing {name}: {e}")
+            self._order = []
+
+    @property
+    def vdb(self):
+        return self.get("vdb")
+
+    @property
+    def kg(self):
+        return self.get("kg")
+
+    @property
+    def llm(self):
+        return self.get("llm")
+
+    @property
+    def reranker(self):
+        return self.get("reranker")
+
+    @property
+    def executor(self):
+        return self.get("executor")
+
+def _make_vdb():
+    from services.vdb_federated import FederatedVDB
+    return FederatedVDB()
+
+def _make_kg():
+    from services.config import load_config
+    cfg = load_config()
+    if (cfg.get("neo4j") or {}).get("async_driver", True):
+        from services.kg_async import AsyncKGService
+        kg = AsyncKGService()
+    else:
+        from services.kg_service import KGService
+        kg = KGService()
+    if (cfg.get("kg_snapshot") or {}).get("enabled", False):
+        from services.kg_snapshot import SnapshotKG
+        kg = SnapshotKG(kg)
+    if (cfg.get("kg_cache") or {}).get("enabled", True):
+        from services.kg_cache import CachedKG
+        kg = CachedKG(kg)
+    return kg
+
+def _make_reranker():
+    from services.reranker import Reranker
+    reranker = Reranker()
+    if reranker.enabled:
+        reranker.warm()     # load the cross-encoder here rather than inside the first query's budget
+    return reranker
+
+def _make_executor():
+    from concurrent.futures import ThreadPoolExecutor
+    from services.config import load_config
+    workers = int((load_config().get("orchestration") or {}).get("blocking_workers", 8))
+    return ThreadPoolExecutor(max_workers=workers, thread_name_prefix="blocking")
+
+def _make_llm():
+    from services.llm_adapter import LLMAdapter
+    return LLMAdapter(model_name="gpt-4o")
+
+_container = ServiceContainer()
+_container.register("vdb", _make_vdb, lambda v: v.close())
+_container.register("kg", _make_kg, lambda k: k.close())
+_container.register("llm", _make_llm)
+_container.register("reranker", _make_reranker)
+_container.register("executor", _make_executor, lambda ex: ex.shutdown(wait=False, cancel_futures=True))
+atexit.register(_container.close)
+
+def get_container() -> ServiceContainer:
+    return _container
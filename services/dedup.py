@@ -0,0 +1,140 @@
+# services/dedup.py
+import hashlib, re, sqlite3, threading
+from typing import Dict, List, Optional, Sequence, Tuple
+import numpy as np
+
+_PRIME = (1 << 61) - 1
+WORD_RE = re.compile(r"\w+")
+
+def shingles(text: str, size: int) -> List[str]:
+    """Word n-grams of a lowercased text; texts shorter than `size` words are one shingle."""
+    words = WORD_RE.findall(str(text).lower())
+    if len(words) <= size:
+        return [" ".join(words)]
+    return [" ".join(words[i:i + size]) for i in range(len(words) - size + 1)]
+
+class NearDupIndex:
+    """
+    MinHash LSH over word shingles of every indexed chunk, stored next to the FAISS index
+    in `<prefix>.dedup.sqlite`.
+
+    Each chunk gets `num_perm` MinHash values split into `bands`; chunks that share any band
+    bucket are candidates, and a candidate whose estimated Jaccard similarity reaches
+    `threshold` makes the new chunk a near-duplicate.
+    """
+    def __init__(self, prefix: str, threshold: float = 0.85, num_perm: int = 64, bands: int = 16, shingle: int = 5):
+        if num_perm % bands:
+            raise ValueError(f"dedup.num_perm ({num_perm}) must be a multiple of dedup.bands ({bands})")
+        self.path = prefix + ".dedup.sqlite"
+        self.threshold = threshold
+        self.num_perm = num_perm
+        self.bands = bands
+        self.rows = num_perm // bands
+        self.shingle = shingle
+        # fixed seed: signatures must stay comparable across processes and restarts
+        rng = np.random.RandomState(1)
+        self.a = rng.randint(1, 1 << 31, num_perm).astype("uint64")
+        self.b = rng.randint(0, 1 << 31, num_perm).astype("uint64")
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS sigs (doc INTEGER PRIMARY KEY, sig BLOB NOT NULL);
+            CREATE TABLE IF NOT EXISTS bands (key INTEGER NOT NULL, doc INTEGER NOT NULL);
+            CREATE INDEX IF NOT EXISTS bands_key ON bands(key);
+        """)
+        self.db.commit()
+        self.n_docs = int(self.db.execute("SELECT COUNT(*) FROM sigs").fetchone()[0])
+
+    def __len__(self) -> int:
+        return self.n_docs
+
+    def signature(self, text: str) -> np.ndarray:
+        h = np.fromiter((int.from_bytes(hashlib.blake2b(s.encode("utf-8"), digest_size=4).digest(), "little")
+                         for s in shingles(text, self.shingle)), dtype="uint64")
+        return ((self.a[:, None] * h[None, :] + self.b[:, None]) % _PRIME).min(axis=1)
+
+    def band_keys(self, sig: np.ndarray) -> List[int]:
+        return [int.from_bytes(hashlib.blake2b(bytes([band]) + sig[band * self.rows:(band + 1) * self.rows].tobytes(),
+                                               digest_size=8).digest(), "little", signed=True)
+                for band in range(self.bands)]
+
+    def _similar(self, sig: np.ndarray, other: np.ndarray) -> bool:
+        return float(np.mean(sig == other)) >= self.threshold
+
+    def remember(self, pending: Dict[int, List[np.ndarray]], sigs: Sequence[np.ndarray]):
+        """Add signatures to a band key -> signatures map of accepted but not yet indexed texts."""
+        for sig in sigs:
+            for k in self.band_keys(sig):
+                pending.setdefault(k, []).append(sig)
+
+    def filter(self, texts: Sequence[str], pending: Optional[Dict[int, List[np.ndarray]]] = None
+               ) -> Tuple[List[bool], List[np.ndarray]]:
+        """
+        Mark which texts to keep: False for near-duplicates of an indexed chunk or of an
+        earlier text in the same batch. Returns (keep mask, signatures of all texts).
+        `pending` (see remember()) carries texts accepted by earlier calls that are not
+        indexed yet; kept texts are added to it.
+        """
+        sigs = [self.signature(t) for t in texts]
+        keys = [self.band_keys(s) for s in sigs]
+        indexed: Dict[int, List[int]] = {}
+        wanted = list({k for ks in keys for k in ks})
+        with self.lock:
+            for i in range(0, len(wanted), 500):
+                part = wanted[i:i + 500]
+                for key, doc in self.db.execute(
+                        f"SELECT key, doc FROM bands WHERE key IN ({','.join('?' * len(part))})", part):
+                    indexed.setdefault(key, []).append(doc)
+            cand_docs = list({d for ks in keys for k in ks for d in indexed.get(k, ())})
+            stored: Dict[int, np.ndarray] = {}
+            for i in range(0, len(cand_docs), 500):
+                part = cand_docs[i:i + 500]
+                for doc, blob in self.db.execute(
+                        f"SELECT doc, sig FROM sigs WHERE doc IN ({','.join('?' * len(part))})", part):
+                    stored[doc] = np.frombuffer(blob, dtype="uint64")
+        keep: List[bool] = []
+        batch: Dict[int, List[np.ndarray]] = pending if pending is not None else {}
+        for sig, ks in zip(sigs, keys):
+            cands = {d for k in ks for d in indexed.get(k, ())}
+            dup = any(self._similar(sig, stored[d]) for d in cands if d in stored)
+            if not dup:
+                dup = any(self._similar(sig, other) for k in ks for other in batch.get(k, ()))
+            keep.append(not dup)
+            if not dup:
+                for k in ks:
+                    batch.setdefault(k, []).append(sig)
+        return keep, sigs
+
+    def add(self, start_id: int, sigs: Sequence[np.ndarray], commit: bool = True):
+        """Index signatures as docs start_id, start_id + 1, ..."""
+        rows = [(start_id + i, s.astype("uint64").tobytes()) for i, s in enumerate(sigs)]
+        bands = [(k, start_id + i) for i, s in enumerate(sigs) for k in self.band_keys(s)]
+        with self.lock:
+            self.db.executemany("INSERT OR REPLACE INTO sigs (doc, sig) VALUES (?, ?)", rows)
+            self.db.executemany("INSERT INTO bands (key, doc) VALUES (?, ?)", bands)
+            if commit:
+                self.db.commit()
+            self.n_docs += len(rows)
+
+    def truncate(self, n: int):
+        """Drop docs with id >= n (left behind by a write that never reached the chunk store)."""
+        with self.lock:
+            self.db.execute("DELETE FROM sigs WHERE doc >= ?", (n,))
+            self.db.execute("DELETE FROM bands WHERE doc >= ?", (n,))
+            self.db.commit()
+            self.n_docs = int(self.db.execute("SELECT COUNT(*) FROM sigs").fetchone()[0])
+
+    def sync(self, texts) -> int:
+        """Bring the index in line with a ChunkStore-like sequence; returns docs (re)indexed."""
+        n = len(texts)
+        if self.n_docs > n:
+            self.truncate(n)
+        added = 0
+        for start in range(self.n_docs, n, 5000):
+            batch = [texts[i] for i in range(start, min(start + 5000, n))]
+            self.add(start, [self.signature(t) for t in batch])
+            added += len(batch)
+        return added
+
+    def close(self):
+        self.db.close()
@@ -0,0 +1,101 @@
+# services/embed_batcher.py
+import queue, threading, time
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Tuple
+import numpy as np
+
+class EmbeddingBatcher:
+    """
+    Dynamic micro-batching of embedding requests from concurrent sessions.
+
+    encode() queues the caller's texts and blocks on a future. A single worker thread
+    takes the oldest request plus everything already queued behind it (up to `max_batch`
+    texts), waits for more until `max_wait_ms` has passed since that oldest request
+    arrived, then runs one forward pass for the whole batch and resolves every caller.
+    Under load the queue fills while a batch is computing and the next batch drains it
+    whole, even though its oldest request is already past its deadline; when idle a lone
+    query waits at most max_wait_ms. Requests of max_batch texts or more skip the queue.
+    """
+    def __init__(self, compute: Callable[[List[str]], np.ndarray], max_batch: int = 32, max_wait_ms: float = 5.0):
+        self.compute = compute
+        self.max_batch = max(1, max_batch)
+        self.max_wait = max(0.0, max_wait_ms) / 1000.0
+        self.queue: "queue.Queue[Tuple[List[str], Future, float]]" = queue.Queue()
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.batches = 0
+        self.texts = 0
+        self.max_queue_depth = 0
+        self.wait_s = 0.0
+        self.compute_s = 0.0
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="embed-batcher", daemon=True)
+        self.thread.start()
+
+    def encode(self, texts: List[str]) -> np.ndarray:
+        if len(texts) >= self.max_batch:
+            return self.compute(list(texts))
+        fut: Future = Future()
+        with self.lock:
+            if self.closed:
+                return self.compute(list(texts))
+            self.queue.put((list(texts), fut, time.perf_counter()))
+            self.requests += 1
+            self.max_queue_depth = max(self.max_queue_depth, self.queue.qsize())
+        return fut.result()
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            batch = [item]
+            n = len(item[0])
+            deadline = item[2] + self.max_wait
+            while n < self.max_batch:
+                timeout = deadline - time.perf_counter()
+                try:
+                    # queued requests join without waiting: under a backlog the deadline has long passed
+                    nxt = self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait()
+                except queue.Empty:
+                    break
+                if nxt is None:
+                    self.queue.put(None)    # finish this batch, then stop
+                    break
+                batch.append(nxt)
+                n += len(nxt[0])
+            self._dispatch(batch)
+
+    def _dispatch(self, batch: List[Tuple[List[str], Future, float]]):
+        t0 = time.perf_counter()
+        unique = list(dict.fromkeys(t for texts, _, _ in batch for t in texts))
+        try:
+            embs = np.asarray(self.compute(unique), dtype="float32")
+            pos = {t: i for i, t in enumerate(unique)}
+            for texts, fut, _ in batch:
+                fut.set_result(embs[[pos[t] for t in texts]])
+        except Exception as e:
+            for _, fut, _ in batch:
+                fut.set_exception(e)
+        t1 = time.perf_counter()
+        with self.lock:
+            self.batches += 1
+            self.texts += len(unique)
+            self.wait_s += sum(t0 - enq for _, _, enq in batch)
+            self.compute_s += t1 - t0
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            return {"requests": self.requests, "batches": self.batches, "texts": self.texts,
+                    "mean_batch": (self.texts / self.batches) if self.batches else 0.0,
+                    "queue_depth": self.queue.qsize(), "max_queue_depth": self.max_queue_depth,
+                    "mean_wait_ms": (1000.0 * self.wait_s / self.requests) if self.requests else 0.0,
+                    "mean_compute_ms": (1000.0 * self.compute_s / self.batches) if self.batches else 0.0}
+
+    def close(self):
+        with self.lock:
+            if self.closed:
+                return
+            self.closed = True
+            self.queue.put(None)
+        self.thread.join(timeout=5.0)
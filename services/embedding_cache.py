@@ -0,0 +1,123 @@
+# services/embedding_cache.py
+import hashlib, os, sqlite3, threading
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional
+import numpy as np
+
+class EmbeddingCache:
+    """
+    Content-addressed cache for sentence embeddings.
+
+    Keys are sha1(model_name + text), so switching models never serves stale vectors.
+    A bounded in-memory LRU sits in front of an optional sqlite tier that survives restarts;
+    that tier keeps at most `max_disk_items` rows and evicts the least recently used ones.
+    Meant for query text: bulk document embedding bypasses it (VDBService.embed_documents).
+    """
+    def __init__(self, model_name: str, max_items: int = 50000, db_path: Optional[str] = None,
+                 max_disk_items: int = 200000):
+        self.model_name = model_name
+        self.max_items = max_items
+        self.max_disk_items = max(1, max_disk_items)
+        self.db_path = db_path
+        self.lru: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self.db = None
+        if db_path:
+            os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+            self.db = sqlite3.connect(db_path, check_same_thread=False)
+            self.db.execute("CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vec BLOB NOT NULL)")
+            if "used" not in [row[1] for row in self.db.execute("PRAGMA table_info(embeddings)")]:
+                # files from before the size bound: existing rows count as least recently used
+                self.db.execute("ALTER TABLE embeddings ADD COLUMN used INTEGER NOT NULL DEFAULT 0")
+            self.db.execute("CREATE INDEX IF NOT EXISTS embeddings_used ON embeddings (used)")
+            self.db.commit()
+            # logical clock stamped on rows when written or read; eviction drops the smallest stamps
+            self.clock = self.db.execute("SELECT COALESCE(MAX(used), 0) FROM embeddings").fetchone()[0]
+            self.disk_size = self.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            self._evict()
+
+    def key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.model_name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vec: np.ndarray):
+        self.lru[key] = vec
+        self.lru.move_to_end(key)
+        while len(self.lru) > self.max_items:
+            self.lru.popitem(last=False)
+
+    def _lookup(self, keys: List[str]) -> Dict[str, np.ndarray]:
+        found: Dict[str, np.ndarray] = {}
+        for k in keys:
+            if k in self.lru:
+                self.lru.move_to_end(k)
+                found[k] = self.lru[k]
+        rest = [k for k in keys if k not in found]
+        if self.db is not None and rest:
+            for i in range(0, len(rest), 500):
+                part = rest[i:i + 500]
+                rows = self.db.execute(
+                    f"SELECT key, vec FROM embeddings WHERE key IN ({','.join('?' * len(part))})", part).fetchall()
+                for k, blob in rows:
+                    vec = np.frombuffer(blob, dtype="float32")
+                    found[k] = vec
+                    self._remember(k, vec)
+                    self.disk_hits += 1
+                if rows:
+                    self.clock += 1
+                    self.db.execute(f"UPDATE embeddings SET used = ? WHERE key IN ({','.join('?' * len(rows))})",
+                                    [self.clock] + [k for k, _ in rows])
+                    self.db.commit()
+        return found
+
+    def _store(self, new: Dict[str, np.ndarray]):
+        self.clock += 1
+        before = self.db.total_changes
+        self.db.executemany("INSERT OR IGNORE INTO embeddings (key, vec, used) VALUES (?, ?, ?)",
+                            [(k, v.tobytes(), self.clock) for k, v in new.items()])
+        self.disk_size += self.db.total_changes - before
+        self._evict()
+        self.db.commit()
+
+    def _evict(self):
+        excess = self.disk_size - self.max_disk_items
+        if excess > 0:
+            self.db.execute("DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY used LIMIT ?)", (excess,))
+            self.disk_size -= excess
+            self.evicted += excess
+            self.db.commit()
+
+    def encode(self, texts: List[str], compute: Callable[[List[str]], np.ndarray]) -> np.ndarray:
+        """Return embeddings for texts, calling compute() only for unique texts not cached yet."""
+        keys = [self.key(t) for t in texts]
+        with self.lock:
+            found = self._lookup(list(dict.fromkeys(keys)))
+            missing = list(dict.fromkeys(t for t, k in zip(texts, keys) if k not in found))
+            self.hits += len(texts) - sum(1 for k in keys if k not in found)
+            self.misses += len(missing)
+        if missing:
+            embs = np.asarray(compute(missing), dtype="float32")
+            new = {self.key(t): embs[i] for i, t in enumerate(missing)}
+            with self.lock:
+                for k, vec in new.items():
+                    self._remember(k, vec)
+                if self.db is not None:
+                    self._store(new)
+            found.update(new)
+        return np.stack([found[k] for k in keys]).astype("float32")
+
+    def stats(self) -> Dict[str, float]:
+        with self.lock:
+            total = self.hits + self.misses
+            return {"hits": self.hits, "disk_hits": self.disk_hits, "misses": self.misses,
+                    "hit_rate": (self.hits / total) if total else 0.0, "size": len(self.lru),
+                    "disk_size": self.disk_size if self.db is not None else 0, "evicted": self.evicted}
+
+    def close(self):
+        with self.lock:
+            if self.db is not None:
+                self.db.close()
+                self.db = None
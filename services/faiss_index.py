@@ -0,0 +1,412 @@
+# services/faiss_index.py
+import os, glob, json, threading
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import faiss, numpy as np
+from services.config import load_config
+
+CFG = load_config()
+
+INDEX_TYPES = ("flat", "ivf_flat", "ivf_pq", "hnsw", "sq8", "pq", "ivf_sq8")
+
+def make_index(dim: int, index_type: Optional[str] = None, fcfg: Optional[Dict[str,Any]] = None):
+    """
+    Create an empty FAISS index of the requested type (defaults to faiss.index_type).
+    IVF variants are returned untrained and need train_index() before add().
+    """
+    fcfg = fcfg if fcfg is not None else CFG["faiss"]
+    index_type = (index_type or fcfg.get("index_type") or "flat").lower()
+    if index_type == "flat":
+        return faiss.IndexFlatL2(dim)
+    if index_type == "hnsw":
+        index = faiss.IndexHNSWFlat(dim, int(fcfg.get("hnsw_m", 32)))
+        index.hnsw.efConstruction = int(fcfg.get("ef_construction", 200))
+        return index
+    # compressed codes: int8 scalar quantisation (4x smaller) or product quantisation (pq_m bytes/vector at 8 bits)
+    if index_type == "sq8":
+        return faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+    if index_type == "pq":
+        return faiss.IndexPQ(dim, int(fcfg.get("pq_m", 48)), int(fcfg.get("pq_nbits", 8)), faiss.METRIC_L2)
+    if index_type in ("ivf_flat", "ivf_pq", "ivf_sq8"):
+        nlist = int(fcfg.get("nlist", 1024))
+        quantizer = faiss.IndexFlatL2(dim)
+        if index_type == "ivf_flat":
+            return faiss.IndexIVFFlat(quantizer, dim, nlist, faiss.METRIC_L2)
+        if index_type == "ivf_sq8":
+            return faiss.IndexIVFScalarQuantizer(quantizer, dim, nlist, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_L2)
+        return faiss.IndexIVFPQ(quantizer, dim, nlist, int(fcfg.get("pq_m", 48)), int(fcfg.get("pq_nbits", 8)))
+    raise ValueError(f"Unsupported faiss index_type '{index_type}', expected one of {INDEX_TYPES}")
+
+def set_search_params(index, fcfg: Optional[Dict[str,Any]] = None):
+    """Apply query-time knobs (IVF nprobe, HNSW efSearch) to a built or loaded index."""
+    fcfg = fcfg if fcfg is not None else CFG["faiss"]
+    if hasattr(index, "nprobe"):
+        index.nprobe = int(fcfg.get("nprobe", 16))
+    if hasattr(index, "hnsw"):
+        index.hnsw.efSearch = int(fcfg.get("ef_search", 64))
+    return index
+
+def training_points(index) -> int:
+    """Vectors index.train() needs: 0 once trained, else nlist (IVF) or 2^nbits (PQ), whichever is larger."""
+    if index.is_trained:
+        return 0
+    need = getattr(index, "nlist", 1)
+    if hasattr(index, "pq"):
+        need = max(need, 1 << index.pq.nbits)
+    return need
+
+def train_index(index, embs: np.ndarray):
+    """Train an untrained (IVF/SQ/PQ) index; a no-op for flat and HNSW indexes."""
+    if index.is_trained:
+        return
+    need = training_points(index)
+    if len(embs) < need:
+        raise RuntimeError(f"Index needs at least {need} training vectors, got {len(embs)}; "
+                           "build it offline with `python -m services.build_index`")
+    index.train(embs)
+
+# fourcc headers of IndexFlat files (L2, IP, generic)
+FLAT_FOURCCS = (b"IxF2", b"IxFI", b"IxFl")
+
+def is_flat_file(path: str) -> bool:
+    with open(path, "rb") as f:
+        return f.read(4) in FLAT_FOURCCS
+
+def read_index(path: str, use_mmap: Optional[bool] = None):
+    """
+    Load a FAISS index, memory-mapping it when faiss.mmap is set and the index type supports it.
+    Flat indexes are mapped with IO_FLAG_MMAP_IFC (IO_FLAG_MMAP still copies their vectors into
+    RAM), everything else with IO_FLAG_MMAP. A mapped flat index is a read-only view: adding to
+    it aborts the process, so writers reload it with faiss.read_index first.
+    """
+    use_mmap = CFG["faiss"].get("mmap", True) if use_mmap is None else use_mmap
+    if use_mmap:
+        try:
+            flag = faiss.IO_FLAG_MMAP_IFC if is_flat_file(path) else faiss.IO_FLAG_MMAP
+            return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY), True
+        except Exception:
+            pass
+    return faiss.read_index(path), False
+
+def search_subset(index, x: np.ndarray, k: int, ids: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Search only the given (local) ids. Small subsets, and index types that take no search
+    parameters (IndexPQ), are scored directly on reconstructed vectors; larger ones go
+    through an IDSelectorBatch, so filtering happens inside the scan, not after it.
+    """
+    D = np.full((len(x), k), np.inf, dtype="float32")
+    I = np.full((len(x), k), -1, dtype="int64")
+    if not len(ids):
+        return D, I
+    if len(ids) <= int(CFG["faiss"].get("filter_exact_max", 4096)) or isinstance(index, faiss.IndexPQ):
+        try:
+            vecs = index.reconstruct_batch(ids)
+        except RuntimeError:
+            vecs = None     # IVF without a direct map
+        if vecs is not None:
+            d = (x ** 2).sum(1)[:, None] - 2 * x @ vecs.T + (vecs ** 2).sum(1)[None, :]
+            order = np.argsort(d, axis=1, kind="stable")[:, :k]
+            n = order.shape[1]
+            D[:, :n] = np.take_along_axis(d, order, 1); I[:, :n] = ids[order]
+            return D, I
+    sel = faiss.IDSelectorBatch(ids)
+    if hasattr(index, "nprobe"):
+        params = faiss.SearchParametersIVF(sel=sel, nprobe=index.nprobe)
+    elif hasattr(index, "hnsw"):
+        params = faiss.SearchParametersHNSW(sel=sel, efSearch=index.hnsw.efSearch)
+    else:
+        params = faiss.SearchParameters(sel=sel)
+    return index.search(x, k, params=params)
+
+def merge_topk(Ds: List[np.ndarray], Is: List[np.ndarray], k: int) -> Tuple[np.ndarray, np.ndarray]:
+    """Merge per-part (distances, global ids) into the k smallest distances per row."""
+    D = np.hstack(Ds); I = np.hstack(Is)
+    D = np.where(I >= 0, D, np.inf)
+    order = np.argsort(D, axis=1, kind="stable")[:, :k]
+    return np.take_along_axis(D, order, 1), np.take_along_axis(I, order, 1)
+
+def write_index_atomic(index, path: str, staged: Optional[Callable[[str], None]] = None):
+    """Write next to `path` and rename over it; `staged(tmp_path)` runs between the two."""
+    faiss.write_index(index, path + ".tmp")
+    if staged is not None:
+        staged(path + ".tmp")
+    os.replace(path + ".tmp", path)
+
+class SegmentedIndex:
+    """
+    A base FAISS index plus small append-only flat segments.
+
+    add() writes only the new vectors to `<index_file>.seg.<n>` and records them in the
+    `<index_file>.segments` manifest, so persisting a batch costs O(batch) instead of
+    rewriting the whole index. search() fans out over base + segments and merges the
+    distances. merge_tiers() rewrites runs of similar-sized segments into one bigger
+    segment (size-tiered merging), so a vector is copied about log_fanout(n / batch) times
+    and the segment count stays logarithmic; compact() folds the segments into the base
+    index, which should_compact() only asks for once they hold a fraction of its size.
+    Ids are global: base ids first, then each segment in manifest order.
+
+    The store's index type (faiss.index_type when it was created, or the build's) is
+    recorded in the segments manifest. A new store of a type that needs training (IVF/PQ)
+    starts with an empty, untrained base; search() skips it. A compaction with too few
+    vectors to train it writes a flat base instead, and the first compaction that has
+    enough (base + segments) retrains all of them into the recorded type.
+
+    With faiss.shards > 1 the base index is searched as that many shards on the shared
+    worker pool (services/shards.py). The shards are split on load and after every
+    compaction; the new base and its shards are swapped in under a lock, the old shards
+    are retired once the searches holding them finish, and the parent keeps only a
+    memory-mapped view of the base.
+    """
+    def __init__(self, index_file: str, dim: int, use_mmap: Optional[bool] = None, load: bool = True,
+                 shards: Optional[int] = None, index_type: Optional[str] = None):
+        self.index_file = index_file
+        self.dim = dim
+        self.manifest_path = index_file + ".segments"
+        self.mmapped = False
+        self.n_shards = int(CFG["faiss"].get("shards", 0) if shards is None else shards)
+        self.shard_pool = None
+        # guards swapping (base, segments, shard_pool) against searches taking a snapshot of them
+        self.shard_lock = threading.Lock()
+        manifest = {}
+        if load and os.path.exists(self.manifest_path):
+            with open(self.manifest_path, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        names = manifest.get("segments", [])
+        self.index_type = (index_type or manifest.get("index_type") or CFG["faiss"].get("index_type") or "flat").lower()
+        if load and os.path.exists(index_file):
+            base, mmapped = read_index(index_file, use_mmap)
+        else:
+            base, mmapped = make_index(dim, self.index_type), False
+        # [file name or None while unsaved, flat index]
+        self.segments: List[list] = [[n, faiss.read_index(os.path.join(os.path.dirname(index_file), n))] for n in names]
+        self._publish(base, mmapped, self._start_shards(base) if load else None)
+
+    @property
+    def ntotal(self) -> int:
+        return self.base.ntotal + sum(seg.ntotal for _, seg in self.segments)
+
+    @property
+    def metric_type(self) -> int:
+        return self.base.metric_type
+
+    @property
+    def is_trained(self) -> bool:
+        return self.base.is_trained
+
+    def reconcile(self, n_texts: int) -> bool:
+        """
+        Line the loaded vectors up with the chunk store after an unclean shutdown.
+        Returns False when the two cannot be matched and the caller should start over.
+        """
+        if self.ntotal == n_texts:
+            return True
+        if self.base.ntotal == n_texts:
+            # compaction replaced the base but died before clearing the manifest
+            self.segments = []
+        elif self.segments and self.ntotal - self.segments[-1][1].ntotal == n_texts:
+            # last segment was written but its texts never made it to the chunk store
+            self.segments = self.segments[:-1]
+        else:
+            return False
+        self._write_manifest()
+        self._remove_stale_segments()
+        return True
+
+    def search(self, x: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """k nearest neighbours per row; `ids` (sorted global ids) restricts the search to that subset."""
+        with self.shard_lock:
+            base, segments, pool = self.base, self.segments, self.shard_pool
+            if pool is not None:
+                pool.acquire()
+        try:
+            return self._search(base, segments, pool, x, k, ids)
+        finally:
+            if pool is not None:
+                pool.release()
+
+    def _search(self, base, segments: List[list], pool, x: np.ndarray, k: int,
+                ids: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+        base_ids = ids[ids < base.ntotal] if ids is not None else None
+        if not base.ntotal or not base.is_trained:
+            D = np.full((len(x), k), np.inf, dtype="float32"); I = np.full((len(x), k), -1, dtype="int64")
+        elif pool is not None:
+            D, I = pool.search(x, k, base_ids)
+        elif ids is None:
+            D, I = base.search(x, k)
+        else:
+            D, I = search_subset(base, x, k, base_ids)
+        if not segments:
+            return D, I
+        Ds, Is = [D], [I]
+        offset = base.ntotal
+        for _, seg in segments:
+            if seg.ntotal:
+                if ids is None:
+                    d, i = seg.search(x, min(k, seg.ntotal))
+                else:
+                    d, i = search_subset(seg, x, k, ids[(ids >= offset) & (ids < offset + seg.ntotal)] - offset)
+                Ds.append(d); Is.append(np.where(i >= 0, i + offset, -1))
+            offset += seg.ntotal
+        return merge_topk(Ds, Is, k)
+
+    def _start_shards(self, base):
+        """Shards of the base index file (split first if missing or stale) on the shared search pool, or None."""
+        if self.n_shards <= 1 or not base.ntotal or not os.path.exists(self.index_file):
+            return None
+        from services.shards import ShardPool, read_shards, write_shards
+        try:
+            shards = read_shards(self.index_file, self.n_shards) or write_shards(self.index_file, self.n_shards)
+            return ShardPool(self.index_file, shards, int(CFG["faiss"].get("shard_workers", 0)),
+                             int(CFG["faiss"].get("shard_threads", 1)))
+        except Exception as e:
+            print(f"[shards] searching {self.index_file} in-process: {e}")
+            return None
+
+    def _publish(self, base, mmapped: bool, pool, segments: Optional[List[list]] = None):
+        """Swap in a base index (and its shard pool, and segments) for new searches; retire the old pool."""
+        if pool is not None and not mmapped:
+            # the shard workers hold the vectors now: keep only a memory-mapped view here
+            base, mmapped = read_index(self.index_file, use_mmap=True)
+        set_search_params(base)
+        with self.shard_lock:
+            old = self.shard_pool
+            self.base, self.mmapped, self.shard_pool = base, mmapped, pool
+            if segments is not None:
+                self.segments = segments
+        if old is not None and old is not pool:
+            old.retire()
+
+    def close(self):
+        with self.shard_lock:
+            pool, self.shard_pool = self.shard_pool, None
+        if pool is not None:
+            pool.retire()
+
+    def add(self, embs: np.ndarray, persist: bool = True):
+        if self.segments and self.segments[-1][0] is None:
+            self.segments[-1][1].add(embs)
+        else:
+            seg = faiss.IndexFlatL2(self.dim)
+            seg.add(embs)
+            self.segments.append([None, seg])
+        if persist:
+            self.flush()
+
+    def flush(self):
+        """Write unsaved segments, then the manifest that makes them visible."""
+        dirname = os.path.dirname(self.index_file)
+        taken = {n for n, _ in self.segments if n}
+        seq = len(taken)
+        changed = False
+        for entry in self.segments:
+            if entry[0] is not None:
+                continue
+            while True:
+                seq += 1
+                name = f"{os.path.basename(self.index_file)}.seg.{seq:06d}"
+                if name not in taken:
+                    break
+            write_index_atomic(entry[1], os.path.join(dirname, name))
+            entry[0] = name; changed = True
+        if changed:
+            self._write_manifest()
+
+    @staticmethod
+    def _tier(n: int, fanout: int) -> int:
+        tier = 0
+        while n >= fanout:
+            n //= fanout; tier += 1
+        return tier
+
+    def merge_tiers(self, fanout: int = 4) -> int:
+        """
+        While the newest `fanout` segments share a size tier (floor(log_fanout(ntotal))),
+        rewrite them as one flat segment. Only a trailing run is merged, so global ids keep
+        their order. Returns the number of segments merged away.
+        """
+        fanout = max(2, int(fanout))
+        self.flush()
+        merged = 0
+        while len(self.segments) >= fanout:
+            tiers = {self._tier(seg.ntotal, fanout) for _, seg in self.segments[-fanout:]}
+            if len(tiers) > 1:
+                break
+            seg = faiss.IndexFlatL2(self.dim)
+            for _, part in self.segments[-fanout:]:
+                if part.ntotal:
+                    seg.add(part.reconstruct_n(0, part.ntotal))
+            self.segments = self.segments[:-fanout] + [[None, seg]]
+            merged += fanout - 1
+        if merged:
+            self.flush()
+            self._remove_stale_segments()
+        return merged
+
+    def should_compact(self, max_segments: int, ratio: float) -> bool:
+        """
+        True once the segments hold `ratio` times the base's vectors (so the base grows
+        geometrically and rewriting it stays linear overall) or outnumber max_segments.
+        An untrained base waits until the segments can train it.
+        """
+        if not self.segments:
+            return False
+        seg_total = sum(seg.ntotal for _, seg in self.segments)
+        if not self.base.is_trained:
+            return seg_total >= training_points(self.base)
+        if self._stand_in(self.base) and self.base.ntotal + seg_total >= training_points(make_index(self.dim, self.index_type)):
+            return True
+        return len(self.segments) > max_segments or seg_total >= ratio * self.base.ntotal
+
+    def _stand_in(self, base) -> bool:
+        """True for a flat base written in place of the store's (not yet trainable) index type."""
+        return self.index_type != "flat" and type(base) is faiss.IndexFlatL2
+
+    def compact(self, staged: Optional[Callable[[str, int], None]] = None) -> int:
+        """
+        Merge all segments into the base index and rewrite it once. Returns vectors merged.
+        `staged(tmp_path, ntotal)` sees the new base file before it replaces the old one.
+        """
+        if not self.segments:
+            return 0
+        vecs = np.vstack([seg.reconstruct_n(0, seg.ntotal) for _, seg in self.segments if seg.ntotal]) \
+            if any(seg.ntotal for _, seg in self.segments) else np.zeros((0, self.dim), dtype="float32")
+        merged = len(vecs)
+        # a private in-RAM copy (a mapped base is read-only); searches keep using self.base meanwhile
+        base = faiss.read_index(self.index_file) if self.base.ntotal else self.base
+        if self._stand_in(base) or not base.is_trained:
+            target = make_index(self.dim, self.index_type)
+            if base.ntotal + len(vecs) >= training_points(target):
+                # enough vectors now: retrain everything into the store's index type
+                if base.ntotal:
+                    vecs = np.vstack([base.reconstruct_n(0, base.ntotal), vecs])
+                base = target
+            elif not base.is_trained:
+                # too few vectors to train it (the base is still empty): write a flat stand-in
+                base = faiss.IndexFlatL2(self.dim)
+        train_index(base, vecs)
+        if len(vecs):
+            base.add(vecs)
+        write_index_atomic(base, self.index_file, (lambda tmp: staged(tmp, base.ntotal)) if staged else None)
+        self._publish(base, False, self._start_shards(base), segments=[])
+        self._write_manifest()
+        self._remove_stale_segments()
+        return merged
+
+    def clear(self):
+        """Drop every vector, on disk and in memory."""
+        self.close()
+        self._publish(make_index(self.dim, self.index_type), False, None, segments=[])
+        for path in (self.index_file, self.manifest_path):
+            if os.path.exists(path):
+                os.remove(path)
+        self._remove_stale_segments()
+
+    def _write_manifest(self):
+        with open(self.manifest_path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"segments": [n for n, _ in self.segments if n], "index_type": self.index_type}, f)
+        os.replace(self.manifest_path + ".tmp", self.manifest_path)
+
+    def _remove_stale_segments(self):
+        live = {n for n, _ in self.segments if n}
+        for path in glob.glob(glob.escape(self.index_file) + ".seg.*"):
+            if os.path.basename(path) not in live:
+                os.remove(path)
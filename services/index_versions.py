@@ -0,0 +1,142 @@
+# services/index_versions.py
+"""
+Versioned index directories.
+
+An index configured as `data/faiss_general.index` keeps each build in its own directory
+
+    data/faiss_general.index.versions/
+        CURRENT                 # name of the live version, swapped with os.replace
+        v000001/index           # FAISS index; sidecars (.offsets, .blob, .bm25.sqlite, ...) share the prefix
+        v000001/manifest.json   # model, dim, count, checksum, index type, created
+
+so a new build can be written next to the live one and published by flipping CURRENT.
+Indexes that predate this layout (files directly at the configured path) keep working.
+"""
+import hashlib, json, os, re, shutil, time
+from typing import Any, Dict, List, Optional, Tuple
+
+VERSION_RE = re.compile(r"^v(\d{6})$")
+
+def versions_dir(index_file: str) -> str:
+    return index_file + ".versions"
+
+def list_versions(index_file: str) -> List[str]:
+    root = versions_dir(index_file)
+    if not os.path.isdir(root):
+        return []
+    return sorted(n for n in os.listdir(root) if VERSION_RE.match(n))
+
+def current_version(index_file: str) -> Optional[str]:
+    path = os.path.join(versions_dir(index_file), "CURRENT")
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            name = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return name if VERSION_RE.match(name) else None
+
+def version_prefix(index_file: str, version: str) -> str:
+    return os.path.join(versions_dir(index_file), version, "index")
+
+def resolve(index_file: str, version: Optional[str] = None) -> Tuple[str, Optional[str]]:
+    """(path prefix of the live index files, version name or None for the legacy flat layout)."""
+    version = version or current_version(index_file)
+    if version is None:
+        return index_file, None
+    return version_prefix(index_file, version), version
+
+def new_version(index_file: str) -> Tuple[str, str]:
+    """Create an empty version directory after the newest one; returns (version, prefix)."""
+    existing = list_versions(index_file)
+    seq = int(VERSION_RE.match(existing[-1]).group(1)) + 1 if existing else 1
+    while True:
+        version = f"v{seq:06d}"
+        try:
+            os.makedirs(os.path.join(versions_dir(index_file), version))
+            return version, version_prefix(index_file, version)
+        except FileExistsError:
+            seq += 1    # a concurrent build took this number
+
+def activate(index_file: str, version: str):
+    """Atomically make `version` the live index."""
+    path = os.path.join(versions_dir(index_file), "CURRENT")
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        f.write(version)
+    os.replace(path + ".tmp", path)
+
+def prune(index_file: str, keep: int = 2):
+    """Delete all but the live version and the `keep` newest others."""
+    live = current_version(index_file)
+    old = [v for v in list_versions(index_file) if v != live]
+    for v in old[:max(0, len(old) - keep)]:
+        shutil.rmtree(os.path.join(versions_dir(index_file), v), ignore_errors=True)
+
+def file_checksum(path: str, chunk: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(chunk), b""):
+            h.update(block)
+    return "sha256:" + h.hexdigest()
+
+def manifest_path(prefix: str) -> str:
+    return os.path.join(os.path.dirname(prefix), "manifest.json")
+
+def read_manifest(prefix: str) -> Optional[Dict[str, Any]]:
+    try:
+        with open(manifest_path(prefix), "r", encoding="utf-8") as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+def _dump_manifest(prefix: str, manifest: Dict[str, Any]):
+    path = manifest_path(prefix)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(path + ".tmp", path)
+
+def write_manifest(prefix: str, **fields: Any) -> Dict[str, Any]:
+    """Write (or update) the manifest of the version holding `prefix`; checksum covers the base index file."""
+    manifest = read_manifest(prefix) or {"created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    manifest.update(fields)
+    manifest["checksum"] = file_checksum(prefix)
+    manifest.pop("pending", None)
+    _dump_manifest(prefix, manifest)
+    return manifest
+
+def stage_manifest(prefix: str, staged_file: str, **fields: Any) -> Dict[str, Any]:
+    """
+    Record, as the manifest's "pending" entry, the fields (and checksum) of `staged_file`,
+    which is about to replace the base index at `prefix`. If the process dies after that
+    rename but before write_manifest(), validate() accepts the new file.
+    """
+    manifest = read_manifest(prefix) or {"created": time.strftime("%Y-%m-%dT%H:%M:%S")}
+    manifest["pending"] = {**fields, "checksum": file_checksum(staged_file)}
+    _dump_manifest(prefix, manifest)
+    return manifest
+
+def validate(prefix: str, manifest: Dict[str, Any], model_name: str, dim: int, count: int, verify_checksum: bool = True) -> bool:
+    """
+    Raise ValueError when the index at `prefix` was not built by this model/dim or its files changed.
+    Returns True when the base index matches the manifest's pending entry instead (a compaction
+    replaced it but died before recording it); the caller should then write_manifest().
+    """
+    problems = []
+    if manifest.get("model") != model_name:
+        problems.append(f"model {manifest.get('model')!r} != configured {model_name!r}")
+    if int(manifest.get("dim", -1)) != dim:
+        problems.append(f"dim {manifest.get('dim')} != embedding dim {dim}")
+    checksum = file_checksum(prefix) if verify_checksum else None
+    def file_problems(state: Dict[str, Any]) -> List[str]:
+        found = []
+        if int(state.get("count", -1)) != count:
+            found.append(f"count {state.get('count')} != {count} vectors in the base index")
+        if verify_checksum and state.get("checksum") != checksum:
+            found.append("checksum mismatch")
+        return found
+    stale = file_problems(manifest)
+    pending = bool(stale) and bool(manifest.get("pending")) and not file_problems(manifest["pending"])
+    if not pending:
+        problems += stale
+    if problems:
+        raise ValueError(f"Index {prefix} does not match its manifest: " + "; ".join(problems))
+    return pending
@@ -0,0 +1,230 @@
+# services/ingest.py
+"""
+Streaming bulk ingestion into VDBService.
+
+Documents flow through a generator pipeline (read -> chunk -> batch -> near-duplicate
+filter), batches are embedded in a process pool and appended to the index in
+bounded-size writes, so the corpus never has to fit in memory. Near-duplicates are
+dropped in the parent before a batch is submitted, so they are never embedded.
+
+    python -m services.ingest data/corpus/ pubmed.jsonl --workers 4
+"""
+import argparse, json, os, re, time
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+from collections import deque
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from services.config import load_config
+from services.mcp import approx_tokens
+
+CFG = load_config()
+
+TEXT_EXTS = (".txt", ".md")
+SENT_RE = re.compile(r"(?<=[.!?])\s+")
+
+def row_metadata(row: Dict) -> Dict:
+    """Chunk metadata from a JSONL row: the source/specialty/language/year fields plus a 'metadata' object."""
+    from services.chunk_meta import META_FIELDS
+    meta = dict(row.get("metadata") or {})
+    meta.update({k: row[k] for k in META_FIELDS if row.get(k) not in (None, "")})
+    return meta
+
+def iter_documents(paths: Iterable[str]) -> Iterator[Tuple[str, str, Dict]]:
+    """
+    Yield (doc_id, text, metadata) from directories, .jsonl files ('text' + optional 'id'
+    and metadata fields) and plain text files (metadata: source = file path).
+    """
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, files in os.walk(path):
+                for name in sorted(files):
+                    if name.endswith(TEXT_EXTS + (".jsonl",)):
+                        yield from iter_documents([os.path.join(root, name)])
+        elif path.endswith(".jsonl"):
+            with open(path, "r", encoding="utf-8") as f:
+                for n, line in enumerate(f):
+                    line = line.strip()
+                    if not line:
+                        continue
+                    try:
+                        row = json.loads(line)
+                    except ValueError:
+                        print(f"[ingest] skipping bad JSON at {path}:{n + 1}")
+                        continue
+                    text = str(row.get("text") or "").strip()
+                    if text:
+                        yield str(row.get("id") or f"{path}:{n + 1}"), text, row_metadata(row)
+        else:
+            with open(path, "r", encoding="utf-8", errors="replace") as f:
+                text = f.read().strip()
+            if text:
+                yield path, text, {"source": path}
+
+def chunk_text(text: str, sentences_per_chunk: int, overlap: int, max_tokens: int) -> List[str]:
+    """
+    Pack up to `sentences_per_chunk` sentences per chunk under `max_tokens`, starting the
+    next chunk `overlap` sentences back. Over-long sentences are split on word boundaries.
+    """
+    sents: List[str] = []
+    for s in SENT_RE.split(text):
+        s = " ".join(s.split())
+        if not s:
+            continue
+        n = approx_tokens(s)
+        if n <= max_tokens:
+            sents.append(s)
+            continue
+        words = s.split(" ")
+        step = max(1, int(len(words) * max_tokens / n))
+        sents.extend(" ".join(words[i:i + step]) for i in range(0, len(words), step))
+    toks = [approx_tokens(s) for s in sents]
+    size = max(1, sentences_per_chunk)
+    chunks: List[str] = []
+    start = 0
+    while start < len(sents):
+        end, used = start, 0
+        while end < len(sents) and end - start < size:
+            if end > start and used + toks[end] > max_tokens:
+                break
+            used += toks[end]; end += 1
+        chunks.append(" ".join(sents[start:end]))
+        if end >= len(sents):
+            break
+        start = max(start + 1, end - max(0, overlap))
+    return chunks
+
+def iter_batches(docs: Iterable[Tuple[str, str]], batch_size: int, sentences_per_chunk: int, overlap: int,
+                 max_tokens: int, stats: Dict[str, float]) -> Iterator[Tuple[List[str], List[Dict]]]:
+    """Yield (chunk texts, per-chunk metadata) batches; every chunk inherits its document's metadata."""
+    batch: List[str] = []
+    metas: List[Dict] = []
+    for _, text, meta in docs:
+        stats["docs"] += 1
+        for chunk in chunk_text(text, sentences_per_chunk, overlap, max_tokens):
+            batch.append(chunk); metas.append(meta)
+            if len(batch) >= batch_size:
+                yield batch, metas
+                batch, metas = [], []
+    if batch:
+        yield batch, metas
+
+# ---- process pool workers: one model per worker, loaded once ----
+_worker_model = None
+
+def _init_worker(model_name: str):
+    global _worker_model
+    from sentence_transformers import SentenceTransformer
+    _worker_model = SentenceTransformer(model_name)
+
+def _embed_batch(texts: List[str]):
+    from services.vdb_service import embed
+    return texts, embed(_worker_model, texts, batch_size=min(len(texts), 256))
+
+def ingest(paths: List[str], vdb=None, workers: Optional[int] = None, batch_size: Optional[int] = None,
+           flush_every: Optional[int] = None, report_every: float = 10.0) -> Dict[str, float]:
+    """Stream documents from paths into vdb (a VDBService). Returns throughput stats."""
+    from services.vdb_service import VDBService
+    icfg = CFG.get("ingest") or {}
+    workers = icfg.get("workers", 0) if workers is None else workers
+    batch_size = batch_size or int(icfg.get("batch_size", 512))
+    flush_every = flush_every or int(icfg.get("flush_every", 20000))
+    sentences_per_chunk = int(CFG["llm"].get("vdb_chunks", 4))
+    overlap = int(CFG["llm"].get("vdb_chunk_overlap", 2))
+    max_tokens = int(icfg.get("max_chunk_tokens", 256))
+    vdb = vdb or VDBService()
+
+    stats = {"docs": 0, "chunks": 0, "duplicates": 0, "seconds": 0.0}
+    dedup = getattr(vdb, "dedup", None)
+    batches = iter_batches(iter_documents(paths), batch_size, sentences_per_chunk, overlap, max_tokens, stats)
+    pending_texts: List[str] = []
+    pending_metas: List[Dict] = []
+    pending_embs: List = []
+    pending_sigs: List = []
+    # signatures of chunks accepted but not written yet (in flight or pending), by LSH band key
+    unwritten: Dict[int, List] = {}
+    inflight = deque()
+    t0 = last_report = time.time()
+
+    def fresh(batches):
+        """Drop near-duplicates of indexed chunks and of chunks accepted earlier in this run."""
+        for batch, metas in batches:
+            sigs = None
+            if dedup is not None:
+                keep, sigs = dedup.filter(batch, unwritten)
+                stats["duplicates"] += len(keep) - sum(keep)
+                batch = [t for t, k in zip(batch, keep) if k]
+                metas = [m for m, k in zip(metas, keep) if k]
+                sigs = [s for s, k in zip(sigs, keep) if k]
+            if batch:
+                yield batch, metas, sigs
+
+    def write(force: bool = False):
+        nonlocal pending_texts, pending_metas, pending_embs, pending_sigs
+        if pending_texts and (force or len(pending_texts) >= flush_every):
+            import numpy as np
+            added = vdb.add_embeddings(pending_texts, np.vstack(pending_embs), metadata=pending_metas,
+                                       signatures=pending_sigs if dedup is not None else None)
+            stats["chunks"] += added
+            stats["duplicates"] += len(pending_texts) - added
+            pending_texts, pending_metas, pending_embs, pending_sigs = [], [], [], []
+            if dedup is not None:
+                # the written chunks are in the index's LSH tables now; keep only the in-flight ones
+                unwritten.clear()
+                for _, _, sigs in inflight:
+                    dedup.remember(unwritten, sigs)
+
+    def report():
+        nonlocal last_report
+        if time.time() - last_report >= report_every:
+            el = max(time.time() - t0, 1e-9)
+            print(f"[ingest] docs={stats['docs']} chunks={stats['chunks']} duplicates={stats['duplicates']} "
+                  f"({stats['docs'] / el:.1f} docs/s, {stats['chunks'] / el:.1f} chunks/s)")
+            last_report = time.time()
+
+    def consume(texts, embs, metas, sigs):
+        pending_texts.extend(texts); pending_metas.extend(metas); pending_embs.append(embs)
+        pending_sigs.extend(sigs or [])
+        write(); report()
+
+    if workers and workers > 0:
+        ctx = mp.get_context("spawn")   # forking after torch has started threads can deadlock
+        with ProcessPoolExecutor(max_workers=workers, mp_context=ctx, initializer=_init_worker,
+                                 initargs=(vdb.model_name,)) as pool:
+            for batch, metas, sigs in fresh(batches):
+                inflight.append((pool.submit(_embed_batch, batch), metas, sigs))
+                # keep at most two batches per worker in flight to bound memory
+                if len(inflight) >= 2 * workers:
+                    fut, metas, sigs = inflight.popleft()
+                    consume(*fut.result(), metas, sigs)
+            while inflight:
+                fut, metas, sigs = inflight.popleft()
+                consume(*fut.result(), metas, sigs)
+    else:
+        from services.vdb_service import embed
+        for batch, metas, sigs in fresh(batches):
+            consume(batch, embed(vdb.model, batch, batch_size=min(len(batch), 256)), metas, sigs)
+    write(force=True)
+
+    stats["seconds"] = time.time() - t0
+    el = max(stats["seconds"], 1e-9)
+    stats["docs_per_s"] = stats["docs"] / el
+    stats["chunks_per_s"] = stats["chunks"] / el
+    print(f"[ingest] done: {stats['docs']} docs, {stats['chunks']} chunks ({stats['duplicates']} near-duplicates dropped) in {el:.1f}s "
+          f"({stats['docs_per_s']:.1f} docs/s, {stats['chunks_per_s']:.1f} chunks/s); index size {vdb.count()}")
+    return stats
+
+def main():
+    ap = argparse.ArgumentParser(description="Stream documents into the FAISS index")
+    ap.add_argument("paths", nargs="+", help="directories, .jsonl files or text files")
+    ap.add_argument("--index-file", default=CFG["faiss"]["general_index"])
+    ap.add_argument("--workers", type=int, default=None, help="embedding processes (0 embeds in-process)")
+    ap.add_argument("--batch-size", type=int, default=None, help="chunks per embedding batch")
+    ap.add_argument("--flush-every", type=int, default=None, help="chunks buffered per index write")
+    args = ap.parse_args()
+    from services.vdb_service import VDBService
+    vdb = VDBService(index_file=args.index_file)
+    ingest(args.paths, vdb, args.workers, args.batch_size, args.flush_every)
+    vdb.compact()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# services/kg_async.py
+import asyncio, threading
+from concurrent.futures import Future
+from typing import Any, Coroutine, Optional
+from services.config import load_config
+from services.startup import timed
+from services.kg_service import KGQueries, Plan, Step
+
+CFG = load_config()
+
+class AsyncKGService(KGQueries):
+    """
+    KGService on the native async Neo4j driver (AsyncGraphDatabase).
+
+    The driver and its connection pool live on one private event loop thread, because an
+    async driver is bound to the loop it first runs on while callers come from many loops
+    (asyncio.run per Streamlit turn, the orchestrator's loop, plain threads). The a*
+    methods await that loop without blocking the caller's loop or a pool thread; the plain
+    methods block on it. Both run the query plans shared with KGService (KGQueries). Every
+    query but the snapshot scan and the schema migration carries a server-side transaction
+    timeout (neo4j.query_timeout), and each waits at most neo4j.connection_acquisition_timeout
+    for a pooled connection.
+    """
+    def __init__(self, uri: Optional[str] = None, user: Optional[str] = None, password: Optional[str] = None):
+        from neo4j import AsyncGraphDatabase, basic_auth
+        ncfg = CFG["neo4j"]
+        uri = uri or ncfg["uri"]
+        user = user or ncfg["user"]
+        password = password or ncfg["password"]
+        self.query_timeout = float(ncfg.get("query_timeout", 10))
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name="neo4j-async", daemon=True)
+        self.thread.start()
+
+        async def make_driver():
+            return AsyncGraphDatabase.driver(
+                uri, auth=basic_auth(user, password),
+                max_connection_pool_size=int(ncfg.get("max_connection_pool_size", 50)),
+                connection_acquisition_timeout=float(ncfg.get("connection_acquisition_timeout", 10)),
+                connection_timeout=float(ncfg.get("connection_timeout", 5)),
+            )
+        with timed("neo4j async driver"):
+            self.driver = self._submit(make_driver()).result()
+        self._select_queries()
+
+    def _submit(self, coro: Coroutine) -> Future:
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def close(self):
+        try:
+            self._submit(self.driver.close()).result(timeout=5.0)
+        finally:
+            self.loop.call_soon_threadsafe(self.loop.stop)
+            self.thread.join(timeout=5.0)
+
+    async def _execute(self, step: Step) -> list:
+        """Rows of the first query in step.tiers that returns any; runs on self.loop."""
+        from neo4j import Query
+        timeout = self.query_timeout if step.timeout else None
+        async with self.driver.session() as session:
+            for cypher in step.tiers:
+                result = await session.run(Query(cypher, timeout=timeout), **step.params)
+                rows = [r async for r in result]
+                if rows:
+                    return rows
+        return []
+
+    async def _drive(self, plan: Plan) -> Any:
+        """services.kg_service.drive, awaiting each step."""
+        try:
+            step = next(plan)
+            while True:
+                try:
+                    rows = await self._execute(step)
+                except Exception as e:
+                    step = plan.throw(e)
+                else:
+                    step = plan.send(rows)
+        except StopIteration as stop:
+            return stop.value
+
+    def _call(self, plan: Plan) -> Any:
+        return self._submit(self._drive(plan)).result()
+
+    async def _acall(self, plan: Plan) -> Any:
+        # awaits the driver's loop from any other event loop
+        return await asyncio.wrap_future(self._submit(self._drive(plan)))
@@ -0,0 +1,200 @@
+# services/kg_cache.py
+import threading
+from typing import Any, Callable, Dict, Hashable, List, Optional, Tuple
+from services.config import load_config
+from services.kg_service import clean_symptom_list, disease_candidates
+from services.result_cache import ResultCache, normalize_query
+
+CFG = load_config()
+
+def _symptom_set(symptoms: List[str]) -> Tuple[str, ...]:
+    # sorted, not deduplicated: the exact-match tier compares against len(symptoms), so repeats change the answer
+    return tuple(sorted(clean_symptom_list(symptoms or [])))
+
+class CachedKG:
+    """
+    Result cache in front of a KG service (KGService, AsyncKGService or SnapshotKG).
+
+    Reads are cached per method under a normalised form of their arguments (a symptom
+    list becomes its sorted lowercase list, triples become their candidate disease names)
+    plus the graph version. insert_triples and every SnapshotKG refresh (manual or periodic)
+    bump the version, so results computed before a write or snapshot swap are never served
+    after it; entries also expire after kg_cache.ttl_seconds, which
+    bounds staleness from writes made outside this process. Empty results are not cached:
+    the services also return them when a query fails.
+    """
+    def __init__(self, backend: Any, max_items: Optional[int] = None, ttl: Optional[float] = None):
+        ccfg = CFG.get("kg_cache") or {}
+        self.backend = backend
+        self.cache = ResultCache(int(max_items or ccfg.get("max_items", 5000)),
+                                 float(ttl if ttl is not None else ccfg.get("ttl_seconds", 300)))
+        # bumped by every write; part of every cache key
+        self.version = 0
+        self.lock = threading.Lock()
+        self.method_hits: Dict[str, int] = {}
+        self.method_misses: Dict[str, int] = {}
+        if hasattr(backend, "add_refresh_listener"):
+            backend.add_refresh_listener(self.invalidate)
+
+    def __getattr__(self, name: str):
+        return getattr(self.backend, name)
+
+    def invalidate(self):
+        with self.lock:
+            self.version += 1
+        self.cache.clear()
+
+    def refresh(self):
+        out = self.backend.refresh() if hasattr(self.backend, "refresh") else None
+        self.invalidate()
+        return out
+
+    def close(self):
+        self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        with self.lock:
+            methods = {m: {"hits": self.method_hits.get(m, 0), "misses": self.method_misses.get(m, 0),
+                           "hit_rate": self.method_hits.get(m, 0) / max(1, self.method_hits.get(m, 0) + self.method_misses.get(m, 0))}
+                       for m in sorted(set(self.method_hits) | set(self.method_misses))}
+        return {**self.cache.stats(), "version": self.version, "methods": methods}
+
+    def _count(self, method: str, hit: bool):
+        with self.lock:
+            counts = self.method_hits if hit else self.method_misses
+            counts[method] = counts.get(method, 0) + 1
+
+    def _get(self, method: str, key: Hashable) -> Tuple[Hashable, Any]:
+        key = (method, key, self.version)
+        value = self.cache.get(key)
+        self._count(method, value is not None)
+        return key, value
+
+    # ---- keys ----
+    @staticmethod
+    def _triples_key(kg_triples: List[Tuple[str, str, str]]) -> Tuple[str, ...]:
+        return tuple(sorted(disease_candidates(kg_triples or [])))
+
+    # ---- writes ----
+    def insert_triples(self, triples: List[Tuple[str,str,str]]):
+        try:
+            return self.backend.insert_triples(triples)
+        finally:
+            if triples:
+                self.invalidate()
+
+    async def ainsert_triples(self, triples: List[Tuple[str,str,str]]):
+        try:
+            return await self.backend.ainsert_triples(triples)
+        finally:
+            if triples:
+                self.invalidate()
+
+    # ---- reads ----
+    def _cached(self, method: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        key, value = self._get(method, key)
+        if value is None:
+            value = compute()
+            if value:
+                self.cache.put(key, value)
+        return value
+
+    async def _acached(self, method: str, key: Hashable, compute: Callable[[], Any]) -> Any:
+        key, value = self._get(method, key)
+        if value is None:
+            value = await compute()
+            if value:
+                self.cache.put(key, value)
+        return value
+
+    def retrieve_triples(self, q: str, limit: int = 20) -> List[Tuple[str,str,str]]:
+        if not q:
+            return []
+        return list(self._cached("retrieve_triples", (normalize_query(q), limit),
+                                 lambda: self.backend.retrieve_triples(q, limit)))
+
+    def find_similar_symptoms(self, target_symptoms: List[str]) -> List[str]:
+        if not target_symptoms:
+            return []
+        return list(self._cached("find_similar_symptoms", tuple(sorted(target_symptoms)),
+                                 lambda: self.backend.find_similar_symptoms(target_symptoms)))
+
+    def retrieve_diseases_with_all_symptoms(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str]]:
+        if not _symptom_set(symptoms):
+            return []
+        return list(self._cached("retrieve_diseases_with_all_symptoms", (_symptom_set(symptoms), limit),
+                                 lambda: self.backend.retrieve_diseases_with_all_symptoms(symptoms, limit)))
+
+    def retrieve_diseases_with_all_symptoms_tiered(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str,str]]:
+        if not _symptom_set(symptoms):
+            return []
+        return list(self._cached("retrieve_diseases_with_all_symptoms_tiered", (_symptom_set(symptoms), limit),
+                                 lambda: self.backend.retrieve_diseases_with_all_symptoms_tiered(symptoms, limit)))
+
+    def get_all_symptoms_for_diseases_from_triples(self, kg_triples: List[Tuple[str, str, str]]) -> Dict[str, List[str]]:
+        if not self._triples_key(kg_triples):
+            return {}
+        return dict(self._cached("get_all_symptoms_for_diseases_from_triples", self._triples_key(kg_triples),
+                                 lambda: self.backend.get_all_symptoms_for_diseases_from_triples(kg_triples)))
+
+    def _many_cached(self, symptoms: List[str], limit_per_symptom: int) -> Tuple[Dict[str, Any], Dict[str, Hashable]]:
+        """Cached per-symptom results, and the cache keys of the symptoms still to fetch."""
+        result: Dict[str, Any] = {}
+        missed: Dict[str, Hashable] = {}
+        for q in dict.fromkeys(s for s in symptoms or [] if s):
+            key, value = self._get("retrieve_triples_many", (normalize_query(q), limit_per_symptom))
+            if value is None:
+                missed[q] = key
+            else:
+                result[q] = list(value)
+        return result, missed
+
+    def retrieve_triples_many(self, symptoms: List[str], limit_per_symptom: int = 20) -> Dict[str, List[Tuple[str,str,str]]]:
+        result, missed = self._many_cached(symptoms, limit_per_symptom)
+        if missed:
+            fetched = self.backend.retrieve_triples_many(list(missed), limit_per_symptom)
+            for q, key in missed.items():
+                result[q] = list(fetched.get(q) or [])
+                if result[q]:
+                    self.cache.put(key, list(result[q]))
+        return {q: result[q] for q in dict.fromkeys(s for s in symptoms or [] if s)}
+
+    async def aretrieve_triples(self, q: str, limit: int = 20) -> List[Tuple[str,str,str]]:
+        if not q:
+            return []
+        return list(await self._acached("retrieve_triples", (normalize_query(q), limit),
+                                        lambda: self.backend.aretrieve_triples(q, limit)))
+
+    async def afind_similar_symptoms(self, target_symptoms: List[str]) -> List[str]:
+        if not target_symptoms:
+            return []
+        return list(await self._acached("find_similar_symptoms", tuple(sorted(target_symptoms)),
+                                        lambda: self.backend.afind_similar_symptoms(target_symptoms)))
+
+    async def aretrieve_diseases_with_all_symptoms(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str]]:
+        if not _symptom_set(symptoms):
+            return []
+        return list(await self._acached("retrieve_diseases_with_all_symptoms", (_symptom_set(symptoms), limit),
+                                        lambda: self.backend.aretrieve_diseases_with_all_symptoms(symptoms, limit)))
+
+    async def aretrieve_diseases_with_all_symptoms_tiered(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str,str]]:
+        if not _symptom_set(symptoms):
+            return []
+        return list(await self._acached("retrieve_diseases_with_all_symptoms_tiered", (_symptom_set(symptoms), limit),
+                                        lambda: self.backend.aretrieve_diseases_with_all_symptoms_tiered(symptoms, limit)))
+
+    async def aget_all_symptoms_for_diseases_from_triples(self, kg_triples: List[Tuple[str, str, str]]) -> Dict[str, List[str]]:
+        if not self._triples_key(kg_triples):
+            return {}
+        return dict(await self._acached("get_all_symptoms_for_diseases_from_triples", self._triples_key(kg_triples),
+                                        lambda: self.backend.aget_all_symptoms_for_diseases_from_triples(kg_triples)))
+
+    async def aretrieve_triples_many(self, symptoms: List[str], limit_per_symptom: int = 20) -> Dict[str, List[Tuple[str,str,str]]]:
+        result, missed = self._many_cached(symptoms, limit_per_symptom)
+        if missed:
+            fetched = await self.backend.aretrieve_triples_many(list(missed), limit_per_symptom)
+            for q, key in missed.items():
+                result[q] = list(fetched.get(q) or [])
+                if result[q]:
+                    self.cache.put(key, list(result[q]))
+        return {q: result[q] for q in dict.fromkeys(s for s in symptoms or [] if s)}
@@ -1,99 +1,576 @@
 # services/kg_service.py
-from typing import List, Tuple, Optional, Dict, Set
-from neo4j import GraphDatabase, basic_auth
-import yaml
-import os
+import re
+from typing import Any, Callable, Dict, Generator, List, NamedTuple, Optional, Set, Tuple
+from services.config import load_config
+from services.startup import timed
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_dir, "..","config", "config.yaml")
-CFG = yaml.safe_load(open(config_path,"r",encoding="utf-8"))
+CFG = load_config()
 
-class KGService:
-    def __init__(self, uri: Optional[str] = None, user: Optional[str] = None, password: Optional[str] = None):
-        uri = uri or CFG["neo4j"]["uri"]
-        user = user or CFG["neo4j"]["user"]
-        password = password or CFG["neo4j"]["password"]
-        self.driver = GraphDatabase.driver(uri, auth=basic_auth(user, password))
+# ---- Cypher shared by the sync (KGService) and async (services/kg_async.py) services.
+# Each *_TIERS tuple is tried in order until one returns rows; every tier gets the same parameters. ----
+# Writes generic :Entity nodes, which only the generic-schema tiers read. Symptom/Disease nodes come
+# from bulk loads and get name_lc from the schema migration (schema_ready() checks for any without it);
+# name_lc is set here too for an Entity that also carries one of those labels.
+INSERT_TRIPLES = """
+UNWIND $rows AS row
+MERGE (s:Entity {name:row.s})
+SET s.name_lc = toLower(row.s)
+MERGE (o:Entity {name:row.o})
+SET o.name_lc = toLower(row.o)
+MERGE (s)-[r:REL {type:row.p}]->(o)
+"""
 
-    def close(self):
-        self.driver.close()
+RETRIEVE_TRIPLES_TIERS = (
+    # Primary: opinionated medical schema
+    """
+    MATCH (s:Disease)-[p:IS_SYMPTOM]->(o:Symptom)
+    WHERE toLower(o.name) CONTAINS toLower($q)
+    RETURN s.name AS s, type(p) AS p, o.name AS o
+    LIMIT $limit
+    """,
+    # Fallback: generic entity/relationship schema
+    """
+    MATCH (s)-[p]->(o)
+    WHERE o.name IS NOT NULL AND toLower(o.name) CONTAINS toLower($q)
+    RETURN coalesce(s.name, toString(s)) AS s, type(p) AS p, coalesce(o.name, toString(o)) AS o
+    LIMIT $limit
+    """,
+)
 
-    def insert_triples(self, triples: List[Tuple[str,str,str]]):
+SIMILAR_SYMPTOMS = """
+MATCH (s:Symptom)
+WHERE any(target IN $targets WHERE toLower(s.name) CONTAINS target)
+RETURN s.name as symptom_name
+ORDER BY s.name
+"""
+
+DISEASES_WITH_ALL_SYMPTOMS_TIERS = (
+    # Primary: opinionated medical schema - find diseases that have ALL symptoms (exact match)
+    """
+    MATCH (d:Disease)-[r:IS_SYMPTOM]->(s:Symptom)
+    WHERE toLower(s.name) IN $symptoms
+    WITH d, collect(DISTINCT s.name) as disease_symptoms
+    WHERE size(disease_symptoms) = $symptom_count
+    MATCH (d)-[r2:IS_SYMPTOM]->(s2:Symptom)
+    WHERE toLower(s2.name) IN $symptoms
+    RETURN d.name AS disease, type(r2) AS relationship, s2.name AS symptom
+    LIMIT $limit
+    """,
+    # Fallback: Use partial matching to find diseases with symptoms that contain our search terms
+    """
+    MATCH (d:Disease)-[r:IS_SYMPTOM]->(s:Symptom)
+    WHERE any(symptom IN $symptoms WHERE toLower(s.name) CONTAINS symptom)
+    WITH d, collect(DISTINCT s.name) as disease_symptoms
+    WHERE size(disease_symptoms) >= 2
+    MATCH (d)-[r2:IS_SYMPTOM]->(s2:Symptom)
+    WHERE any(symptom IN $symptoms WHERE toLower(s2.name) CONTAINS symptom)
+    RETURN d.name AS disease, type(r2) AS relationship, s2.name AS symptom
+    LIMIT $limit
+    """,
+    # Final fallback: generic entity/relationship schema
+    """
+    MATCH (d)-[r]->(s)
+    WHERE s.name IS NOT NULL AND toLower(s.name) IN $symptoms
+    WITH d, collect(DISTINCT s.name) as disease_symptoms
+    WHERE size(disease_symptoms) = $symptom_count
+    MATCH (d)-[r2]->(s2)
+    WHERE s2.name IS NOT NULL AND toLower(s2.name) IN $symptoms
+    RETURN d.name AS disease, type(r2) AS relationship, s2.name AS symptom
+    LIMIT $limit
+    """,
+)
+
+DISEASE_SYMPTOMS_TIERS = (
+    # Primary: opinionated medical schema
+    """
+    MATCH (d:Disease)
+    WHERE toLower(d.name) IN $diseases
+    OPTIONAL MATCH (d)-[:IS_SYMPTOM]->(s:Symptom)
+    RETURN d.name AS disease, collect(DISTINCT s.name) AS symptoms
+    """,
+    # Fallback: generic schema, filter on relationship type IS_SYMPTOM where possible
+    """
+    MATCH (d)
+    WHERE d.name IS NOT NULL AND toLower(d.name) IN $diseases
+    OPTIONAL MATCH (d)-[r]->(s)
+    WHERE type(r) = 'IS_SYMPTOM' AND s.name IS NOT NULL
+    RETURN d.name AS disease, collect(DISTINCT s.name) AS symptoms
+    """,
+)
+
+# ---- indexed lookups. The legacy queries above filter on toLower(x.name), which no index can
+# serve, so every turn scans the Symptom/Disease labels. ensure_schema() stores name_lc =
+# toLower(name) on those nodes with a RANGE index (equality / IN) and a TEXT index (CONTAINS;
+# trigram-based in Neo4j 5), and the queries below filter on name_lc instead. Generic-schema
+# fallback tiers have no label to index and stay as they are. ----
+NAME_INDEXES = ("symptom_name_lc", "disease_name_lc", "symptom_name_lc_text", "disease_name_lc_text")
+
+SCHEMA_STATEMENTS = (
+    "CREATE RANGE INDEX symptom_name_lc IF NOT EXISTS FOR (n:Symptom) ON (n.name_lc)",
+    "CREATE RANGE INDEX disease_name_lc IF NOT EXISTS FOR (n:Disease) ON (n.name_lc)",
+    "CREATE TEXT INDEX symptom_name_lc_text IF NOT EXISTS FOR (n:Symptom) ON (n.name_lc)",
+    "CREATE TEXT INDEX disease_name_lc_text IF NOT EXISTS FOR (n:Disease) ON (n.name_lc)",
+)
+
+BACKFILL_NAME_LC = """
+MATCH (n)
+WHERE (n:Symptom OR n:Disease) AND n.name IS NOT NULL AND (n.name_lc IS NULL OR n.name_lc <> toLower(n.name))
+CALL { WITH n SET n.name_lc = toLower(n.name) } IN TRANSACTIONS OF 10000 ROWS
+"""
+
+AWAIT_INDEXES = "CALL db.awaitIndexes($seconds)"
+
+SCHEMA_READY = """
+SHOW INDEXES YIELD name, state
+WHERE name IN $names AND state = 'ONLINE'
+RETURN count(*) AS online
+"""
+
+# any Symptom/Disease node the indexed queries would miss: loaded after the last backfill
+STALE_NAME_LC = """
+MATCH (n)
+WHERE (n:Symptom OR n:Disease) AND n.name IS NOT NULL AND (n.name_lc IS NULL OR n.name_lc <> toLower(n.name))
+RETURN n.name AS name
+LIMIT 1
+"""
+
+RETRIEVE_TRIPLES_INDEXED = (
+    """
+    MATCH (o:Symptom)
+    WHERE o.name_lc CONTAINS toLower($q)
+    MATCH (s:Disease)-[p:IS_SYMPTOM]->(o)
+    RETURN s.name AS s, type(p) AS p, o.name AS o
+    LIMIT $limit
+    """,
+    RETRIEVE_TRIPLES_TIERS[1],
+)
+
+SIMILAR_SYMPTOMS_INDEXED = """
+UNWIND $targets AS target
+MATCH (s:Symptom)
+WHERE s.name_lc CONTAINS target
+WITH DISTINCT s
+RETURN s.name as symptom_name
+ORDER BY symptom_name
+"""
+
+DISEASES_WITH_ALL_SYMPTOMS_INDEXED = (
+    """
+    MATCH (s:Symptom)
+    WHERE s.name_lc IN $symptoms
+    MATCH (d:Disease)-[:IS_SYMPTOM]->(s)
+    WITH d, collect(DISTINCT s.name) as disease_symptoms, collect(DISTINCT s) as matched
+    WHERE size(disease_symptoms) = $symptom_count
+    UNWIND matched AS s2
+    MATCH (d)-[r2:IS_SYMPTOM]->(s2)
+    RETURN d.name AS disease, type(r2) AS relationship, s2.name AS symptom
+    LIMIT $limit
+    """,
+    """
+    UNWIND $symptoms AS term
+    MATCH (s:Symptom)
+    WHERE s.name_lc CONTAINS term
+    WITH DISTINCT s
+    MATCH (d:Disease)-[:IS_SYMPTOM]->(s)
+    WITH d, collect(DISTINCT s.name) as disease_symptoms, collect(DISTINCT s) as matched
+    WHERE size(disease_symptoms) >= 2
+    UNWIND matched AS s2
+    MATCH (d)-[r2:IS_SYMPTOM]->(s2)
+    RETURN d.name AS disease, type(r2) AS relationship, s2.name AS symptom
+    LIMIT $limit
+    """,
+    DISEASES_WITH_ALL_SYMPTOMS_TIERS[2],
+)
+
+DISEASE_SYMPTOMS_INDEXED = (
+    """
+    MATCH (d:Disease)
+    WHERE d.name_lc IN $diseases
+    OPTIONAL MATCH (d)-[:IS_SYMPTOM]->(s:Symptom)
+    RETURN d.name AS disease, collect(DISTINCT s.name) AS symptoms
+    """,
+    DISEASE_SYMPTOMS_TIERS[1],
+)
+
+# retrieve_diseases_with_all_symptoms in one statement: similar-symptom expansion, then the exact,
+# partial and generic-schema tiers as subqueries, each running only if the tiers before it matched
+# nothing. lc(x) is x.name_lc with the indexes, toLower(x.name) without.
+DISEASES_ONE_TRIP_TEMPLATE = """
+CALL {
+    UNWIND $symptoms AS target
+    OPTIONAL MATCH (s:Symptom)
+    WHERE lc(s) CONTAINS target
+    WITH DISTINCT s
+    RETURN collect(s.name) AS similar
+}
+WITH CASE WHEN size(similar) > 0 THEN similar ELSE $symptoms END AS search
+CALL {
+    WITH search
+    MATCH (s:Symptom)
+    WHERE lc(s) IN search
+    MATCH (d:Disease)-[:IS_SYMPTOM]->(s)
+    WITH d, collect(DISTINCT s.name) as disease_symptoms, collect(DISTINCT s) as matched
+    WHERE size(disease_symptoms) = size(search)
+    UNWIND matched AS s2
+    MATCH (d)-[r2:IS_SYMPTOM]->(s2)
+    WITH d, r2, s2 LIMIT $limit
+    RETURN collect({tier: 'exact', disease: d.name, relationship: type(r2), symptom: s2.name}) AS exact
+}
+CALL {
+    WITH search, exact
+    WITH search, exact WHERE size(exact) = 0
+    UNWIND search AS term
+    MATCH (s:Symptom)
+    WHERE lc(s) CONTAINS term
+    WITH DISTINCT s
+    MATCH (d:Disease)-[:IS_SYMPTOM]->(s)
+    WITH d, collect(DISTINCT s.name) as disease_symptoms, collect(DISTINCT s) as matched
+    WHERE size(disease_symptoms) >= 2
+    UNWIND matched AS s2
+    MATCH (d)-[r2:IS_SYMPTOM]->(s2)
+    WITH d, r2, s2 LIMIT $limit
+    RETURN collect({tier: 'partial', disease: d.name, relationship: type(r2), symptom: s2.name}) AS partial
+}
+CALL {
+    WITH search, exact, partial
+    WITH search, exact, partial WHERE size(exact) = 0 AND size(partial) = 0
+    MATCH (d)-[r]->(s)
+    WHERE s.name IS NOT NULL AND toLower(s.name) IN search
+    WITH d, collect(DISTINCT s.name) as disease_symptoms
+    WHERE size(disease_symptoms) = size(search)
+    MATCH (d)-[r2]->(s2)
+    WHERE s2.name IS NOT NULL AND toLower(s2.name) IN search
+    WITH d, r2, s2 LIMIT $limit
+    RETURN collect({tier: 'generic', disease: d.name, relationship: type(r2), symptom: s2.name}) AS generic
+}
+UNWIND exact + partial + generic AS row
+RETURN row.tier AS tier, row.disease AS disease, row.relationship AS relationship, row.symptom AS symptom
+"""
+
+# retrieve_triples for many symptoms in one statement: both retrieve_triples tiers per symptom,
+# the generic one only for symptoms the medical schema didn't match; distinct triples, limit per symptom.
+TRIPLES_MANY_TEMPLATE = """
+UNWIND $qs AS q
+CALL {
+    WITH q
+    MATCH (o:Symptom)
+    WHERE lc(o) CONTAINS toLower(q)
+    MATCH (s:Disease)-[p:IS_SYMPTOM]->(o)
+    WITH DISTINCT s.name AS s, type(p) AS p, o.name AS o
+    LIMIT $limit
+    RETURN collect([s, p, o]) AS primary
+}
+CALL {
+    WITH q, primary
+    WITH q, primary WHERE size(primary) = 0
+    MATCH (s)-[p]->(o)
+    WHERE o.name IS NOT NULL AND toLower(o.name) CONTAINS toLower(q)
+    WITH DISTINCT coalesce(s.name, toString(s)) AS s, type(p) AS p, coalesce(o.name, toString(o)) AS o
+    LIMIT $limit
+    RETURN collect([s, p, o]) AS fallback
+}
+RETURN q, primary + fallback AS triples
+"""
+
+def _with_lc(cypher: str, indexed: bool) -> str:
+    return re.sub(r"\blc\((\w+)\)", r"\1.name_lc" if indexed else r"toLower(\1.name)", cypher)
+
+LEGACY_QUERIES = {"retrieve_triples": RETRIEVE_TRIPLES_TIERS, "similar_symptoms": SIMILAR_SYMPTOMS,
+                  "diseases_with_all_symptoms": DISEASES_WITH_ALL_SYMPTOMS_TIERS, "disease_symptoms": DISEASE_SYMPTOMS_TIERS,
+                  "diseases_one_trip": _with_lc(DISEASES_ONE_TRIP_TEMPLATE, False),
+                  "triples_many": _with_lc(TRIPLES_MANY_TEMPLATE, False)}
+INDEXED_QUERIES = {"retrieve_triples": RETRIEVE_TRIPLES_INDEXED, "similar_symptoms": SIMILAR_SYMPTOMS_INDEXED,
+                   "diseases_with_all_symptoms": DISEASES_WITH_ALL_SYMPTOMS_INDEXED, "disease_symptoms": DISEASE_SYMPTOMS_INDEXED,
+                   "diseases_one_trip": _with_lc(DISEASES_ONE_TRIP_TEMPLATE, True),
+                   "triples_many": _with_lc(TRIPLES_MANY_TEMPLATE, True)}
+
+# Every Disease-IS_SYMPTOM->Symptom edge, plus a null-symptom row per Disease without any,
+# for the in-memory snapshot (services/kg_snapshot.py)
+SNAPSHOT_EDGES = """
+MATCH (d:Disease)
+WHERE d.name IS NOT NULL
+OPTIONAL MATCH (d)-[:IS_SYMPTOM]->(s:Symptom)
+WHERE s.name IS NOT NULL
+RETURN d.name AS disease, s.name AS symptom
+"""
+
+def rows_to_triples(rows, keys: Tuple[str, str, str] = ("s", "p", "o")) -> List[Tuple[str, str, str]]:
+    result: List[Tuple[str, str, str]] = []
+    for r in rows:
+        try:
+            s, p, o = (str(r.get(k)) for k in keys)
+            print(f"[KG] {s} -[{p}]-> {o}")
+            result.append((s, p, o))
+        except Exception:
+            continue
+    return result
+
+def rows_to_tiered(rows) -> List[Tuple[str, str, str, str]]:
+    result: List[Tuple[str, str, str, str]] = []
+    for r in rows:
+        try:
+            tier, d, p, s = (str(r.get(k)) for k in ("tier", "disease", "relationship", "symptom"))
+            print(f"[KG] ({tier}) {d} -[{p}]-> {s}")
+            result.append((tier, d, p, s))
+        except Exception:
+            continue
+    return result
+
+def rows_to_grouped(rows, qs: List[str]) -> Dict[str, List[Tuple[str, str, str]]]:
+    """{q: [(s, p, o), ...]} for every q in qs, from rows of (q, [[s, p, o], ...])."""
+    by_q = {str(r.get("q")): r.get("triples") or [] for r in rows}
+    result: Dict[str, List[Tuple[str, str, str]]] = {}
+    for q in qs:
+        result[q] = []
+        for t in by_q.get(q, []):
+            try:
+                s, p, o = (str(x) for x in t)
+                print(f"[KG] {s} -[{p}]-> {o}")
+                result[q].append((s, p, o))
+            except Exception:
+                continue
+    return result
+
+def clean_symptom_list(symptoms: List[str]) -> List[str]:
+    return [s.strip().lower() for s in symptoms if s.strip()]
+
+def disease_candidates(kg_triples: List[Tuple[str, str, str]]) -> Dict[str, str]:
+    """
+    Candidate disease names in kg_triples, lowercased -> original.
+    Prefers subjects of IS_SYMPTOM triples (case-insensitive); if there are none, every
+    subject and object is a candidate and the DB filters by :Disease label.
+    """
+    candidates: Set[str] = set()
+    for s, p, o in kg_triples:
+        try:
+            predicate = (p or "").strip().upper()
+            if predicate == "IS_SYMPTOM":
+                if isinstance(s, str) and s.strip():
+                    candidates.add(s.strip())
+        except Exception:
+            continue
+    if not candidates:
+        for s, p, o in kg_triples:
+            if isinstance(s, str) and s.strip():
+                candidates.add(s.strip())
+            if isinstance(o, str) and o.strip():
+                candidates.add(o.strip())
+    return {name.lower(): name for name in candidates}
+
+def rows_to_edges(rows) -> List[Tuple[str, Optional[str]]]:
+    """SNAPSHOT_EDGES rows as (disease, symptom), symptom None for a disease without symptoms."""
+    return [(str(r["disease"]), None if r["symptom"] is None else str(r["symptom"])) for r in rows]
+
+def rows_to_symptom_map(rows) -> Dict[str, List[str]]:
+    result: Dict[str, List[str]] = {}
+    for r in rows:
+        try:
+            disease = str(r.get("disease")) if r.get("disease") is not None else None
+            symptoms_list = r.get("symptoms") or []
+            clean_symptoms = [str(s) for s in symptoms_list if s]
+            if disease:
+                result[disease] = sorted(set(clean_symptoms))
+        except Exception:
+            continue
+    return result
+
+# ---- the KG reads and writes, written once for both drivers. Each operation is a query plan: a
+# generator that yields a Step, gets the step's rows (or the exception it raised) sent back, and
+# returns its result. KGService runs plans on the sync driver, AsyncKGService on the async one. ----
+class Step(NamedTuple):
+    tiers: Tuple[str, ...]      # tried in order in one session until one returns rows
+    params: Dict[str, Any]
+    timeout: bool = True        # False for scans and migrations that may outlast neo4j.query_timeout
+
+Plan = Generator[Step, list, Any]
+
+def drive(plan: Plan, execute: Callable[[Step], list]) -> Any:
+    """Run plan, executing each step with execute(step) -> rows."""
+    try:
+        step = next(plan)
+        while True:
+            try:
+                rows = execute(step)
+            except Exception as e:
+                step = plan.throw(e)
+            else:
+                step = plan.send(rows)
+    except StopIteration as stop:
+        return stop.value
+
+class KGQueries:
+    """
+    The KG service surface (sync methods and their a* coroutines) over query plans.
+    Subclasses own the driver and implement _call(plan) and _acall(plan).
+    """
+    queries = LEGACY_QUERIES
+    single_round_trip = True
+
+    def _call(self, plan: Plan) -> Any:
+        raise NotImplementedError
+
+    async def _acall(self, plan: Plan) -> Any:
+        raise NotImplementedError
+
+    def _select_queries(self):
+        """Pick the indexed or legacy queries per neo4j.schema."""
+        ncfg = CFG["neo4j"]
+        self.queries = LEGACY_QUERIES
+        self.single_round_trip = bool(ncfg.get("single_round_trip", True))
+        schema = ncfg.get("schema", "detect")
+        if schema == "manage":
+            self.ensure_schema()
+        elif schema == "detect" and self.schema_ready():
+            self.queries = INDEXED_QUERIES
+
+    # ---- query plans ----
+    def _ensure_schema(self) -> Plan:
+        for stmt in SCHEMA_STATEMENTS:
+            yield Step((stmt,), {}, timeout=False)
+        yield Step((BACKFILL_NAME_LC,), {}, timeout=False)
+        yield Step((AWAIT_INDEXES,), {"seconds": int(CFG["neo4j"].get("schema_wait_seconds", 300))}, timeout=False)
+
+    def _schema_ready(self) -> Plan:
+        rows = yield Step((SCHEMA_READY,), {"names": list(NAME_INDEXES)})
+        if not rows or rows[0]["online"] != len(NAME_INDEXES):
+            return False
+        stale = yield Step((STALE_NAME_LC,), {}, timeout=False)
+        if stale:
+            print(f"[KG] Symptom/Disease nodes without name_lc (e.g. {stale[0]['name']!r}); using unindexed queries "
+                  f"until `python -m services.kg_service` backfills them")
+        return not stale
+
+    def _insert_triples(self, triples: List[Tuple[str,str,str]]) -> Plan:
         if not triples: return
-        cypher = """
-        UNWIND $rows AS row
-        MERGE (s:Entity {name:row.s})
-        MERGE (o:Entity {name:row.o})
-        MERGE (s)-[r:REL {type:row.p}]->(o)
-        """
         rows = [{"s":s, "p":p, "o":o} for s,p,o in triples]
-        with self.driver.session() as session:
-            session.run(cypher, rows=rows)
+        yield Step((INSERT_TRIPLES,), {"rows": rows})
 
-    def retrieve_triples(self, q: str, limit: int = 20) -> List[Tuple[str,str,str]]:
-        """
-        Retrieve disease–symptom triples related to query q.
-        Tries label-specific schema first, then falls back to a generic schema.
-        """
+    def _snapshot_edges(self) -> Plan:
+        return rows_to_edges((yield Step((SNAPSHOT_EDGES,), {}, timeout=False)))
+
+    def _retrieve_triples(self, q: str, limit: int) -> Plan:
         if not q:
             return []
         try:
-            with self.driver.session() as session:
-                # Primary: opinionated medical schema
-                cypher_primary = """
-                MATCH (s:Disease)-[p:IS_SYMPTOM]->(o:Symptom)
-                WHERE toLower(o.name) CONTAINS toLower($q)
-                RETURN s.name AS s, type(p) AS p, o.name AS o
-                LIMIT $limit
-                """
-                rows = list(session.run(cypher_primary, q=q, limit=limit))
-                if not rows:
-                    # Fallback: generic entity/relationship schema
-                    cypher_fallback = """
-                    MATCH (s)-[p]->(o)
-                    WHERE o.name IS NOT NULL AND toLower(o.name) CONTAINS toLower($q)
-                    RETURN coalesce(s.name, toString(s)) AS s, type(p) AS p, coalesce(o.name, toString(o)) AS o
-                    LIMIT $limit
-                    """
-                    rows = list(session.run(cypher_fallback, q=q, limit=limit))
-                result: List[Tuple[str, str, str]] = []
-                for r in rows:
-                    try:
-                        s = str(r.get("s"))
-                        p = str(r.get("p"))
-                        o = str(r.get("o"))
-                        print(f"[KG] {s} -[{p}]-> {o}")
-                        result.append((s, p, o))
-                    except Exception:
-                        continue
-                return result
+            return rows_to_triples((yield Step(self.queries["retrieve_triples"], {"q": q, "limit": limit})))
         except Exception as e:
             print(f"[KG] retrieve_triples error for q='{q}': {e}")
             return []
 
-    def find_similar_symptoms(self, target_symptoms: List[str]) -> List[str]:
-        """
-        Find symptoms in the database that are similar to the target symptoms.
-        This helps when exact matches don't exist.
-        """
+    def _retrieve_triples_many(self, symptoms: List[str], limit_per_symptom: int) -> Plan:
+        qs = list(dict.fromkeys(s for s in symptoms or [] if s))
+        if not qs:
+            return {}
+        try:
+            rows = yield Step((self.queries["triples_many"],), {"qs": qs, "limit": limit_per_symptom})
+            return rows_to_grouped(rows, qs)
+        except Exception as e:
+            print(f"[KG] retrieve_triples_many error for symptoms={qs}: {e}")
+            return {q: [] for q in qs}
+
+    def _find_similar_symptoms(self, target_symptoms: List[str]) -> Plan:
         if not target_symptoms:
             return []
-        
         try:
-            with self.driver.session() as session:
-                # Try to find symptoms that contain any of the target terms
-                cypher = """
-                MATCH (s:Symptom)
-                WHERE any(target IN $targets WHERE toLower(s.name) CONTAINS target)
-                RETURN s.name as symptom_name
-                ORDER BY s.name
-                """
-                rows = list(session.run(cypher, targets=target_symptoms))
-                return [row['symptom_name'] for row in rows]
+            # symptoms that contain any of the target terms
+            rows = yield Step((self.queries["similar_symptoms"],), {"targets": target_symptoms})
+            return [row['symptom_name'] for row in rows]
         except Exception as e:
             print(f"[KG] find_similar_symptoms error: {e}")
             return []
 
+    def _retrieve_diseases_with_all_symptoms(self, symptoms: List[str], limit: int) -> Plan:
+        clean_symptoms = clean_symptom_list(symptoms or [])
+        if not clean_symptoms:
+            return []
+        if self.single_round_trip:
+            return [t[1:] for t in (yield from self._retrieve_diseases_with_all_symptoms_tiered(symptoms, limit))]
+        # similar symptoms in the database if there are any, otherwise the originals
+        search_symptoms = (yield from self._find_similar_symptoms(clean_symptoms)) or clean_symptoms
+        try:
+            rows = yield Step(self.queries["diseases_with_all_symptoms"], {
+                "symptoms": search_symptoms, "symptom_count": len(search_symptoms), "limit": limit})
+            return rows_to_triples(rows, ("disease", "relationship", "symptom"))
+        except Exception as e:
+            print(f"[KG] retrieve_diseases_with_all_symptoms error for symptoms={symptoms}: {e}")
+            return []
+
+    def _retrieve_diseases_with_all_symptoms_tiered(self, symptoms: List[str], limit: int) -> Plan:
+        clean_symptoms = clean_symptom_list(symptoms or [])
+        if not clean_symptoms:
+            return []
+        try:
+            rows = yield Step((self.queries["diseases_one_trip"],), {"symptoms": clean_symptoms, "limit": limit})
+            return rows_to_tiered(rows)
+        except Exception as e:
+            print(f"[KG] retrieve_diseases_with_all_symptoms_tiered error for symptoms={symptoms}: {e}")
+            return []
+
+    def _get_all_symptoms_for_diseases_from_triples(self, kg_triples: List[Tuple[str, str, str]]) -> Plan:
+        # lowercased for matching, original names kept in the map
+        lower_to_original = disease_candidates(kg_triples or [])
+        if not lower_to_original:
+            return {}
+        try:
+            return rows_to_symptom_map((yield Step(self.queries["disease_symptoms"], {"diseases": list(lower_to_original)})))
+        except Exception as e:
+            print(f"[KG] get_all_symptoms_for_diseases_from_triples error: {e}")
+            return {}
+
+    # ---- sync surface ----
+    def ensure_schema(self) -> bool:
+        """
+        Create the name_lc indexes, backfill name_lc on Symptom/Disease nodes and wait for the
+        indexes to come online; reads then use the indexed queries. A migration, not a startup
+        step: run it once per database with `python -m services.kg_service` (services then
+        detect the indexes), and again after bulk loads that bypass insert_triples. Idempotent.
+        """
+        try:
+            with timed("neo4j schema"):
+                self._call(self._ensure_schema())
+        except Exception as e:
+            print(f"[KG] schema setup failed, using unindexed queries: {e}")
+            return False
+        self.queries = INDEXED_QUERIES
+        return True
+
+    def schema_ready(self) -> bool:
+        """True if the name_lc indexes are online and every Symptom/Disease node has name_lc."""
+        try:
+            return self._call(self._schema_ready())
+        except Exception as e:
+            print(f"[KG] schema check failed: {e}")
+            return False
+
+    def insert_triples(self, triples: List[Tuple[str,str,str]]):
+        return self._call(self._insert_triples(triples))
+
+    def snapshot_edges(self) -> List[Tuple[str, Optional[str]]]:
+        """All (disease, symptom) IS_SYMPTOM edges and (disease, None) per Disease without any; raises on connection errors."""
+        return self._call(self._snapshot_edges())
+
+    def retrieve_triples(self, q: str, limit: int = 20) -> List[Tuple[str,str,str]]:
+        """
+        Retrieve disease–symptom triples related to query q.
+        Tries label-specific schema first, then falls back to a generic schema.
+        """
+        return self._call(self._retrieve_triples(q, limit))
+
+    def retrieve_triples_many(self, symptoms: List[str], limit_per_symptom: int = 20) -> Dict[str, List[Tuple[str,str,str]]]:
+        """
+        retrieve_triples for a list of symptoms in one round trip (one UNWIND statement).
+        Returns {symptom: [distinct (s, p, o), ...]} in input order, at most
+        limit_per_symptom triples per symptom; duplicates in symptoms are queried once.
+        """
+        return self._call(self._retrieve_triples_many(symptoms, limit_per_symptom))
+
+    def find_similar_symptoms(self, target_symptoms: List[str]) -> List[str]:
+        """
+        Find symptoms in the database that are similar to the target symptoms.
+        This helps when exact matches don't exist.
+        """
+        return self._call(self._find_similar_symptoms(target_symptoms))
+
     def retrieve_diseases_with_all_symptoms(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str]]:
         """
         Retrieve diseases that have relationships with ALL the provided symptoms.
@@ -106,94 +583,18 @@ class KGService:
         Returns:
             List of tuples (disease, relationship, symptom) for diseases that have ALL symptoms
         """
-        if not symptoms:
-            return []
-        
-        # Clean and normalize symptoms
-        clean_symptoms = [s.strip().lower() for s in symptoms if s.strip()]
-        if not clean_symptoms:
-            return []
-        
-        # First try to find similar symptoms in the database
-        similar_symptoms = self.find_similar_symptoms(clean_symptoms)
-        
-        # Use similar symptoms if we found any, otherwise use original
-        search_symptoms = similar_symptoms if similar_symptoms else clean_symptoms
-        
-        try:
-            with self.driver.session() as session:
-                
-                # Primary: opinionated medical schema - find diseases that have ALL symptoms (exact match)
-                cypher_primary = """
-                MATCH (d:Disease)-[r:IS_SYMPTOM]->(s:Symptom)
-                WHERE toLower(s.name) IN $symptoms
-                WITH d, collect(DISTINCT s.name) as disease_symptoms
-                WHERE size(disease_symptoms) = $symptom_count
-                MATCH (d)-[r2:IS_SYMPTOM]->(s2:Symptom)
-                WHERE toLower(s2.name) IN $symptoms
-                RETURN d.name AS disease, type(r2) AS relationship, s2.name AS symptom
-                LIMIT $limit
-                """
-                
-                rows = list(session.run(
-                    cypher_primary, 
-                    symptoms=search_symptoms, 
-                    symptom_count=len(search_symptoms),
-                    limit=limit
-                ))
-                
-                if not rows:
-                    # Fallback: Use partial matching to find diseases with symptoms that contain our search terms
-                    cypher_partial = """
-                    MATCH (d:Disease)-[r:IS_SYMPTOM]->(s:Symptom)
-                    WHERE any(symptom IN $symptoms WHERE toLower(s.name) CONTAINS symptom)
-                    WITH d, collect(DISTINCT s.name) as disease_symptoms
-                    WHERE size(disease_symptoms) >= 2
-                    MATCH (d)-[r2:IS_SYMPTOM]->(s2:Symptom)
-                    WHERE any(symptom IN $symptoms WHERE toLower(s2.name) CONTAINS symptom)
-                    RETURN d.name AS disease, type(r2) AS relationship, s2.name AS symptom
-                    LIMIT $limit
-                    """
-                    rows = list(session.run(
-                        cypher_partial, 
-                        symptoms=search_symptoms, 
-                        limit=limit
-                    ))
-                    
-                    if not rows:
-                        # Final fallback: generic entity/relationship schema
-                        cypher_fallback = """
-                        MATCH (d)-[r]->(s)
-                        WHERE s.name IS NOT NULL AND toLower(s.name) IN $symptoms
-                        WITH d, collect(DISTINCT s.name) as disease_symptoms
-                        WHERE size(disease_symptoms) = $symptom_count
-                        MATCH (d)-[r2]->(s2)
-                        WHERE s2.name IS NOT NULL AND toLower(s2.name) IN $symptoms
-                        RETURN d.name AS disease, type(r2) AS relationship, s2.name AS symptom
-                        LIMIT $limit
-                        """
-                        rows = list(session.run(
-                            cypher_fallback, 
-                            symptoms=search_symptoms, 
-                            symptom_count=len(search_symptoms),
-                            limit=limit
-                        ))
-                
-                result: List[Tuple[str, str, str]] = []
-                for r in rows:
-                    try:
-                        disease = str(r.get("disease"))
-                        relationship = str(r.get("relationship"))
-                        symptom = str(r.get("symptom"))
-                        print(f"[KG] {disease} -[{relationship}]-> {symptom}")
-                        result.append((disease, relationship, symptom))
-                    except Exception:
-                        continue
-                return result
-                
-        except Exception as e:
-            print(f"[KG] retrieve_diseases_with_all_symptoms error for symptoms={symptoms}: {e}")
-            return []
+        return self._call(self._retrieve_diseases_with_all_symptoms(symptoms, limit))
+
+    def retrieve_diseases_with_all_symptoms_tiered(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str,str]]:
+        """
+        retrieve_diseases_with_all_symptoms in a single round trip: the similar-symptom
+        expansion and the exact / partial / generic-schema tiers run as one Cypher statement.
+
+        Returns:
+            List of tuples (tier, disease, relationship, symptom); tier is 'exact', 'partial'
+            or 'generic' and all rows come from the first tier that matched
+        """
+        return self._call(self._retrieve_diseases_with_all_symptoms_tiered(symptoms, limit))
 
     def get_all_symptoms_for_diseases_from_triples(self, kg_triples: List[Tuple[str, str, str]]) -> Dict[str, List[str]]:
         """
@@ -206,69 +607,77 @@ class KGService:
 
         Returns a mapping: disease_name -> [symptom_name, ...]
         """
-        if not kg_triples:
-            return {}
+        return self._call(self._get_all_symptoms_for_diseases_from_triples(kg_triples))
 
-        # Step 1: extract candidate disease names from triples
-        disease_candidates: Set[str] = set()
-        for s, p, o in kg_triples:
-            try:
-                predicate = (p or "").strip().upper()
-                if predicate == "IS_SYMPTOM":
-                    if isinstance(s, str) and s.strip():
-                        disease_candidates.add(s.strip())
-            except Exception:
-                continue
+    # ---- async surface ----
+    async def ainsert_triples(self, triples: List[Tuple[str,str,str]]):
+        return await self._acall(self._insert_triples(triples))
 
-        # Fallback: if none found via IS_SYMPTOM, consider all nodes and let DB filter by :Disease
-        if not disease_candidates:
-            for s, p, o in kg_triples:
-                if isinstance(s, str) and s.strip():
-                    disease_candidates.add(s.strip())
-                if isinstance(o, str) and o.strip():
-                    disease_candidates.add(o.strip())
+    async def aretrieve_triples(self, q: str, limit: int = 20) -> List[Tuple[str,str,str]]:
+        return await self._acall(self._retrieve_triples(q, limit))
 
-        if not disease_candidates:
-            return {}
+    async def aretrieve_triples_many(self, symptoms: List[str], limit_per_symptom: int = 20) -> Dict[str, List[Tuple[str,str,str]]]:
+        return await self._acall(self._retrieve_triples_many(symptoms, limit_per_symptom))
 
-        # Normalize to lowercase for matching, but preserve original via map
-        lower_to_original: Dict[str, str] = {name.lower(): name for name in disease_candidates}
-        disease_names_lower = list(lower_to_original.keys())
+    async def afind_similar_symptoms(self, target_symptoms: List[str]) -> List[str]:
+        return await self._acall(self._find_similar_symptoms(target_symptoms))
 
-        result: Dict[str, List[str]] = {}
-        try:
-            with self.driver.session() as session:
-                # Primary: opinionated medical schema
-                cypher_primary = """
-                MATCH (d:Disease)
-                WHERE toLower(d.name) IN $diseases
-                OPTIONAL MATCH (d)-[:IS_SYMPTOM]->(s:Symptom)
-                RETURN d.name AS disease, collect(DISTINCT s.name) AS symptoms
-                """
-                rows = list(session.run(cypher_primary, diseases=disease_names_lower))
-
-                if not rows:
-                    # Fallback: generic schema, filter on relationship type IS_SYMPTOM where possible
-                    cypher_fallback = """
-                    MATCH (d)
-                    WHERE d.name IS NOT NULL AND toLower(d.name) IN $diseases
-                    OPTIONAL MATCH (d)-[r]->(s)
-                    WHERE type(r) = 'IS_SYMPTOM' AND s.name IS NOT NULL
-                    RETURN d.name AS disease, collect(DISTINCT s.name) AS symptoms
-                    """
-                    rows = list(session.run(cypher_fallback, diseases=disease_names_lower))
-
-                for r in rows:
-                    try:
-                        disease = str(r.get("disease")) if r.get("disease") is not None else None
-                        symptoms_list = r.get("symptoms") or []
-                        clean_symptoms = [str(s) for s in symptoms_list if s]
-                        if disease:
-                            result[disease] = sorted(set(clean_symptoms))
-                    except Exception:
-                        continue
-        except Exception as e:
-            print(f"[KG] get_all_symptoms_for_diseases_from_triples error: {e}")
-            return {}
+    async def aretrieve_diseases_with_all_symptoms(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str]]:
+        return await self._acall(self._retrieve_diseases_with_all_symptoms(symptoms, limit))
+
+    async def aretrieve_diseases_with_all_symptoms_tiered(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str,str]]:
+        return await self._acall(self._retrieve_diseases_with_all_symptoms_tiered(symptoms, limit))
+
+    async def aget_all_symptoms_for_diseases_from_triples(self, kg_triples: List[Tuple[str, str, str]]) -> Dict[str, List[str]]:
+        return await self._acall(self._get_all_symptoms_for_diseases_from_triples(kg_triples))
+
+class KGService(KGQueries):
+    """KG service on the sync Neo4j driver; the a* coroutines run its plans on the shared blocking pool (services/aio.py)."""
+    def __init__(self, uri: Optional[str] = None, user: Optional[str] = None, password: Optional[str] = None):
+        from neo4j import GraphDatabase, basic_auth
+        uri = uri or CFG["neo4j"]["uri"]
+        user = user or CFG["neo4j"]["user"]
+        password = password or CFG["neo4j"]["password"]
+        # one pooled driver per process; resolve it through services.container rather than constructing KGService per call
+        with timed("neo4j driver"):
+            self.driver = GraphDatabase.driver(
+                uri, auth=basic_auth(user, password),
+                max_connection_pool_size=int(CFG["neo4j"].get("max_connection_pool_size", 50)),
+            )
+        self._select_queries()
+
+    def close(self):
+        self.driver.close()
+
+    def _execute(self, step: Step) -> list:
+        """Rows of the first query in step.tiers that returns any."""
+        with self.driver.session() as session:
+            for cypher in step.tiers:
+                rows = list(session.run(cypher, **step.params))
+                if rows:
+                    return rows
+        return []
+
+    def _call(self, plan: Plan) -> Any:
+        return drive(plan, self._execute)
+
+    async def _acall(self, plan: Plan) -> Any:
+        # Neo4j round trips on the blocking pool, so they don't stall the event loop serving other sessions
+        from services.aio import run_blocking
+        return await run_blocking(self._call, plan)
+
+def main():
+    import argparse
+    ap = argparse.ArgumentParser(description="Neo4j schema migration: create the name_lc indexes and backfill name_lc")
+    ap.parse_args()
+    kg = KGService()
+    try:
+        ok = kg.ensure_schema()
+    finally:
+        kg.close()
+    if not ok:
+        raise SystemExit(1)
+    print("[KG] name_lc indexes online; services with neo4j.schema \"detect\" use the indexed queries")
 
-        return result
\ No newline at end of file
+if __name__ == "__main__":
+    main()
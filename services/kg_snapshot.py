@@ -0,0 +1,286 @@
+# services/kg_snapshot.py
+import threading, time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from services.config import load_config
+from services.kg_service import clean_symptom_list, disease_candidates
+
+CFG = load_config()
+
+def _csr(rows: np.ndarray, cols: np.ndarray, n_rows: int) -> Tuple[np.ndarray, np.ndarray]:
+    """(indptr, indices) of the edges rows[i] -> cols[i]; cols of each row stay sorted."""
+    order = np.lexsort((cols, rows))
+    indptr = np.zeros(n_rows + 1, dtype="int64")
+    np.cumsum(np.bincount(rows, minlength=n_rows), out=indptr[1:])
+    return indptr, cols[order].astype("int32")
+
+class KGSnapshot:
+    """
+    Immutable in-memory copy of the Disease-IS_SYMPTOM->Symptom graph, built from
+    (disease, symptom) edges where (disease, None) records a Disease without symptoms.
+
+    Names are interned into two arrays and edges are stored twice in CSR form
+    (disease -> symptoms, symptom -> diseases). CONTAINS lookups on lowercase symptom
+    names go through a trigram index: the posting lists of the term's trigrams are
+    intersected and only the surviving names are checked with `in`. Terms shorter than
+    three characters match too many names for an index to help and are scanned.
+    """
+    def __init__(self, edges: Sequence[Tuple[str, Optional[str]]]):
+        self.loaded_at = time.time()
+        d_index: Dict[str, int] = {}
+        s_index: Dict[str, int] = {}
+        linked = [(d_index.setdefault(d, len(d_index)), s) for d, s in edges]
+        linked = [(d, s_index.setdefault(s, len(s_index))) for d, s in linked if s is not None]
+        d_ids = np.fromiter((d for d, _ in linked), dtype="int64", count=len(linked))
+        s_ids = np.fromiter((s for _, s in linked), dtype="int64", count=len(linked))
+        self.diseases: List[str] = list(d_index)
+        self.symptoms: List[str] = list(s_index)
+        if len(linked):
+            pairs = np.unique(d_ids * len(self.symptoms) + s_ids)
+            d_ids, s_ids = pairs // len(self.symptoms), pairs % len(self.symptoms)
+        self.n_edges = int(len(d_ids))
+        self.d_indptr, self.d_indices = _csr(d_ids, s_ids, len(self.diseases))
+        self.s_indptr, self.s_indices = _csr(s_ids, d_ids, len(self.symptoms))
+        self.d_by_lower: Dict[str, List[int]] = {}
+        for i, name in enumerate(self.diseases):
+            self.d_by_lower.setdefault(name.lower(), []).append(i)
+        self.s_by_lower: Dict[str, List[int]] = {}
+        for i, name in enumerate(self.symptoms):
+            self.s_by_lower.setdefault(name.lower(), []).append(i)
+        lowered = [n.lower() for n in self.symptoms]
+        self._lowered = lowered
+        grams: Dict[str, List[int]] = {}
+        for i, name in enumerate(lowered):
+            for g in {name[j:j + 3] for j in range(len(name) - 2)}:
+                grams.setdefault(g, []).append(i)
+        self._trigrams: Dict[str, np.ndarray] = {g: np.array(ids, dtype="int32") for g, ids in grams.items()}
+
+    def symptoms_of(self, d: int) -> np.ndarray:
+        return self.d_indices[self.d_indptr[d]:self.d_indptr[d + 1]]
+
+    def diseases_of(self, s: int) -> np.ndarray:
+        return self.s_indices[self.s_indptr[s]:self.s_indptr[s + 1]]
+
+    def symptoms_containing(self, term: str) -> List[int]:
+        """Ids of symptoms whose lowercase name contains term (as toLower(s.name) CONTAINS term)."""
+        if len(term) >= 3:
+            postings = [self._trigrams.get(g) for g in {term[j:j + 3] for j in range(len(term) - 2)}]
+            if any(p is None for p in postings):
+                return []
+            postings.sort(key=len)
+            cand = postings[0]
+            for p in postings[1:]:
+                cand = np.intersect1d(cand, p, assume_unique=True)
+                if not len(cand):
+                    return []
+            return [i for i in cand.tolist() if term in self._lowered[i]]
+        return [i for i, name in enumerate(self._lowered) if term in name]
+
+    def _triples(self, tier: str, d_ids, s_wanted: np.ndarray, limit: int) -> List[Tuple[str, str, str, str]]:
+        out: List[Tuple[str, str, str, str]] = []
+        for d in d_ids:
+            linked = self.symptoms_of(int(d))
+            for s in linked[np.isin(linked, s_wanted)]:
+                out.append((tier, self.diseases[d], "IS_SYMPTOM", self.symptoms[s]))
+                if len(out) >= limit:
+                    return out
+        return out
+
+    # ---- the KGService reads; None means "not answerable here", ask Neo4j ----
+    def retrieve_triples(self, q: str, limit: int = 20) -> Optional[List[Tuple[str, str, str]]]:
+        out: List[Tuple[str, str, str]] = []
+        for s in self.symptoms_containing(q.lower()):
+            for d in self.diseases_of(s):
+                out.append((self.diseases[d], "IS_SYMPTOM", self.symptoms[s]))
+                if len(out) >= limit:
+                    return out
+        return out or None
+
+    def find_similar_symptoms(self, targets: List[str]) -> List[str]:
+        ids = {s for t in targets for s in self.symptoms_containing(t)}
+        return sorted(self.symptoms[s] for s in ids)
+
+    def retrieve_diseases_with_all_symptoms(self, symptoms: List[str], limit: int = 100) -> Optional[List[Tuple[str, str, str]]]:
+        out = self.retrieve_diseases_with_all_symptoms_tiered(symptoms, limit)
+        return None if out is None else [t[1:] for t in out]
+
+    def retrieve_diseases_with_all_symptoms_tiered(self, symptoms: List[str], limit: int = 100) -> Optional[List[Tuple[str, str, str, str]]]:
+        clean = clean_symptom_list(symptoms)
+        if not clean:
+            return []
+        search = self.find_similar_symptoms(clean) or clean
+        # exact: diseases linked to as many distinct matching names as there are search symptoms
+        s_ids = np.array([s for name in set(search) for s in self.s_by_lower.get(name, ())], dtype="int64")
+        d_ids = self._diseases_with(s_ids, lambda n: n == len(search))
+        if len(d_ids):
+            return self._triples("exact", d_ids, s_ids, limit)
+        # partial: diseases with at least two distinct symptoms containing a search term
+        s_ids = np.array(sorted({s for t in search for s in self.symptoms_containing(t)}), dtype="int64")
+        d_ids = self._diseases_with(s_ids, lambda n: n >= 2)
+        if len(d_ids):
+            return self._triples("partial", d_ids, s_ids, limit)
+        return None     # Neo4j still has the generic-schema tier
+
+    def _diseases_with(self, s_ids: np.ndarray, accept) -> np.ndarray:
+        """Diseases whose count of distinct linked symptom names among s_ids satisfies accept(count)."""
+        seen = {(int(d), self.symptoms[s]) for s in s_ids.tolist() for d in self.diseases_of(s)}
+        counts: Dict[int, int] = {}
+        for d, _ in seen:
+            counts[d] = counts.get(d, 0) + 1
+        return np.array(sorted(d for d, n in counts.items() if accept(n)), dtype="int64")
+
+    def get_all_symptoms_for_diseases_from_triples(self, kg_triples: List[Tuple[str, str, str]]) -> Optional[Dict[str, List[str]]]:
+        lower_to_original = disease_candidates(kg_triples)
+        d_ids = [d for name in lower_to_original for d in self.d_by_lower.get(name, ())]
+        if not d_ids:
+            return None
+        result: Dict[str, List[str]] = {}
+        for d in d_ids:
+            result[self.diseases[d]] = sorted({self.symptoms[s] for s in self.symptoms_of(d)})
+        return result
+
+class SnapshotKG:
+    """
+    KG service that answers disease-symptom reads from a KGSnapshot and falls back to the
+    wrapped Neo4j service (KGService or AsyncKGService) on a snapshot miss, before the
+    first load, or when loading failed. Writes and anything else go straight to the
+    backend. The snapshot is rebuilt every `refresh_seconds` by a daemon thread and on
+    refresh(); readers keep using the old snapshot until the new one is swapped in.
+    Callbacks registered with add_refresh_listener() run after each successful swap.
+    """
+    def __init__(self, backend: Any, refresh_seconds: Optional[float] = None):
+        scfg = CFG.get("kg_snapshot") or {}
+        self.backend = backend
+        self.refresh_seconds = float(refresh_seconds if refresh_seconds is not None else scfg.get("refresh_seconds", 600))
+        self.snapshot: Optional[KGSnapshot] = None
+        self.hits = 0
+        self.misses = 0
+        self._refresh_lock = threading.Lock()
+        self._listeners: List[Callable[[], None]] = []
+        self._stop = threading.Event()
+        self.refresh()
+        self._thread = None
+        if self.refresh_seconds > 0:
+            self._thread = threading.Thread(target=self._refresh_loop, name="kg-snapshot", daemon=True)
+            self._thread.start()
+
+    def __getattr__(self, name: str):
+        return getattr(self.backend, name)
+
+    def add_refresh_listener(self, fn: Callable[[], None]):
+        """Call `fn()` after every successful refresh, e.g. to drop results cached from the old snapshot."""
+        self._listeners.append(fn)
+
+    def refresh(self) -> bool:
+        """Reload the snapshot from Neo4j; keeps the previous one if loading fails."""
+        with self._refresh_lock:
+            t0 = time.perf_counter()
+            try:
+                snap = KGSnapshot(self.backend.snapshot_edges())
+            except Exception as e:
+                print(f"[KG] snapshot refresh failed, serving from Neo4j: {e}")
+                return False
+            self.snapshot = snap
+            print(f"[KG] snapshot: {len(snap.diseases)} diseases, {len(snap.symptoms)} symptoms, "
+                  f"{snap.n_edges} edges in {time.perf_counter() - t0:.2f}s")
+        for fn in list(self._listeners):
+            try:
+                fn()
+            except Exception as e:
+                print(f"[KG] snapshot refresh listener failed: {e}")
+        return True
+
+    def _refresh_loop(self):
+        while not self._stop.wait(self.refresh_seconds):
+            self.refresh()
+
+    def close(self):
+        self._stop.set()
+        self.backend.close()
+
+    def stats(self) -> Dict[str, Any]:
+        snap = self.snapshot
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "hit_rate": (self.hits / total) if total else 0.0,
+                "edges": snap.n_edges if snap else 0, "age_seconds": (time.time() - snap.loaded_at) if snap else None}
+
+    def _local(self, method: str, *args):
+        snap = self.snapshot
+        out = getattr(snap, method)(*args) if snap is not None else None
+        if out is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return out
+
+    def retrieve_triples(self, q: str, limit: int = 20) -> List[Tuple[str,str,str]]:
+        if not q:
+            return []
+        out = self._local("retrieve_triples", q, limit)
+        return out if out is not None else self.backend.retrieve_triples(q, limit)
+
+    def _many_local(self, symptoms: List[str], limit_per_symptom: int) -> Tuple[Dict[str, List[Tuple[str,str,str]]], List[str]]:
+        """Snapshot answers per symptom, plus the symptoms it missed."""
+        qs = list(dict.fromkeys(s for s in symptoms or [] if s))
+        result: Dict[str, List[Tuple[str,str,str]]] = {}
+        missed: List[str] = []
+        for q in qs:
+            out = self._local("retrieve_triples", q, limit_per_symptom)
+            if out is None:
+                missed.append(q)
+            result[q] = out
+        return result, missed
+
+    def retrieve_triples_many(self, symptoms: List[str], limit_per_symptom: int = 20) -> Dict[str, List[Tuple[str,str,str]]]:
+        result, missed = self._many_local(symptoms, limit_per_symptom)
+        if missed:
+            result.update(self.backend.retrieve_triples_many(missed, limit_per_symptom))
+        return result
+
+    def retrieve_diseases_with_all_symptoms(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str]]:
+        if not symptoms:
+            return []
+        out = self._local("retrieve_diseases_with_all_symptoms", symptoms, limit)
+        return out if out is not None else self.backend.retrieve_diseases_with_all_symptoms(symptoms, limit)
+
+    def retrieve_diseases_with_all_symptoms_tiered(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str,str]]:
+        if not symptoms:
+            return []
+        out = self._local("retrieve_diseases_with_all_symptoms_tiered", symptoms, limit)
+        return out if out is not None else self.backend.retrieve_diseases_with_all_symptoms_tiered(symptoms, limit)
+
+    def get_all_symptoms_for_diseases_from_triples(self, kg_triples: List[Tuple[str, str, str]]) -> Dict[str, List[str]]:
+        if not kg_triples:
+            return {}
+        out = self._local("get_all_symptoms_for_diseases_from_triples", kg_triples)
+        return out if out is not None else self.backend.get_all_symptoms_for_diseases_from_triples(kg_triples)
+
+    async def aretrieve_triples(self, q: str, limit: int = 20) -> List[Tuple[str,str,str]]:
+        if not q:
+            return []
+        out = self._local("retrieve_triples", q, limit)
+        return out if out is not None else await self.backend.aretrieve_triples(q, limit)
+
+    async def aretrieve_triples_many(self, symptoms: List[str], limit_per_symptom: int = 20) -> Dict[str, List[Tuple[str,str,str]]]:
+        result, missed = self._many_local(symptoms, limit_per_symptom)
+        if missed:
+            result.update(await self.backend.aretrieve_triples_many(missed, limit_per_symptom))
+        return result
+
+    async def aretrieve_diseases_with_all_symptoms(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str]]:
+        if not symptoms:
+            return []
+        out = self._local("retrieve_diseases_with_all_symptoms", symptoms, limit)
+        return out if out is not None else await self.backend.aretrieve_diseases_with_all_symptoms(symptoms, limit)
+
+    async def aretrieve_diseases_with_all_symptoms_tiered(self, symptoms: List[str], limit: int = 100) -> List[Tuple[str,str,str,str]]:
+        if not symptoms:
+            return []
+        out = self._local("retrieve_diseases_with_all_symptoms_tiered", symptoms, limit)
+        return out if out is not None else await self.backend.aretrieve_diseases_with_all_symptoms_tiered(symptoms, limit)
+
+    async def aget_all_symptoms_for_diseases_from_triples(self, kg_triples: List[Tuple[str, str, str]]) -> Dict[str, List[str]]:
+        if not kg_triples:
+            return {}
+        out = self._local("get_all_symptoms_for_diseases_from_triples", kg_triples)
+        return out if out is not None else await self.backend.aget_all_symptoms_for_diseases_from_triples(kg_triples)
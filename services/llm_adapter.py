@@ -1,25 +1,29 @@
 # services/llm_adapter.py
-import yaml, os
+import os
 from typing import List, Dict, Any, Optional
+from services.config import load_config
+from services.startup import timed
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_dir, "..","config", "config.yaml")
-cfg = yaml.safe_load(open(config_path,"r",encoding="utf-8"))
+cfg = load_config()
 PROVIDER = cfg["llm"]["provider"].lower()
 
-# Import provider adapters lazily
-if PROVIDER == "ollama":
-    from langchain_ollama import ChatOllama as ChatModel
-elif PROVIDER == "openai":
-    from langchain_openai import ChatOpenAI as ChatModel
-# elif PROVIDER == "anthropic":
-#     from langchain_anthropic import ChatAnthropic as ChatModel
-else:
-    raise RuntimeError(f"Unsupported LLM provider: {PROVIDER}")
+def _chat_model_cls():
+    # Import provider adapters lazily: the langchain provider packages are slow to import
+    with timed(f"llm provider {PROVIDER}"):
+        if PROVIDER == "ollama":
+            from langchain_ollama import ChatOllama as ChatModel
+        elif PROVIDER == "openai":
+            from langchain_openai import ChatOpenAI as ChatModel
+        # elif PROVIDER == "anthropic":
+        #     from langchain_anthropic import ChatAnthropic as ChatModel
+        else:
+            raise RuntimeError(f"Unsupported LLM provider: {PROVIDER}")
+    return ChatModel
 
 class LLMAdapter:
     def __init__(self, model_name: Optional[str] = None, temperature: Optional[float] = None, max_tokens: Optional[int] = None):
         llm_conf = cfg["llm"]
+        ChatModel = _chat_model_cls()
         model = model_name or llm_conf.get("model_name")
         temp = temperature if temperature is not None else llm_conf.get("temperature", 0.0)
         self.max_tokens = max_tokens or llm_conf.get("max_tokens", 512)
@@ -1,14 +1,18 @@
 # services/mcp.py
 import hashlib, json, os, math
 from typing import List, Dict, Any, Tuple
-import tiktoken
+
+_encodings: Dict[str, Any] = {}
 
 def make_id(text: str) -> str:
     return hashlib.sha256(text.encode("utf-8")).hexdigest()[:12]
 
 def approx_tokens(text: str, enc_name: str = "cl100k_base") -> int:
     try:
-        enc = tiktoken.get_encoding(enc_name)
+        enc = _encodings.get(enc_name)
+        if enc is None:
+            import tiktoken
+            enc = _encodings[enc_name] = tiktoken.get_encoding(enc_name)
         return len(enc.encode(text))
     except Exception:
         return max(1, math.ceil(len(text)/4))
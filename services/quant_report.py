@@ -0,0 +1,87 @@
+# services/quant_report.py
+"""
+Memory footprint and recall@k of compressed index types against exact (flat) search.
+
+Uses the full-precision vectors of an existing index (`<index>.vectors`, or the flat
+index itself), holds out a query sample and reports, per candidate type, the index
+size and recall@k with and without exact re-ranking.
+
+    python -m services.quant_report --index-file data/faiss_general.index --types sq8 pq ivf_pq
+"""
+import argparse, os, time
+from typing import Dict, List
+import faiss, numpy as np
+from services import index_versions
+from services.config import load_config
+from services.faiss_index import make_index, set_search_params, train_index
+from services.vector_store import VectorStore
+
+CFG = load_config()
+
+def load_vectors(index_file: str, dim: int) -> np.ndarray:
+    if os.path.exists(index_file + ".vectors"):
+        store = VectorStore(index_file, dim)
+        return np.asarray(store.get(np.arange(len(store))))
+    index = faiss.read_index(index_file)
+    if not isinstance(index, faiss.IndexFlat):
+        raise SystemExit(f"[quant_report] {index_file} is {type(index).__name__}; need a flat index or a .vectors file")
+    return index.reconstruct_n(0, index.ntotal)
+
+def recall_at_k(truth: np.ndarray, found: np.ndarray, k: int) -> float:
+    hits = sum(len(set(t[:k]) & set(f[:k])) for t, f in zip(truth, found))
+    return hits / float(len(truth) * k)
+
+def evaluate(vecs: np.ndarray, queries: np.ndarray, types: List[str], k: int, rerank_factor: int) -> List[Dict[str, float]]:
+    dim = vecs.shape[1]
+    flat = faiss.IndexFlatL2(dim); flat.add(vecs)
+    _, truth = flat.search(queries, k)
+    rows = []
+    for t in ["flat"] + [t for t in types if t != "flat"]:
+        index = make_index(dim, t)
+        try:
+            train_index(index, vecs)
+        except RuntimeError as e:
+            print(f"[quant_report] skipping {t}: {e}")
+            continue
+        index.add(vecs)
+        set_search_params(index)
+        t0 = time.perf_counter()
+        _, found = index.search(queries, k)
+        ms = (time.perf_counter() - t0) * 1000 / len(queries)
+        row = {"type": t, "bytes": len(faiss.serialize_index(index)), "recall": recall_at_k(truth, found, k), "ms_per_query": ms}
+        if t != "flat":
+            _, cand = index.search(queries, k * rerank_factor)
+            reranked = []
+            for q, c in zip(queries, cand):
+                c = c[c >= 0]
+                order = np.argsort(((vecs[c] - q) ** 2).sum(1), kind="stable")[:k]
+                reranked.append(c[order])
+            row["recall_rerank"] = recall_at_k(truth, reranked, k)
+        rows.append(row)
+    return rows
+
+def main():
+    ap = argparse.ArgumentParser(description="Compare compressed FAISS index types against exact search")
+    ap.add_argument("--index-file", default=CFG["faiss"]["general_index"])
+    ap.add_argument("--types", nargs="+", default=["sq8", "pq", "ivf_sq8", "ivf_pq"])
+    ap.add_argument("--queries", type=int, default=500, help="vectors held out as queries")
+    ap.add_argument("--k", type=int, default=10)
+    ap.add_argument("--rerank-factor", type=int, default=int(CFG["faiss"].get("rerank_factor", 4)))
+    args = ap.parse_args()
+    prefix, _ = index_versions.resolve(args.index_file)
+    manifest = index_versions.read_manifest(prefix) or {}
+    vecs = load_vectors(prefix, int(manifest.get("dim") or CFG["faiss"]["dim"]))
+    rng = np.random.default_rng(0)
+    q_idx = rng.choice(len(vecs), size=min(args.queries, len(vecs) // 10 or 1), replace=False)
+    queries = vecs[q_idx]
+    base = np.delete(vecs, q_idx, axis=0)
+    print(f"[quant_report] {len(base)} vectors (dim={base.shape[1]}), {len(queries)} queries, k={args.k}")
+    print(f"{'type':<10}{'size MB':>10}{'vs flat':>9}{'recall@k':>10}{'+rerank':>9}{'ms/q':>8}")
+    rows = evaluate(base, queries, args.types, args.k, args.rerank_factor)
+    flat_bytes = rows[0]["bytes"]
+    for r in rows:
+        rr = f"{r['recall_rerank']:.3f}" if "recall_rerank" in r else "-"
+        print(f"{r['type']:<10}{r['bytes'] / 1e6:>10.1f}{r['bytes'] / flat_bytes:>9.2f}{r['recall']:>10.3f}{rr:>9}{r['ms_per_query']:>8.2f}")
+
+if __name__ == "__main__":
+    main()
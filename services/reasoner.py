@@ -1,11 +1,8 @@
 # services/reasoner.py
 from typing import Dict, Any, Optional
-import yaml
 from services.llm_adapter import LLMAdapter
-import os
-base_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_dir, "..","config", "config.yaml")
-CFG = yaml.safe_load(open(config_path,"r",encoding="utf-8"))
+from services.config import load_config
+CFG = load_config()
 
 class MCPReasoner:
     def __init__(self, llm: LLMAdapter = None, model_key: str = None):
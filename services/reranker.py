@@ -0,0 +1,86 @@
+# services/reranker.py
+import math, time
+from typing import Dict, List, Optional, Tuple
+from services.config import load_config
+from services.result_cache import ResultCache, normalize_query
+from services.startup import timed
+
+CFG = load_config()
+
+class Reranker:
+    """
+    Second retrieval stage: re-orders a first-stage candidate list with a cross-encoder.
+
+    Only the first `candidates` hits are scored, in first-stage order and in batches of
+    `batch_size`, and scoring stops once `budget_ms` is spent; candidates left unscored
+    keep their first-stage order behind the scored ones. (query, passage) scores are
+    cached with a TTL so repeated queries skip the model. Returned distances are
+    1 - sigmoid(score), so smaller is still better.
+    """
+    def __init__(self, model_name: Optional[str] = None, candidates: int = None, budget_ms: float = None,
+                 batch_size: int = None, enabled: Optional[bool] = None):
+        rcfg = CFG.get("reranker") or {}
+        self.enabled = bool(rcfg.get("enabled", False) if enabled is None else enabled)
+        self.model_name = model_name or rcfg.get("model", "cross-encoder/ms-marco-MiniLM-L-6-v2")
+        self.candidates = int(candidates or rcfg.get("candidates", 40))
+        self.budget = float(budget_ms if budget_ms is not None else rcfg.get("budget_ms", 150)) / 1000.0
+        self.batch_size = int(batch_size or rcfg.get("batch_size", 16))
+        self.cache = ResultCache(int(rcfg.get("cache_items", 20000)), float(rcfg.get("cache_ttl_seconds", 3600)))
+        self.model = None
+        self.over_budget = 0
+
+    def _model(self):
+        if self.model is None:
+            from sentence_transformers import CrossEncoder
+            with timed(f"cross-encoder {self.model_name}"):
+                self.model = CrossEncoder(self.model_name)
+        return self.model
+
+    def warm(self):
+        """Load the cross-encoder now; returns it, or None (and disables reranking) if it cannot load."""
+        try:
+            return self._model()
+        except Exception as e:
+            print(f"[reranker] {self.model_name} unavailable, keeping first-stage order: {e}")
+            self.enabled = False
+            return None
+
+    def rerank(self, query: str, hits: List[Tuple[str, float]], top_k: int) -> List[Tuple[str, float]]:
+        """Re-order first-stage (text, distance) hits for query; returns the best top_k."""
+        if not self.enabled or len(hits) <= 1 or not query:
+            return hits[:top_k]
+        pool = hits[:self.candidates]
+        q = normalize_query(query)
+        scores: Dict[int, float] = {}
+        todo = []
+        for i, (text, _) in enumerate(pool):
+            s = self.cache.get((q, text))
+            if s is None:
+                todo.append(i)
+            else:
+                scores[i] = s
+        model = self.warm() if todo else None
+        if todo and model is None:
+            return hits[:top_k]
+        # the budget covers scoring only: a first call's model load must not use it up
+        t0 = time.perf_counter()
+        for start in range(0, len(todo), self.batch_size):
+            if time.perf_counter() - t0 > self.budget:
+                self.over_budget += 1
+                break
+            part = todo[start:start + self.batch_size]
+            for i, s in zip(part, model.predict([(query, pool[i][0]) for i in part])):
+                scores[i] = float(s)
+                self.cache.put((q, pool[i][0]), scores[i])
+        scored = sorted(scores, key=lambda i: -scores[i])
+        out = [(pool[i][0], 1.0 - 1.0 / (1.0 + math.exp(-scores[i]))) for i in scored]
+        out += [(pool[i][0], 1.0) for i in range(len(pool)) if i not in scores]
+        return out[:top_k]
+
+    async def arerank(self, query: str, hits: List[Tuple[str, float]], top_k: int) -> List[Tuple[str, float]]:
+        from services.aio import run_blocking
+        return await run_blocking(self.rerank, query, hits, top_k)
+
+    def first_stage_k(self, top_k: int) -> int:
+        """How many hits the first stage should return for a final top_k."""
+        return max(top_k, self.candidates) if self.enabled else top_k
@@ -0,0 +1,57 @@
+# services/result_cache.py
+import re, threading, time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+_MISSING = object()
+
+def normalize_query(q: str) -> str:
+    """Case- and whitespace-insensitive form of a query, used in cache keys."""
+    return re.sub(r"\s+", " ", str(q)).strip().lower()
+
+class ResultCache:
+    """
+    Bounded LRU of computed results with a time-to-live.
+
+    Callers put whatever identifies the data a result was computed from (e.g. an index
+    version) into the key, so bumping that version makes stale entries unreachable; they
+    then age out of the LRU. ttl <= 0 disables expiry.
+    """
+    def __init__(self, max_items: int = 10000, ttl: float = 600.0):
+        self.max_items = max_items
+        self.ttl = ttl
+        self.lru: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.expired = 0
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        with self.lock:
+            entry = self.lru.get(key, _MISSING)
+            if entry is not _MISSING:
+                stamp, value = entry
+                if self.ttl <= 0 or time.monotonic() - stamp < self.ttl:
+                    self.lru.move_to_end(key)
+                    self.hits += 1
+                    return value
+                del self.lru[key]
+                self.expired += 1
+            self.misses += 1
+            return default
+
+    def put(self, key: Hashable, value: Any):
+        with self.lock:
+            self.lru[key] = (time.monotonic(), value)
+            self.lru.move_to_end(key)
+            while len(self.lru) > self.max_items:
+                self.lru.popitem(last=False)
+
+    def clear(self):
+        with self.lock:
+            self.lru.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {"hits": self.hits, "misses": self.misses, "expired": self.expired,
+                "hit_rate": (self.hits / total) if total else 0.0, "size": len(self.lru)}
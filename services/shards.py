@@ -0,0 +1,263 @@
+# services/shards.py
+"""
+Sharded search of a base FAISS index across worker processes.
+
+The base index is split into N contiguous id ranges written as `<prefix>.shard.<gen>.NN`
+(listed in `<prefix>.shards`; `gen` names the base file they were split from). Shards
+copy the base's stored codes (flat/SQ/PQ codes, IVF inverted lists) rather than
+re-adding reconstructed vectors, so a compressed base is never quantised twice.
+
+Every ShardPool in the process (one per base index, across compactions and federated
+indexes) submits to one shared process pool. Its workers memory-map shard files on first
+use (IO_FLAG_MMAP_IFC for flat shards) and keep the most recently used ones open, so the
+OS page cache shares them between workers. A query batch is scattered to every shard
+and the per-shard top-k lists are merged.
+"""
+import glob, json, os, threading, time
+import multiprocessing as mp
+from collections import Counter, OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional, Tuple
+import faiss, numpy as np
+from services.faiss_index import is_flat_file, merge_topk, read_index, search_subset, set_search_params, write_index_atomic
+
+# vectors copied into a shard per block (flat codes / HNSW)
+COPY_BLOCK = 65536
+# shard files a worker keeps open
+OPEN_SHARDS = 64
+
+def shard_manifest_path(prefix: str) -> str:
+    return prefix + ".shards"
+
+def _base_stamp(prefix: str) -> Dict[str, int]:
+    st = os.stat(prefix)
+    return {"size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+def read_shards(prefix: str, n_shards: int) -> Optional[List[Dict]]:
+    """Shard entries for the base index at prefix, or None if missing or built from another base file."""
+    try:
+        with open(shard_manifest_path(prefix), "r", encoding="utf-8") as f:
+            manifest = json.load(f)
+    except (FileNotFoundError, ValueError):
+        return None
+    if manifest.get("base") != _base_stamp(prefix) or len(manifest.get("shards", [])) != n_shards:
+        return None
+    dirname = os.path.dirname(prefix)
+    if not all(os.path.exists(os.path.join(dirname, s["file"])) for s in manifest["shards"]):
+        return None
+    return manifest["shards"]
+
+def empty_copy(prefix: str) -> bytes:
+    """A serialized, trained but empty index of the same type as the one stored at prefix."""
+    if is_flat_file(prefix):
+        index = faiss.read_index(prefix, faiss.IO_FLAG_MMAP_IFC | faiss.IO_FLAG_READ_ONLY)
+        return faiss.serialize_index(faiss.IndexFlat(index.d, index.metric_type))
+    index = faiss.read_index(prefix, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    if hasattr(index, "replace_invlists"):
+        # IVF: keep the quantizer, swap the memory-mapped lists for empty in-RAM ones
+        lists = faiss.ArrayInvertedLists(index.nlist, index.code_size)
+        index.replace_invlists(lists, False)
+        index.ntotal = 0
+        return faiss.serialize_index(index)     # before `lists` goes out of scope
+    # PQ/SQ codes and HNSW graphs cannot be emptied in place: one in-RAM copy
+    index = faiss.read_index(prefix)
+    index.reset()
+    return faiss.serialize_index(index)
+
+def _copy_ivf(base, shard, start: int, count: int):
+    """Copy the inverted-list entries with ids in [start, start + count) into shard, as local ids."""
+    invlists = base.invlists
+    for lst in range(base.nlist):
+        size = invlists.list_size(lst)
+        if not size:
+            continue
+        ids_ptr, codes_ptr = invlists.get_ids(lst), invlists.get_codes(lst)
+        try:
+            ids = faiss.rev_swig_ptr(ids_ptr, size)
+            keep = (ids >= start) & (ids < start + count)
+            if keep.any():
+                local = np.ascontiguousarray(ids[keep] - start)
+                codes = np.ascontiguousarray(
+                    faiss.rev_swig_ptr(codes_ptr, size * invlists.code_size).reshape(size, invlists.code_size)[keep])
+                shard.invlists.add_entries(lst, len(local), faiss.swig_ptr(local), faiss.swig_ptr(codes))
+                shard.ntotal += len(local)
+        finally:
+            invlists.release_ids(lst, ids_ptr)
+            invlists.release_codes(lst, codes_ptr)
+
+def _copy_range(base, shard, start: int, count: int):
+    """Fill shard with base's vectors [start, start + count), copying stored codes where the type allows."""
+    if hasattr(base, "invlists"):
+        _copy_ivf(base, shard, start, count)
+        return
+    codes = None
+    if hasattr(base, "codes") and hasattr(base, "code_size"):
+        # IndexFlat / IndexScalarQuantizer / IndexPQ: a view of the (memory-mapped) code array
+        codes = faiss.rev_swig_ptr(base.codes.data(), base.ntotal * base.code_size).reshape(base.ntotal, base.code_size)
+    for block in range(start, start + count, COPY_BLOCK):
+        n = min(COPY_BLOCK, start + count - block)
+        if codes is not None:
+            shard.add_sa_codes(np.ascontiguousarray(codes[block:block + n]))
+        else:
+            # HNSW keeps full vectors, so reconstructing them is exact
+            shard.add(base.reconstruct_n(block, n))
+
+def write_shards(prefix: str, n_shards: int) -> List[Dict]:
+    """
+    Split the index stored at prefix into n_shards contiguous shards next to it. Codes are
+    read from a memory-mapped view, so only the shard being written is held in RAM.
+    """
+    t0 = time.time()
+    base, _ = read_index(prefix, use_mmap=True)
+    empty = empty_copy(prefix)
+    dirname = os.path.dirname(prefix)
+    stamp = _base_stamp(prefix)
+    gen = f"{stamp['mtime_ns']:x}"
+    per = -(-base.ntotal // n_shards) if base.ntotal else 0
+    shards = []
+    for i in range(n_shards):
+        start, count = i * per, max(0, min(per, base.ntotal - i * per))
+        shard = faiss.deserialize_index(empty)
+        _copy_range(base, shard, start, count)
+        name = f"{os.path.basename(prefix)}.shard.{gen}.{i:02d}"
+        write_index_atomic(shard, os.path.join(dirname, name))
+        shards.append({"file": name, "start": start, "count": count})
+    path = shard_manifest_path(prefix)
+    with open(path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"base": stamp, "shards": shards}, f)
+    os.replace(path + ".tmp", path)
+    _remove_stale(prefix)
+    print(f"[shards] split {base.ntotal} vectors of {prefix} into {n_shards} shards in {time.time() - t0:.1f}s")
+    return shards
+
+# shard files held by open ShardPools in this process: never deleted under a search
+_live_files: "Counter[str]" = Counter()
+_live_lock = threading.Lock()
+
+def _remove_stale(prefix: str):
+    """Delete shard files of prefix that are neither listed in its manifest nor held by a ShardPool."""
+    try:
+        with open(shard_manifest_path(prefix), "r", encoding="utf-8") as f:
+            listed = {s["file"] for s in json.load(f).get("shards", [])}
+    except (FileNotFoundError, ValueError):
+        listed = set()
+    with _live_lock:
+        for path in glob.glob(glob.escape(prefix) + ".shard.*"):
+            if os.path.basename(path) not in listed and not _live_files[path]:
+                os.remove(path)
+
+# ---- the shared worker pool: any worker serves any shard, opening its file on first use ----
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+_open: "OrderedDict[str, Any]" = OrderedDict()
+
+def search_pool(workers: int, threads: int = 1) -> ProcessPoolExecutor:
+    """The process-wide shard search pool; created on first use with `workers` processes."""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            ctx = mp.get_context("spawn")   # never fork a process that already runs torch/faiss threads
+            _pool = ProcessPoolExecutor(max_workers=max(1, workers), mp_context=ctx, initializer=_init_worker,
+                                        initargs=(threads,))
+        return _pool
+
+def shutdown_search_pool():
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+def _init_worker(threads: int):
+    faiss.omp_set_num_threads(max(1, threads))
+
+def _shard(path: str):
+    index = _open.get(path)
+    if index is None:
+        # shards of retired bases are deleted once drained: unmap them rather than wait for the LRU
+        for gone in [p for p in _open if not os.path.exists(p)]:
+            del _open[gone]
+        index, _ = read_index(path)
+        set_search_params(index)
+        _open[path] = index
+        while len(_open) > OPEN_SHARDS:
+            _open.popitem(last=False)
+    _open.move_to_end(path)
+    return index
+
+def _search_shard(path: str, x: np.ndarray, k: int, ids: Optional[np.ndarray]) -> Tuple[np.ndarray, np.ndarray]:
+    shard = _shard(path)
+    if ids is not None:
+        return search_subset(shard, x, k, ids)
+    return shard.search(x, k)
+
+class ShardPool:
+    """
+    Scatter/gather search over the shards of one base index, on the shared search pool.
+
+    Searches hold it with acquire()/release(); retire() closes it once they have finished,
+    so a compaction can swap in the shards of the new base while older searches drain.
+    Closing deletes its shard files unless the manifest still lists them.
+    """
+    def __init__(self, prefix: str, shards: List[Dict], workers: int = 0, threads: int = 1):
+        self.prefix = prefix
+        self.shards = [s for s in shards if s["count"]]
+        dirname = os.path.dirname(prefix)
+        self.paths = [os.path.join(dirname, s["file"]) for s in self.shards]
+        self._cond = threading.Condition()
+        self._inflight = 0
+        self._retired = False
+        self.closed = False
+        with _live_lock:
+            _live_files.update(self.paths)
+        self.pool = search_pool(workers or len(self.shards), threads)
+
+    @property
+    def ntotal(self) -> int:
+        return sum(s["count"] for s in self.shards)
+
+    def search(self, x: np.ndarray, k: int, ids: Optional[np.ndarray] = None) -> Tuple[np.ndarray, np.ndarray]:
+        futures = []
+        for shard, path in zip(self.shards, self.paths):
+            start, count = shard["start"], shard["count"]
+            local = None
+            if ids is not None:
+                local = ids[(ids >= start) & (ids < start + count)] - start
+                if not len(local):
+                    continue
+            futures.append((start, self.pool.submit(_search_shard, path, x, min(k, count), local)))
+        if not futures:
+            return np.full((len(x), k), np.inf, dtype="float32"), np.full((len(x), k), -1, dtype="int64")
+        Ds, Is = [], []
+        for start, fut in futures:
+            d, i = fut.result()
+            Ds.append(d); Is.append(np.where(i >= 0, i + start, -1))
+        return merge_topk(Ds, Is, k)
+
+    def acquire(self):
+        with self._cond:
+            self._inflight += 1
+
+    def release(self):
+        with self._cond:
+            self._inflight -= 1
+            done = self._retired and not self._inflight
+        if done:
+            self.close()
+
+    def retire(self):
+        """Close once the searches holding the pool have released it."""
+        with self._cond:
+            self._retired = True
+            idle = not self._inflight
+        if idle:
+            self.close()
+
+    def close(self):
+        with self._cond:
+            if self.closed:
+                return
+            self.closed = True
+        with _live_lock:
+            _live_files.subtract(self.paths)
+        _remove_stale(self.prefix)
@@ -1,11 +1,9 @@
 # services/slot_extractor.py
-import yaml, json, re
+import json, re
 from typing import Dict, Any, Optional, List
 from services.llm_adapter import LLMAdapter
-import os
-base_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_dir, "..","config", "config.yaml")
-CFG = yaml.safe_load(open(config_path,"r",encoding="utf-8"))
+from services.config import load_config
+CFG = load_config()
 REQUIRED_SLOTS = CFG.get("slots", {}).get("required", ["symptom","duration","severity","medical_history","medications","allergies"])
 
 # ---------------- Rule-based helpers (fast, robust) ----------------
@@ -0,0 +1,50 @@
+# services/startup.py
+"""
+Startup timing.
+
+Heavy dependencies (embedding model, spaCy, FAISS, Neo4j driver, LLM client) load on
+first use; each load is recorded with timed() so the cost shows up in one report.
+
+    python -m services.startup          # import cost of the orchestrator
+    python -m services.startup --warm   # plus building the shared services
+"""
+import argparse, time
+from contextlib import contextmanager
+from typing import Dict
+
+TIMINGS: Dict[str, float] = {}
+
+@contextmanager
+def timed(name: str):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        TIMINGS[name] = TIMINGS.get(name, 0.0) + (time.perf_counter() - t0)
+
+def report() -> str:
+    lines = ["[startup] timings:"]
+    for name, secs in sorted(TIMINGS.items(), key=lambda x: -x[1]):
+        lines.append(f"  {name:<32} {secs * 1000:9.1f} ms")
+    return "\n".join(lines)
+
+def main():
+    ap = argparse.ArgumentParser(description="Report cold-start cost of the assistant")
+    ap.add_argument("--warm", action="store_true", help="also build the shared VDB/KG/LLM services")
+    args = ap.parse_args()
+    # run as __main__: record into the services.startup module the rest of the code imports
+    from services.startup import timed, report
+    with timed("import orchestrator.orchestrator"):
+        import orchestrator.orchestrator  # noqa: F401
+    if args.warm:
+        from services.container import get_container
+        services = get_container()
+        for name in ("vdb", "kg", "llm"):
+            try:
+                services.get(name)
+            except Exception as e:
+                print(f"[startup] {name} failed to initialise: {e}")
+    print(report())
+
+if __name__ == "__main__":
+    main()
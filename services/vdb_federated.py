@@ -0,0 +1,281 @@
+# services/vdb_federated.py
+import contextlib, threading, time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import numpy as np
+from services import index_versions
+from services.vdb_service import VDBService, CFG
+
+# faiss.<name>_index keys in config.yaml
+INDEX_NAMES = ("general", "nursing", "research")
+DEFAULT_AGENT_INDEXES = {"nurse": ["nursing"], "research": ["research"], "doctor": list(INDEX_NAMES)}
+
+def to_cosine_distance(dist: float, metric: int) -> float:
+    """Map a raw FAISS score onto 1 - cos(q, x) so hits from different indexes compare directly."""
+    import faiss
+    if metric == faiss.METRIC_INNER_PRODUCT:
+        return 1.0 - dist
+    # squared L2 between unit vectors = 2 - 2cos
+    return min(max(dist / 2.0, 0.0), 2.0)
+
+def fuse_sources(hits: Dict[str, List[Tuple[str, float]]], top_k: int, rrf_k: int = 60) -> List[Tuple[str, float, str]]:
+    """
+    Reciprocal rank fusion of one query's per-index hit lists, for indexes whose distances
+    are not on one scale (lexical/hybrid rank distances next to cosine ones). A text found
+    by several indexes counts once, credited to the index that ranked it highest; its
+    distance is 1 - fused score / best possible score, in [0, 1).
+    """
+    from services.bm25_index import rrf_fuse
+    source: Dict[str, Tuple[int, str]] = {}
+    for name, ranked in hits.items():
+        for rank, (text, _) in enumerate(ranked):
+            if text not in source or rank < source[text][0]:
+                source[text] = (rank, name)
+    best = max(1, len(hits)) / (rrf_k + 1)
+    fused = rrf_fuse([[t for t, _ in ranked] for ranked in hits.values()], top_k, rrf_k)
+    return [(t, 1.0 - s / best, source[t][1]) for t, s in fused]
+
+class SharedEncoder:
+    """Memoising encoder handed to every index of one federated search, so each query is embedded at most once."""
+    def __init__(self, svc: VDBService):
+        self.svc = svc
+        self.lock = threading.Lock()
+        self.memo: Dict[str, np.ndarray] = {}
+
+    def __call__(self, texts: List[str]) -> np.ndarray:
+        with self.lock:
+            missing = [t for t in dict.fromkeys(texts) if t not in self.memo]
+            if missing:
+                self.memo.update(zip(missing, self.svc.encode(missing)))
+            return np.stack([self.memo[t] for t in texts])
+
+class FederatedVDB:
+    """
+    Loads the general, nursing and research indexes with one shared embedding model
+    and searches a chosen subset of them concurrently.
+
+    Each index can be rebuilt in the background (rebuild()) or by the offline builder;
+    a new live version is loaded next to the old one and swapped in under a lock, and
+    the old service is closed once the queries already running on it have finished.
+    """
+    def __init__(self, index_files: Optional[Dict[str, str]] = None, agent_indexes: Optional[Dict[str, List[str]]] = None,
+                 model=None):
+        fcfg = CFG["faiss"]
+        index_files = index_files or {n: fcfg[f"{n}_index"] for n in INDEX_NAMES if fcfg.get(f"{n}_index")}
+        self.agent_indexes = agent_indexes or fcfg.get("agent_indexes") or DEFAULT_AGENT_INDEXES
+        self.index_files = dict(index_files)
+        self.services: Dict[str, VDBService] = {}
+        self.lock = threading.Lock()
+        # held from publishing a new version on disk until it is swapped in, so a reload
+        # never loads a second writer onto the version a rebuild is about to serve
+        self.swap_lock = threading.RLock()
+        self.reload_every = float(fcfg.get("reload_check_seconds", 5))
+        self._last_check = time.time()
+        self._reloading = False
+        self.merge = fcfg.get("federated_merge", "auto")
+        self.rrf_k = int((CFG.get("bm25") or {}).get("rrf_k", 60))
+        shared = None
+        for name, path in index_files.items():
+            svc = VDBService(index_file=path, model=shared.model if shared else model, cache=shared.cache if shared else None,
+                             batcher=shared.batcher if shared else None)
+            shared = shared or svc
+            self.services[name] = svc
+        self.encoder = shared
+        self.pool = ThreadPoolExecutor(max_workers=max(1, len(self.services)), thread_name_prefix="vdb-fed")
+
+    def for_agent(self, agent: str) -> "FederatedView":
+        names = self.agent_indexes.get(agent) or list(self.services)
+        return FederatedView(self, [n for n in names if n in self.services])
+
+    def search(self, queries: List[str], top_k: int = None, sources: Optional[Sequence[str]] = None,
+               filters: Optional[Dict[str, Any]] = None) -> List[List[Tuple[str, float, str]]]:
+        """
+        Encode queries once, search every selected index in parallel and merge the hits.
+        Returns (text, distance, index_name) per query, closest first.
+        Dense hits are mapped onto cosine distance, which compares across indexes built
+        with the same model. Indexes in a lexical/hybrid mode return a rank distance on
+        another scale (and only trigger the shared encoder for queries that need the
+        dense pass), so with faiss.federated_merge "auto" any such index switches the merge
+        to reciprocal rank fusion across indexes (fuse_sources); "rrf" always fuses by rank
+        and "distance" always sorts raw distances. `filters` is a metadata predicate (see
+        ChunkMeta.select) applied inside every index's search.
+        """
+        top_k = top_k or CFG["faiss"]["top_k"]
+        if not queries:
+            return []
+        self._maybe_reload()
+        # take a reference on every selected service before the lock is dropped: a swap may retire
+        # one before the pool starts its query, and close() waits for these references
+        with self.lock:
+            services = {n: self.services[n] for n in dict.fromkeys(sources or self.services) if n in self.services}
+            for svc in services.values():
+                svc.acquire()
+            encoder = SharedEncoder(self.encoder)
+        futures = {}
+        try:
+            names = [n for n, svc in services.items() if svc.count()]
+            if not names:
+                return [[] for _ in queries]
+            futures = {n: self.pool.submit(services[n].query_batch, list(queries), top_k, None, encoder, filters) for n in names}
+            return self._merge(services, futures, len(queries), top_k)
+        finally:
+            wait(list(futures.values()))
+            for svc in services.values():
+                svc.release()
+
+    def _merge(self, services: Dict[str, VDBService], futures: Dict[str, Future], n_queries: int,
+               top_k: int) -> List[List[Tuple[str, float, str]]]:
+        per_source: Dict[str, List[List[Tuple[str, float]]]] = {}
+        rank_scaled = False
+        for n, fut in futures.items():
+            svc = services[n]
+            metric = svc.index.metric_type
+            if svc.bm25 is None or svc.search_mode == "dense":
+                per_source[n] = [[(t, to_cosine_distance(d, metric)) for t, d in hits] for hits in fut.result()]
+            else:
+                per_source[n] = fut.result()
+                rank_scaled = True
+        if len(per_source) > 1 and (self.merge == "rrf" or (self.merge == "auto" and rank_scaled)):
+            return [fuse_sources({n: per_source[n][row] for n in per_source}, top_k, self.rrf_k) for row in range(n_queries)]
+        merged: List[List[Tuple[str, float, str]]] = [[] for _ in range(n_queries)]
+        for n, rows in per_source.items():
+            for row, hits in enumerate(rows):
+                merged[row].extend((t, d, n) for t, d in hits)
+        return [sorted(rows, key=lambda x: x[1])[:top_k] for rows in merged]
+
+    # ---- versioned rebuild / hot swap ----
+    def _load(self, name: str, version: Optional[str] = None) -> VDBService:
+        return VDBService(index_file=self.index_files[name], model=self.encoder.model, cache=self.encoder.cache,
+                          batcher=self.encoder.batcher, version=version)
+
+    def _swap(self, name: str, svc: VDBService):
+        old = self.services.get(name)
+        # with the old service's writers held off, so a write lands either before the swap or on svc
+        with old.write_lock if old is not None else contextlib.nullcontext():
+            with self.lock:
+                self.services[name] = svc
+                if old is self.encoder:
+                    self.encoder = svc
+                if old is not None:
+                    old.successor = svc
+                    if old.batcher is svc.batcher and old._owns_batcher:
+                        old._owns_batcher, svc._owns_batcher = False, True     # the shared batcher outlives the old service
+                    if old.cache is svc.cache and old._owns_cache:
+                        old._owns_cache, svc._owns_cache = False, True         # and so does the shared cache
+        print(f"[VDB] {name} now serves {svc.build_version or svc.index_file}")
+        if old is not None:
+            threading.Thread(target=old.close, args=(None,), name=f"vdb-retire-{name}", daemon=True).start()
+
+    def refresh(self) -> List[str]:
+        """Swap in any index whose live version changed on disk (e.g. after `python -m services.build_index`)."""
+        swapped = []
+        for name, path in self.index_files.items():
+            with self.swap_lock:
+                live = index_versions.current_version(path)
+                svc = self.services.get(name)
+                if live and svc is not None and live != svc.build_version:
+                    try:
+                        self._swap(name, self._load(name, live))
+                        swapped.append(name)
+                    except Exception as e:
+                        print(f"[VDB] not swapping {name} to {live}: {e}")
+        return swapped
+
+    def _maybe_reload(self):
+        if self.reload_every <= 0 or self._reloading or time.time() - self._last_check < self.reload_every:
+            return
+        self._last_check = time.time()
+        if all(index_versions.current_version(p) in (None, self.services[n].build_version)
+               for n, p in self.index_files.items() if n in self.services):
+            return
+        # load the new version off the query path; queries keep using the old one until the swap
+        self._reloading = True
+        def run():
+            try:
+                self.refresh()
+            finally:
+                self._reloading = False
+        threading.Thread(target=run, name="vdb-reload", daemon=True).start()
+
+    def rebuild(self, name: str, texts: Optional[List[str]] = None, metadata: Optional[List[Dict[str, Any]]] = None,
+                index_type: Optional[str] = None, background: bool = True):
+        """
+        Build a new version of index `name` and hot-swap to it. Without texts the current
+        chunks (and metadata) are re-indexed, e.g. into another index_type, and chunks added
+        while the build ran are replayed before the swap: first with writers running, then a
+        final pass with them blocked until the swap, after which writes to the old service go
+        to the new one. Returns the thread when background.
+        """
+        if background:
+            t = threading.Thread(target=self.rebuild, args=(name, texts, metadata, index_type, False),
+                                 name=f"vdb-rebuild-{name}", daemon=True)
+            t.start()
+            return t
+        from services.build_index import build_version
+        old = self.services[name]
+        replay = texts is None
+        if replay:
+            n = len(old.texts)
+            texts = [old.texts[i] for i in range(n)]
+            metadata = [old.meta.get(i) for i in range(n)]
+        version, _ = build_version(texts, self.index_files[name], index_type or CFG["faiss"].get("index_type", "flat"),
+                                   old.model_name, metadata=metadata, model=old.model, encode=old.embed_documents,
+                                   activate=False)
+        new = self._load(name, version)
+        if replay:
+            # catch up on chunks appended to the live index while the build ran
+            n = self._replay(old, new, n)
+        # the final catch-up and the swap form one critical section for old's writers, and
+        # activate + swap one for reloads (swap_lock first: refresh() takes them in that order)
+        with self.swap_lock, old.write_lock:
+            if replay:
+                self._replay(old, new, n)
+            index_versions.activate(self.index_files[name], version)
+            self._swap(name, new)
+        index_versions.prune(self.index_files[name], int(CFG["faiss"].get("keep_versions", 2)))
+        return version
+
+    @staticmethod
+    def _replay(old: VDBService, new: VDBService, n: int) -> int:
+        """Copy old's chunks from id n on into new; returns old's chunk count afterwards."""
+        while len(old.texts) > n:
+            start, n = n, len(old.texts)
+            new.add_chunks([old.texts[i] for i in range(start, n)], metadata=[old.meta.get(i) for i in range(start, n)])
+        return n
+
+    def close(self):
+        self.pool.shutdown(wait=False)
+        with self.lock:
+            services = list(self.services.values())
+        for svc in services:
+            svc.close(wait=1.0)
+        # shared by every service; closing twice is harmless
+        if self.encoder.cache is not None:
+            self.encoder.cache.close()
+
+class FederatedView:
+    """VDBService-compatible read view over a fixed set of federated indexes."""
+    def __init__(self, fed: FederatedVDB, sources: List[str]):
+        self.fed = fed
+        self.sources = sources
+
+    def encode(self, texts: List[str]):
+        return self.fed.encoder.encode(texts)
+
+    def query(self, q: str, top_k: int = None, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        return self.query_batch([q], top_k, filters)[0]
+
+    def query_batch(self, queries: List[str], top_k: int = None,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[Tuple[str, float]]]:
+        return [[(t, d) for t, d, _ in hits] for hits in self.fed.search(queries, top_k, self.sources, filters)]
+
+    async def aquery(self, q: str, top_k: int = None, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        return (await self.aquery_batch([q], top_k, filters))[0]
+
+    async def aquery_batch(self, queries: List[str], top_k: int = None,
+                           filters: Optional[Dict[str, Any]] = None) -> List[List[Tuple[str, float]]]:
+        from services.aio import run_blocking
+        return await run_blocking(self.query_batch, queries, top_k, filters)
+
+    def count(self) -> int:
+        return sum(self.fed.services[n].count() for n in self.sources)
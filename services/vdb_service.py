@@ -1,61 +1,423 @@
 # services/vdb_service.py
-import os, pickle, yaml
-from typing import List, Tuple
-import faiss, numpy as np
-from sentence_transformers import SentenceTransformer
+import functools, json, os, threading
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+from services import index_versions
+from services.config import load_config
+from services.result_cache import ResultCache, normalize_query
+from services.startup import timed
 
-base_dir = os.path.dirname(os.path.abspath(__file__))
-config_path = os.path.join(base_dir, "..","config", "config.yaml")
-CFG = yaml.safe_load(open(config_path,"r",encoding="utf-8"))
+CFG = load_config()
+
+def embed(model, texts: List[str], batch_size: int = 32) -> np.ndarray:
+    embs = model.encode(texts, batch_size=batch_size, convert_to_numpy=True, normalize_embeddings=True)
+    return embs.astype("float32")
+
+def merge_hits(hit_lists: List[List[Tuple[str, float]]], top_k: int) -> List[Tuple[str, float]]:
+    """Union per-query hits, keeping each text's best (smallest) distance, closest first."""
+    best: Dict[str, float] = {}
+    for hits in hit_lists:
+        for text, dist in hits:
+            if text not in best or dist < best[text]:
+                best[text] = dist
+    return sorted(best.items(), key=lambda x: x[1])[:top_k]
+
+def _tracked(fn):
+    """Count calls in flight so close() can wait for them before releasing files."""
+    @functools.wraps(fn)
+    def wrapper(self, *args, **kwargs):
+        self.acquire()
+        try:
+            return fn(self, *args, **kwargs)
+        finally:
+            self.release()
+    return wrapper
 
 class VDBService:
-    def __init__(self, index_file: str = None, dim: int = None, model_name: str = None):
-        self.index_file = index_file or CFG["faiss"]["general_index"]
-        self.dim = dim or CFG["faiss"]["dim"]
+    def __init__(self, index_file: str = None, dim: int = None, model_name: str = None, model=None, cache=None,
+                 version: str = None, batcher=None):
+        # index_file names the index; its files live in the live (or the given) version directory
+        self.root_file = index_file or CFG["faiss"]["general_index"]
+        self.index_file, self.build_version = index_versions.resolve(self.root_file, version)
         self.model_name = model_name or CFG["faiss"]["embedding_model"]
         os.makedirs(os.path.dirname(self.index_file) or ".", exist_ok=True)
-        self.model = SentenceTransformer(self.model_name)
-        self.texts = [ "Aspirin is commonly used to treat headaches and mild pain.",
-        "Ibuprofen reduces inflammation and helps with arthritis.",
-        "Paracetamol is effective in reducing fever.",
-        "Metformin is prescribed for type 2 diabetes management.",
-        "Amoxicillin is an antibiotic used to treat bacterial infections."]
-        if os.path.exists(self.index_file) and os.path.exists(self.index_file + ".meta"):
+        # heavy deps load here, not at import time, so importing the agents stays cheap
+        from services.chunk_meta import ChunkMeta
+        from services.chunk_store import ChunkStore
+        from services.embedding_cache import EmbeddingCache
+        from services.faiss_index import SegmentedIndex
+        # model/cache can be shared between services that use the same embedding model
+        if model is None:
+            from sentence_transformers import SentenceTransformer
+            with timed(f"embedding model {self.model_name}"):
+                model = SentenceTransformer(self.model_name)
+        self.model = model
+        model_dim = model.get_sentence_embedding_dimension() if hasattr(model, "get_sentence_embedding_dimension") else None
+        self.dim = dim or model_dim or CFG["faiss"]["dim"]
+        if model_dim and not dim and int(CFG["faiss"]["dim"]) != model_dim:
+            print(f"[VDB] faiss.dim={CFG['faiss']['dim']} but {self.model_name} embeds to {model_dim} dims; using {model_dim}")
+        ccfg = CFG.get("embedding_cache") or {}
+        self._owns_cache = cache is None
+        self.cache = cache if cache is not None else \
+            EmbeddingCache(self.model_name, int(ccfg.get("max_items", 50000)), ccfg.get("path") or None,
+                           int(ccfg.get("max_disk_items", 200000))) \
+            if ccfg.get("enabled", True) else None
+        # cache misses of small (query-sized) encode calls from concurrent sessions share one forward pass
+        bcfg = CFG.get("embed_batcher") or {}
+        self._owns_batcher = batcher is None and bool(bcfg.get("enabled", True))
+        if self._owns_batcher:
+            from services.embed_batcher import EmbeddingBatcher
+            batcher = EmbeddingBatcher(lambda texts: embed(self.model, texts), int(bcfg.get("max_batch", 32)),
+                                       float(bcfg.get("max_wait_ms", 5)))
+        self.batcher = batcher
+        if not ChunkStore.exists(self.index_file) and os.path.exists(self.index_file + ".meta"):
+            ChunkStore.from_pickle(self.index_file, self.index_file + ".meta")
+        self.texts = ChunkStore(self.index_file)
+        self.meta = ChunkMeta(self.index_file)
+        # bumped by every write; part of the result-cache key so results never outlive the index they came from
+        self.version = 0
+        rcfg = CFG.get("result_cache") or {}
+        self.results = ResultCache(int(rcfg.get("max_items", 10000)), float(rcfg.get("ttl_seconds", 600))) \
+            if rcfg.get("enabled", True) else None
+        self.max_segments = int(CFG["faiss"].get("max_segments", 16))
+        self.segment_fanout = int(CFG["faiss"].get("segment_fanout", 4))
+        self.compact_ratio = float(CFG["faiss"].get("compact_ratio", 0.5))
+        self._inflight = 0
+        self._inflight_cond = threading.Condition()
+        # serialises writes; a hot swap holds it while it retires this service and sets `successor`,
+        # which then receives every later write (see FederatedVDB.rebuild)
+        self.write_lock = threading.RLock()
+        self.successor: Optional["VDBService"] = None
+        manifest = index_versions.read_manifest(self.index_file) if self.build_version else None
+        if manifest is not None:
+            # a published version must match the model it was built with; fail loudly rather than reset it
+            self.index = SegmentedIndex(self.index_file, self.dim, index_type=manifest.get("index_type"))
+            if index_versions.validate(self.index_file, manifest, self.model_name, self.dim, self.index.base.ntotal,
+                                       bool(CFG["faiss"].get("verify_checksum", True))):
+                index_versions.write_manifest(self.index_file, count=self.index.base.ntotal)
+            if not self.index.reconcile(len(self.texts)):
+                raise ValueError(f"Index {self.index_file} has {self.index.ntotal} vectors for {len(self.texts)} chunks")
+        else:
             try:
-                self.index = faiss.read_index(self.index_file)
-                with open(self.index_file + ".meta","rb") as f:
-                    self.texts = pickle.load(f)
-                if self.index.ntotal != len(self.texts):
-                    self.index = faiss.IndexFlatL2(self.dim); self.texts = []
+                self.index = SegmentedIndex(self.index_file, self.dim)
+                if not self.index.reconcile(len(self.texts)):
+                    self._reset()
             except Exception:
-                self.index = faiss.IndexFlatL2(self.dim); self.texts = []
-        else:
-            self.index = faiss.IndexFlatL2(self.dim)
+                self.index = SegmentedIndex(self.index_file, self.dim, load=False)
+                self._reset()
+        self.meta.truncate(len(self.texts))
+        # exact re-ranking of compressed-index candidates against full vectors kept on disk
+        self.rerank_factor = int(CFG["faiss"].get("rerank_factor", 4))
+        self.vectors = None
+        if CFG["faiss"].get("rerank", False):
+            from services.vector_store import VectorStore
+            self.vectors = VectorStore(self.index_file, self.dim)
+            if len(self.vectors) >= self.index.ntotal:
+                self.vectors.truncate(self.index.ntotal)
+            else:
+                print(f"[VDB] {self.vectors.path} has {len(self.vectors)} of {self.index.ntotal} vectors; re-ranking disabled")
+                self.vectors = None
+        # BM25 inverted index over the same chunk ids for hybrid / lexical-only retrieval
+        bcfg = CFG.get("bm25") or {}
+        self.bm25 = None
+        self.search_mode = "dense"
+        if bcfg.get("enabled", False):
+            from services.bm25_index import BM25Index
+            self.bm25 = BM25Index(self.index_file, float(bcfg.get("k1", 1.2)), float(bcfg.get("b", 0.75)))
+            added = self.bm25.sync(self.texts)
+            if added:
+                print(f"[VDB] indexed {added} chunks into {self.bm25.path}")
+            self.search_mode = bcfg.get("mode", "auto")
+            self.rrf_k = int(bcfg.get("rrf_k", 60))
+            self.fast_path_max_terms = int(bcfg.get("fast_path_max_terms", 3))
+        # MinHash LSH signatures of indexed chunks; near-duplicates are dropped before they are embedded
+        dcfg = CFG.get("dedup") or {}
+        self.dedup = None
+        self.dropped_duplicates = 0
+        if dcfg.get("enabled", True):
+            from services.dedup import NearDupIndex
+            self.dedup = NearDupIndex(self.index_file, float(dcfg.get("threshold", 0.85)), int(dcfg.get("num_perm", 64)),
+                                      int(dcfg.get("bands", 16)), int(dcfg.get("shingle", 5)))
+            added = self.dedup.sync(self.texts)
+            if added:
+                print(f"[VDB] computed near-duplicate signatures for {added} chunks in {self.dedup.path}")
+
+    def _reset(self):
+        from services.chunk_store import ChunkStore
+        self.index.clear()
+        if getattr(self, "vectors", None) is not None:
+            self.vectors.clear()
+        self.texts.close()
+        if getattr(self, "meta", None) is not None:
+            self.meta.truncate(0)
+        for ext in (".offsets", ".blob"):
+            if os.path.exists(self.index_file + ext):
+                os.remove(self.index_file + ext)
+        self.texts = ChunkStore(self.index_file)
+        self._invalidate()
+
+    def _invalidate(self):
+        self.version += 1
+        if self.results is not None:
+            self.results.clear()
 
     def encode(self, texts: List[str]):
-        embs = self.model.encode(texts, convert_to_numpy=True, normalize_embeddings=True)
-        return embs.astype("float32")
-
-    def add_chunks(self, texts: List[str], persist: bool = True):
-        if not texts: return
-        embs = self.encode(texts)
-        self.index.add(embs)
-        self.texts.extend(texts)
+        """Embed query text through the embedding cache and the micro-batcher."""
+        compute = self.batcher.encode if self.batcher is not None else (lambda missing: embed(self.model, missing))
+        if self.cache is None:
+            return compute(texts)
+        return self.cache.encode(texts, compute)
+
+    def embed_documents(self, texts: List[str], batch_size: int = 32) -> np.ndarray:
+        """Embed chunks being indexed; bypasses the query cache, which would only duplicate the index."""
+        return embed(self.model, texts, batch_size)
+
+    def add_chunks(self, texts: List[str], persist: bool = True, metadata: Optional[List[Dict[str, Any]]] = None) -> int:
+        """
+        Embed and append texts; metadata[i] (source, specialty, language, year, ...) describes texts[i].
+        Near-duplicates of indexed chunks (or of each other) are dropped first. Returns chunks added.
+        """
+        if not texts: return 0
+        texts, _, metadata, sigs = self._drop_near_duplicates(texts, None, metadata)
+        if not texts: return 0
+        return self.add_embeddings(texts, self.embed_documents(texts), persist=persist, metadata=metadata, signatures=sigs)
+
+    def _drop_near_duplicates(self, texts, embs, metadata):
+        if self.dedup is None:
+            return texts, embs, metadata, None
+        keep, sigs = self.dedup.filter(texts)
+        dropped = len(keep) - sum(keep)
+        if not dropped:
+            return texts, embs, metadata, sigs
+        self.dropped_duplicates += dropped
+        pick = [i for i, k in enumerate(keep) if k]
+        return ([texts[i] for i in pick], embs[pick] if embs is not None else None,
+                [metadata[i] for i in pick] if metadata is not None else None, [sigs[i] for i in pick])
+
+    def add_embeddings(self, texts: List[str], embs: np.ndarray, persist: bool = True,
+                       metadata: Optional[List[Dict[str, Any]]] = None, signatures=None) -> int:
+        """
+        Append precomputed (normalized float32) embeddings and their texts, minus near-duplicates.
+        `signatures` are the texts' MinHash signatures when the caller already filtered them.
+        Returns chunks added.
+        """
+        with self.write_lock:
+            if self.successor is not None:
+                # retired by a hot swap: the write belongs to the version that replaced this one
+                return self.successor.add_embeddings(texts, embs, persist, metadata, signatures)
+            return self._add_embeddings(texts, embs, persist, metadata, signatures)
+
+    def _add_embeddings(self, texts: List[str], embs: np.ndarray, persist: bool,
+                        metadata: Optional[List[Dict[str, Any]]], signatures) -> int:
+        if not texts: return 0
+        if metadata is not None and len(metadata) != len(texts):
+            raise ValueError(f"Got {len(metadata)} metadata entries for {len(texts)} texts")
+        if self.dedup is not None and signatures is None:
+            texts, embs, metadata, signatures = self._drop_near_duplicates(texts, embs, metadata)
+            if not texts: return 0
+        # full vectors, then the segment + manifest, then metadata, then texts; reconcile() drops a
+        # segment whose texts are missing and metadata past the last text is truncated on load
+        if self.vectors is not None:
+            self.vectors.append(embs, persist=persist)
+        start = len(self.texts)
+        self.index.add(embs, persist=persist)
+        if metadata is not None:
+            self.meta.add(start, metadata, commit=persist)
+        self.texts.append(texts, persist=persist)
+        if self.bm25 is not None:
+            self.bm25.add(start, texts, commit=persist)
+        if self.dedup is not None:
+            self.dedup.add(start, signatures, commit=persist)
+        self._invalidate()
         if persist:
-            faiss.write_index(self.index, self.index_file)
-            with open(self.index_file + ".meta","wb") as f:
-                pickle.dump(self.texts, f)
+            # only once the texts are committed: reconcile() relies on the last segment being the newest batch
+            self.index.merge_tiers(self.segment_fanout)
+            if self.index.should_compact(self.max_segments, self.compact_ratio):
+                try:
+                    self.compact()
+                except Exception as e:
+                    print(f"[VDB] compaction deferred: {e}")
+        return len(texts)
+
+    def compact(self) -> int:
+        """Merge append-only segments into the base index."""
+        with self.write_lock:
+            return self._compact()
+
+    def _compact(self) -> int:
+        if self.vectors is not None:
+            self.vectors.flush()
+        self.index.flush()
+        self.texts.flush()
+        if not self.index.segments:
+            return 0
+        staged = None
+        if self.build_version:
+            # the manifest learns the new base's checksum before the rename, so a crash before
+            # write_manifest() below still leaves a version that validates
+            staged = lambda tmp, count: index_versions.stage_manifest(self.index_file, tmp, count=count)
+        merged = self.index.compact(staged)
+        if self.build_version:
+            index_versions.write_manifest(self.index_file, count=self.index.base.ntotal)
+        if merged:
+            print(f"[VDB] compacted {merged} vectors into {self.index_file}")
+        return merged
+
+    def query(self, q: str, top_k: int = None, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        return self.query_batch([q], top_k, filters=filters)[0]
+
+    @_tracked
+    def query_batch(self, queries: List[str], top_k: int = None, mode: str = None, encoder=None,
+                    filters: Optional[Dict[str, Any]] = None) -> List[List[Tuple[str, float]]]:
+        """
+        Embed all queries in one encode call and run a single matrix search.
+        Returns one hit list per query, in input order.
 
-    def query(self, q: str, top_k: int = None) -> List[Tuple[str, float]]:
+        Results are cached by (normalised query, top_k, mode, filters, index version); only
+        the misses are embedded and searched, and any write to the index invalidates them.
+
+        With bm25 enabled, mode picks "dense", "lexical", "hybrid" (reciprocal rank fusion of
+        both) or "auto" (lexical fast path for short exact-term queries, hybrid otherwise).
+        Dense results carry raw FAISS distances; lexical/hybrid ones a rank distance in [0, 1)
+        on one query-independent RRF scale (a lexical-only top hit is 0.5, never 0.0).
+        `encoder` replaces self.encode, e.g. to share one forward pass between indexes.
+        `filters` restricts every query to chunks whose metadata matches (see ChunkMeta.select);
+        the matching ids are resolved once and applied inside the FAISS/BM25 scan.
+        """
         top_k = top_k or CFG["faiss"]["top_k"]
-        if self.index.ntotal == 0:
+        if not queries:
             return []
-        emb = self.encode([q])
-        D,I = self.index.search(emb, min(top_k, max(1, self.index.ntotal)))
-        out=[]
-        for i, idx in enumerate(I[0]):
-            if idx >=0 and idx < len(self.texts):
-                out.append((self.texts[idx], float(D[0][i])))
-        return out
+        mode = mode or self.search_mode
+        if self.results is None:
+            return self._query_batch(list(queries), top_k, mode, encoder, filters)
+        version = self.version
+        fkey = json.dumps(filters, sort_keys=True, default=str) if filters else ""
+        keys = [(normalize_query(q), top_k, mode, fkey, version) for q in queries]
+        results = [self.results.get(k) for k in keys]
+        todo: Dict[Any, str] = {}
+        for k, q, r in zip(keys, queries, results):
+            if r is None and k not in todo:
+                todo[k] = q
+        if todo:
+            for k, hits in zip(todo, self._query_batch(list(todo.values()), top_k, mode, encoder, filters)):
+                self.results.put(k, hits)
+                todo[k] = hits
+            results = [r if r is not None else todo[k] for k, r in zip(keys, results)]
+        return [list(r) for r in results]
+
+    def _query_batch(self, queries: List[str], top_k: int, mode: str, encoder, filters) -> List[List[Tuple[str, float]]]:
+        if self.index.ntotal == 0:
+            return [[] for _ in queries]
+        ids = self.filter_ids(filters)
+        if ids is not None and not len(ids):
+            return [[] for _ in queries]
+        encoder = encoder or self.encode
+        if self.bm25 is None or mode == "dense":
+            return self._hits(*self._search_ids(encoder(list(queries)), top_k, ids))
+        from services.bm25_index import rrf_fuse
+        depth = 2 * top_k
+        lexical = [self.bm25.search(q, depth, ids) for q in queries]
+        results: List[List[Tuple[str, float]]] = [[] for _ in queries]
+        # distance = 1 - RRF score / score of a chunk ranked first by both passes: it depends on
+        # ranks only, never on the query's own best score, so lexical and hybrid hits share one scale
+        best = 2.0 / (self.rrf_k + 1)
+        need_dense = []
+        for i, q in enumerate(queries):
+            if mode == "lexical" or (mode == "auto" and self._lexical_fast_path(q, lexical[i])):
+                # fused with an empty dense ranking: a top lexical hit lands at 0.5, like one the dense pass missed
+                fused = rrf_fuse([[doc for doc, _ in lexical[i]]], top_k, self.rrf_k)
+                results[i] = [(self.texts[doc], 1.0 - s / best) for doc, s in fused]
+            else:
+                need_dense.append(i)
+        if need_dense:
+            _, I = self._search_ids(encoder([queries[i] for i in need_dense]), depth, ids)
+            for row, i in enumerate(need_dense):
+                fused = rrf_fuse([[int(x) for x in I[row] if x >= 0], [doc for doc, _ in lexical[i]]], top_k, self.rrf_k)
+                results[i] = [(self.texts[doc], 1.0 - s / best) for doc, s in fused if doc < len(self.texts)]
+        return results
+
+    async def aquery(self, q: str, top_k: int = None, filters: Optional[Dict[str, Any]] = None) -> List[Tuple[str, float]]:
+        """query() on the shared blocking pool, for use from async agents."""
+        from services.aio import run_blocking
+        return await run_blocking(self.query, q, top_k, filters)
+
+    async def aquery_batch(self, queries: List[str], top_k: int = None,
+                           filters: Optional[Dict[str, Any]] = None) -> List[List[Tuple[str, float]]]:
+        from services.aio import run_blocking
+        return await run_blocking(self.query_batch, queries, top_k, filters=filters)
+
+    def _lexical_fast_path(self, q: str, hits: List[Tuple[int, float]]) -> bool:
+        """Short queries made of known terms, whose best lexical hit contains all of them, skip the transformer."""
+        from services.bm25_index import tokenize
+        terms = tokenize(q)
+        if not hits or not terms or len(terms) > self.fast_path_max_terms:
+            return False
+        if len(self.bm25.doc_freqs(terms)) < len(set(terms)):
+            return False
+        return set(terms) <= set(tokenize(self.texts[hits[0][0]]))
+
+    def filter_ids(self, filters: Optional[Dict[str, Any]]) -> Optional[np.ndarray]:
+        """Sorted chunk ids matching `filters`, or None when unfiltered."""
+        if not filters:
+            return None
+        ids = self.meta.select(filters)
+        return ids[ids < self.index.ntotal]
+
+    def _search_ids(self, embs: np.ndarray, k: int, ids: Optional[np.ndarray] = None):
+        k = min(k, max(1, self.index.ntotal))
+        if self.vectors is not None:
+            from services.vector_store import exact_rerank
+            if ids is not None and len(ids) <= k * self.rerank_factor:
+                # the filtered set is no bigger than the candidate pool: score it exactly
+                return exact_rerank(self.vectors, embs, np.broadcast_to(ids, (len(embs), len(ids))), k)
+            _, I = self.index.search(embs, min(k * self.rerank_factor, self.index.ntotal), ids)
+            return exact_rerank(self.vectors, embs, I, k)
+        return self.index.search(embs, k, ids)
+
+    @_tracked
+    def search_embeddings(self, embs: np.ndarray, top_k: int = None,
+                          filters: Optional[Dict[str, Any]] = None) -> List[List[Tuple[str, float]]]:
+        """Search already-encoded query vectors; one hit list per row."""
+        top_k = top_k or CFG["faiss"]["top_k"]
+        if self.index.ntotal == 0:
+            return [[] for _ in range(len(embs))]
+        ids = self.filter_ids(filters)
+        if ids is not None and not len(ids):
+            return [[] for _ in range(len(embs))]
+        return self._hits(*self._search_ids(embs, top_k, ids))
+
+    def _hits(self, D: np.ndarray, I: np.ndarray) -> List[List[Tuple[str, float]]]:
+        results = []
+        for row in range(len(I)):
+            out=[]
+            for i, idx in enumerate(I[row]):
+                if idx >=0 and idx < len(self.texts):
+                    out.append((self.texts[idx], float(D[row][i])))
+            results.append(out)
+        return results
 
     def count(self): return self.index.ntotal
+
+    def acquire(self):
+        """Keep the service open until release(); for callers that hand it to another thread to query later."""
+        with self._inflight_cond:
+            self._inflight += 1
+
+    def release(self):
+        with self._inflight_cond:
+            self._inflight -= 1
+            if not self._inflight:
+                self._inflight_cond.notify_all()
+
+    def close(self, wait: Optional[float] = 30.0):
+        """Release index files once in-flight queries have finished (waiting at most `wait` seconds; None: no limit)."""
+        with self._inflight_cond:
+            self._inflight_cond.wait_for(lambda: not self._inflight, timeout=wait)
+        self.index.close()
+        if self._owns_batcher:
+            self.batcher.close()
+        if self._owns_cache and self.cache is not None:
+            self.cache.close()
+        for part in (self.texts, self.meta, self.vectors, self.bm25, self.dedup):
+            if part is not None:
+                part.close()
@@ -0,0 +1,91 @@
+# services/vector_store.py
+import os
+from typing import List, Sequence
+import numpy as np
+
+class VectorStore:
+    """
+    Full-precision float32 copy of the indexed embeddings in `<prefix>.vectors`
+    (row-major, no header), memory-mapped read-only. Lets a compressed (SQ/PQ)
+    index re-rank its candidates exactly while only the touched rows are paged in.
+    """
+    def __init__(self, prefix: str, dim: int):
+        self.path = prefix + ".vectors"
+        self.dim = dim
+        self._tail: List[np.ndarray] = []
+        self._n_tail = 0
+        self._limit = None   # rows beyond this belong to a write whose vectors never reached the index
+        self._open()
+
+    def _open(self):
+        rows = os.path.getsize(self.path) // (4 * self.dim) if os.path.exists(self.path) else 0
+        self._mm = np.memmap(self.path, dtype="float32", mode="r", shape=(rows, self.dim)) if rows else np.zeros((0, self.dim), dtype="float32")
+
+    @property
+    def n_disk(self) -> int:
+        n = len(self._mm)
+        return n if self._limit is None else min(n, self._limit)
+
+    def __len__(self) -> int:
+        return self.n_disk + self._n_tail
+
+    def truncate(self, n: int):
+        """Ignore rows past n (the file itself is trimmed on the next flush)."""
+        self._limit = n
+
+    def get(self, ids: Sequence[int]) -> np.ndarray:
+        ids = np.asarray(ids, dtype="int64")
+        out = np.empty((len(ids), self.dim), dtype="float32")
+        n_disk = self.n_disk
+        disk = ids < n_disk
+        if disk.any():
+            out[disk] = self._mm[ids[disk]]
+        if (~disk).any():
+            tail = np.vstack(self._tail)
+            out[~disk] = tail[ids[~disk] - n_disk]
+        return out
+
+    def append(self, embs: np.ndarray, persist: bool = True):
+        self._tail.append(np.ascontiguousarray(embs, dtype="float32"))
+        self._n_tail += len(embs)
+        if persist:
+            self.flush()
+
+    def flush(self):
+        if not self._tail:
+            return
+        n_disk = self.n_disk
+        self._mm = np.zeros((0, self.dim), dtype="float32")   # release the mapping before resizing
+        if os.path.exists(self.path) and os.path.getsize(self.path) != n_disk * 4 * self.dim:
+            os.truncate(self.path, n_disk * 4 * self.dim)
+        with open(self.path, "ab") as f:
+            for block in self._tail:
+                f.write(block.tobytes())
+            f.flush(); os.fsync(f.fileno())
+        self._tail, self._n_tail, self._limit = [], 0, None
+        self._open()
+
+    def close(self):
+        """Release the mapping; like ChunkStore.close(), rows appended with persist=False are dropped."""
+        self._mm = np.zeros((0, self.dim), dtype="float32")
+        self._tail, self._n_tail = [], 0
+
+    def clear(self):
+        self._mm = np.zeros((0, self.dim), dtype="float32")
+        self._tail, self._n_tail, self._limit = [], 0, None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def exact_rerank(vectors: VectorStore, queries: np.ndarray, I: np.ndarray, k: int):
+    """Re-score candidate ids I (one row per query) with exact squared L2 and keep the best k."""
+    D_out = np.full((len(queries), k), np.inf, dtype="float32")
+    I_out = np.full((len(queries), k), -1, dtype="int64")
+    for row, q in enumerate(queries):
+        cand = I[row][(I[row] >= 0) & (I[row] < len(vectors))]
+        if not len(cand):
+            continue
+        d = ((vectors.get(cand) - q) ** 2).sum(axis=1)
+        order = np.argsort(d, kind="stable")[:k]
+        D_out[row, :len(order)] = d[order]
+        I_out[row, :len(order)] = cand[order]
+    return D_out, I_out
@@ -0,0 +1,118 @@
+# tests/conftest.py
+import os, sys, zlib
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.config import load_config
+
+@pytest.fixture
+def cfg(monkeypatch):
+    """set(section, key=value, ...) overrides config.yaml for one test."""
+    config = load_config()
+    def set_(section, **values):
+        for key, value in values.items():
+            monkeypatch.setitem(config[section], key, value)
+    return set_
+
+class FakeModel:
+    """Deterministic bag-of-words stand-in for a SentenceTransformer."""
+    def __init__(self, dim: int = 32):
+        self.dim = dim
+        self.calls = []
+
+    def get_sentence_embedding_dimension(self) -> int:
+        return self.dim
+
+    def encode(self, texts, batch_size=32, convert_to_numpy=True, normalize_embeddings=True, **kw):
+        self.calls.append(len(texts))
+        out = np.zeros((len(texts), self.dim), dtype="float32")
+        for row, text in enumerate(texts):
+            for word in str(text).lower().split():
+                out[row, zlib.crc32(word.encode()) % self.dim] += 1.0
+            out[row, -1] += 1e-3
+        return out / np.linalg.norm(out, axis=1, keepdims=True)
+
+@pytest.fixture
+def fake_model():
+    return FakeModel()
+
+@pytest.fixture
+def make_vdb(tmp_path, cfg, fake_model):
+    """VDBService factory on a temp index with the fake model and no on-disk embedding cache."""
+    from services.vdb_service import VDBService
+    cfg("embedding_cache", enabled=False)
+    cfg("faiss", dim=fake_model.dim)
+    made = []
+    def make(name="general", **kwargs):
+        kwargs.setdefault("model", fake_model)
+        svc = VDBService(str(tmp_path / name / "index"), **kwargs)
+        made.append(svc)
+        return svc
+    yield make
+    for svc in made:
+        svc.close(wait=1.0)
+
+@pytest.fixture
+def make_fed(tmp_path, cfg, fake_model):
+    """FederatedVDB factory over temp general/nursing indexes sharing the fake model."""
+    from services.vdb_federated import FederatedVDB
+    cfg("embedding_cache", enabled=False)
+    cfg("faiss", dim=fake_model.dim, reload_check_seconds=0)
+    made = []
+    def make(names=("general", "nursing")):
+        fed = FederatedVDB({n: str(tmp_path / n / "index") for n in names}, model=fake_model)
+        made.append(fed)
+        return fed
+    yield make
+    for fed in made:
+        fed.close()
+
+class FakeGraph:
+    """
+    Neo4j stand-in for the KG services: answers the reads with the primary-tier Cypher's
+    semantics over a {disease: [symptoms]} graph and counts the calls it gets.
+    """
+    def __init__(self, graph):
+        self.graph = {d: list(s) for d, s in graph.items()}
+        self.calls = []
+        self.refreshes = 0
+
+    def snapshot_edges(self):
+        # SNAPSHOT_EDGES: MATCH (d:Disease) OPTIONAL MATCH (d)-[:IS_SYMPTOM]->(s:Symptom)
+        from services.kg_service import rows_to_edges
+        self.calls.append("snapshot_edges")
+        return rows_to_edges([{"disease": d, "symptom": s} for d, ss in self.graph.items() for s in (ss or [None])])
+
+    def insert_triples(self, triples):
+        self.calls.append("insert_triples")
+        for s, p, o in triples:
+            self.graph.setdefault(s, []).append(o)
+
+    def retrieve_triples(self, q, limit=20):
+        self.calls.append("retrieve_triples")
+        return [(d, "IS_SYMPTOM", s) for d, ss in self.graph.items() for s in ss if q.lower() in s.lower()][:limit]
+
+    def retrieve_triples_many(self, symptoms, limit_per_symptom=20):
+        self.calls.append("retrieve_triples_many")
+        return {q: self.retrieve_triples(q, limit_per_symptom) for q in symptoms}
+
+    def find_similar_symptoms(self, targets):
+        self.calls.append("find_similar_symptoms")
+        return sorted({s for ss in self.graph.values() for s in ss if any(t in s.lower() for t in targets)})
+
+    def get_all_symptoms_for_diseases_from_triples(self, kg_triples):
+        # DISEASE_SYMPTOMS primary tier: every matched Disease, with collect(DISTINCT s.name) (possibly [])
+        from services.kg_service import disease_candidates, rows_to_symptom_map
+        self.calls.append("get_all_symptoms_for_diseases_from_triples")
+        wanted = disease_candidates(kg_triples)
+        return rows_to_symptom_map([{"disease": d, "symptoms": ss} for d, ss in self.graph.items() if d.lower() in wanted])
+
+    def close(self):
+        pass
+
+@pytest.fixture
+def graph():
+    return FakeGraph({"Influenza": ["Fever", "Cough", "Fatigue"], "Common Cold": ["Cough", "Sneezing"],
+                      "Migraine": ["Headache", "Nausea"], "Rare Syndrome": []})
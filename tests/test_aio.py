@@ -0,0 +1,33 @@
+# tests/test_aio.py
+import asyncio, threading, time
+from services.aio import run_blocking
+
+def test_blocking_calls_run_on_the_pool_while_the_loop_keeps_serving():
+    def slow(x, scale=1):
+        time.sleep(0.2)
+        return threading.current_thread().name, x * scale
+    async def main():
+        ticks = 0
+        async def ticker():
+            nonlocal ticks
+            for _ in range(10):
+                await asyncio.sleep(0.01)
+                ticks += 1
+        (name, value), _ = await asyncio.gather(run_blocking(slow, 21, scale=2), ticker())
+        return name, value, ticks
+    name, value, ticks = asyncio.run(main())
+    assert name.startswith("blocking") and value == 42 and ticks == 10
+
+def test_async_queries_match_the_sync_ones(make_vdb, make_fed):
+    vdb = make_vdb()
+    vdb.add_chunks(["dry cough at night", "high fever with chills"])
+    fed = make_fed()
+    fed.services["nursing"].add_chunks(["wound dressing changed daily"])
+    nurse = fed.for_agent("nurse")
+    async def main():
+        return await asyncio.gather(vdb.aquery("fever", top_k=1), vdb.aquery_batch(["cough", "fever"], top_k=1),
+                                    nurse.aquery("wound care", top_k=1))
+    one, batch, federated = asyncio.run(main())
+    assert one == vdb.query("fever", top_k=1)
+    assert batch == vdb.query_batch(["cough", "fever"], top_k=1)
+    assert federated == nurse.query("wound care", top_k=1) and federated[0][0] == "wound dressing changed daily"
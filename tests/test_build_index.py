@@ -0,0 +1,71 @@
+# tests/test_build_index.py
+import faiss
+import pytest
+from services import index_versions
+from services.build_index import build_version
+from services.dedup import NearDupIndex
+from services.vdb_service import CFG
+
+def test_build_ships_dedup_signatures(tmp_path, make_vdb, fake_model, monkeypatch):
+    texts = [f"patient note {i} about symptom {i * 3} and treatment {i * 5}" for i in range(40)]
+    index_file = str(tmp_path / "general" / "index")
+    version, _ = build_version(texts, index_file, "flat", CFG["faiss"]["embedding_model"], model=fake_model)
+    assert (tmp_path / "general" / "index.versions" / version / "index.dedup.sqlite").exists()
+    signed = []
+    signature = NearDupIndex.signature
+    monkeypatch.setattr(NearDupIndex, "signature", lambda self, text: signed.append(text) or signature(self, text))
+    vdb = make_vdb()
+    assert vdb.build_version == version and len(vdb.dedup) == 40
+    assert signed == []     # loading the version did not sign the corpus again
+    assert vdb.add_chunks([texts[3]]) == 0 and vdb.dropped_duplicates == 1
+    assert index_versions.current_version(index_file) == version
+
+def test_compaction_crash_before_manifest_write_still_loads(tmp_path, make_vdb, fake_model, monkeypatch):
+    index_file = str(tmp_path / "general" / "index")
+    texts = [f"ward round note {i} on medication {i * 11}" for i in range(10)]
+    build_version(texts, index_file, "flat", CFG["faiss"]["embedding_model"], model=fake_model)
+    vdb = make_vdb()
+    vdb.add_chunks(["itchy rash on both arms", "swollen left ankle after a fall"])
+    write_manifest = index_versions.write_manifest
+    killed = [True]
+    def crash(*args, **kwargs):
+        if killed[0]:
+            raise RuntimeError("killed")
+        return write_manifest(*args, **kwargs)
+    monkeypatch.setattr(index_versions, "write_manifest", crash)
+    with pytest.raises(RuntimeError):
+        vdb.compact()
+    killed[0] = False
+    vdb.close()
+    reopened = make_vdb()
+    assert reopened.count() == 12 and reopened.index.base.ntotal == 12 and not reopened.index.segments
+    manifest = index_versions.read_manifest(reopened.index_file)
+    assert manifest["count"] == 12 and "pending" not in manifest
+    assert reopened.query_batch(["swollen ankle"], top_k=1)[0][0][0] == "swollen left ankle after a fall"
+
+FAISS_TYPES = {"flat": faiss.IndexFlat, "ivf_flat": faiss.IndexIVFFlat, "ivf_pq": faiss.IndexIVFPQ,
+               "ivf_sq8": faiss.IndexIVFScalarQuantizer, "hnsw": faiss.IndexHNSWFlat, "sq8": faiss.IndexScalarQuantizer,
+               "pq": faiss.IndexPQ}
+
+@pytest.mark.parametrize("index_type", sorted(FAISS_TYPES))
+def test_every_index_type_builds_and_serves(index_type, tmp_path, make_vdb, fake_model, cfg):
+    from services.faiss_index import INDEX_TYPES, make_index
+    assert set(FAISS_TYPES) == set(INDEX_TYPES)
+    cfg("faiss", nlist=4, nprobe=4, pq_m=8, pq_nbits=4, hnsw_m=8)
+    texts = [f"case {i}: {w} with {v} and {u}" for i, (w, v, u) in enumerate(
+        (a, b, c) for a in ("fever", "cough", "rash", "nausea", "headache", "fatigue")
+        for b in ("chills", "wheeze", "itching", "vomiting", "dizziness")
+        for c in ("day one", "week two", "month three", "after travel"))]
+    index_file = str(tmp_path / "general" / "index")
+    version, prefix = build_version(texts, index_file, index_type, CFG["faiss"]["embedding_model"], model=fake_model)
+    assert index_versions.read_manifest(prefix)["index_type"] == index_type
+    vdb = make_vdb()
+    assert isinstance(vdb.index.base, FAISS_TYPES[index_type]) and vdb.count() == len(texts)
+    hits = [t for t, _ in vdb.query(texts[17], top_k=10)]
+    assert texts[17] in hits
+    assert isinstance(make_index(32, index_type), FAISS_TYPES[index_type])
+
+def test_unknown_index_type_is_rejected():
+    from services.faiss_index import make_index
+    with pytest.raises(ValueError, match="ivf_pq"):
+        make_index(32, "annoy")
@@ -0,0 +1,32 @@
+# tests/test_chunk_meta.py
+import pytest
+from services.chunk_meta import ChunkMeta
+
+@pytest.fixture
+def meta(tmp_path):
+    m = ChunkMeta(str(tmp_path / "index"))
+    m.add(0, [{"source": "pubmed", "specialty": "cardiology", "language": "en", "year": 2019},
+              {"source": "pubmed", "specialty": "nursing", "language": "de", "year": "2012"},
+              None,
+              {"source": "guideline", "specialty": "cardiology", "language": "en", "year": 2021, "grade": "A"}])
+    yield m
+    m.close()
+
+def test_select_combines_predicates(meta):
+    assert meta.select({"source": "pubmed"}).tolist() == [0, 1]
+    assert meta.select({"specialty": ["cardiology", "nursing"], "year": {">=": 2015}}).tolist() == [0, 3]
+    assert meta.select({"language": {"!=": "en"}}).tolist() == [1]
+    assert meta.select({"grade": "A"}).tolist() == [3]      # free-form extras
+    assert meta.select({"specialty": []}).tolist() == []
+    assert meta.get(1) == {"source": "pubmed", "specialty": "nursing", "language": "de", "year": 2012}
+    assert meta.get(2) == {}
+
+def test_select_rejects_bad_keys_and_operators(meta):
+    with pytest.raises(ValueError):
+        meta.select({"year); DROP TABLE meta; --": 1})
+    with pytest.raises(ValueError):
+        meta.select({"year": {"~": 2015}})
+
+def test_truncate_drops_rows_past_the_store(meta):
+    meta.truncate(1)
+    assert meta.select({}).tolist() == [0]
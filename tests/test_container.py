@@ -0,0 +1,46 @@
+# tests/test_container.py
+import threading
+import pytest
+from services.container import ServiceContainer, _make_kg
+
+def test_services_are_built_once_on_first_access():
+    built = []
+    container = ServiceContainer()
+    container.register("vdb", lambda: built.append("vdb") or object())
+    assert not container.is_loaded("vdb") and built == []
+    got = []
+    threads = [threading.Thread(target=lambda: got.append(container.get("vdb"))) for _ in range(8)]
+    for t in threads: t.start()
+    for t in threads: t.join()
+    assert built == ["vdb"] and len({id(g) for g in got}) == 1 and container.is_loaded("vdb")
+    with pytest.raises(KeyError):
+        container.get("missing")
+
+def test_close_runs_in_reverse_creation_order_past_failing_closers():
+    closed = []
+    def fail(_):
+        raise RuntimeError("boom")
+    container = ServiceContainer()
+    container.register("kg", lambda: "kg", closed.append)
+    container.register("llm", lambda: "llm", fail)
+    container.register("vdb", lambda: "vdb", closed.append)
+    for name in ("vdb", "llm", "kg"):
+        container.get(name)
+    container.set("double", "test double")
+    container.close()
+    assert closed == ["kg", "vdb"] and not container.is_loaded("vdb")
+
+def test_kg_factory_wraps_the_driver_service_per_config(cfg, monkeypatch, graph):
+    from services.kg_cache import CachedKG
+    from services.kg_snapshot import SnapshotKG
+    monkeypatch.setattr("services.kg_async.AsyncKGService", lambda: graph)
+    cfg("neo4j", async_driver=True)
+    cfg("kg_snapshot", enabled=False)
+    cfg("kg_cache", enabled=True)
+    kg = _make_kg()
+    assert isinstance(kg, CachedKG) and kg.backend is graph
+    cfg("kg_snapshot", enabled=True, refresh_seconds=0)
+    cfg("kg_cache", enabled=False)
+    kg = _make_kg()
+    assert isinstance(kg, SnapshotKG) and kg.backend is graph
+    kg.close()
@@ -0,0 +1,55 @@
+# tests/test_embed_batcher.py
+import threading, time
+import numpy as np
+from services.embed_batcher import EmbeddingBatcher
+
+def test_backlog_is_drained_into_one_batch():
+    sizes = []
+    release = threading.Event()
+    def compute(texts):
+        sizes.append(len(texts))
+        release.wait(5)
+        return np.array([[float(t.split()[-1])] for t in texts], dtype="float32")
+    batcher = EmbeddingBatcher(compute, max_batch=32, max_wait_ms=2)
+    try:
+        results = {}
+        def ask(i):
+            results[i] = batcher.encode([f"query {i}"])
+        threads = [threading.Thread(target=ask, args=(i,)) for i in range(11)]
+        threads[0].start()
+        while not sizes:
+            time.sleep(0.001)
+        # the first batch is computing; ten more requests queue up well past max_wait
+        for t in threads[1:]:
+            t.start()
+        while batcher.queue.qsize() < 10:
+            time.sleep(0.001)
+        time.sleep(0.02)
+        release.set()
+        for t in threads:
+            t.join(5)
+        assert sizes == [1, 10]
+        assert all(results[i][0, 0] == i for i in range(11))
+        assert batcher.stats()["batches"] == 2
+    finally:
+        release.set()
+        batcher.close()
+
+def test_batches_stay_large_under_sustained_load():
+    sizes = []
+    def compute(texts):
+        sizes.append(len(texts))
+        time.sleep(0.005)
+        return np.zeros((len(texts), 4), dtype="float32")
+    batcher = EmbeddingBatcher(compute, max_batch=16, max_wait_ms=1)
+    def session(s):
+        for i in range(20):
+            batcher.encode([f"session {s} query {i}"])
+    threads = [threading.Thread(target=session, args=(s,)) for s in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    batcher.close()
+    assert sum(sizes) == 16 * 20
+    assert batcher.stats()["mean_batch"] >= 8
@@ -0,0 +1,51 @@
+# tests/test_embedding_cache.py
+import numpy as np
+from services.embedding_cache import EmbeddingCache
+
+def compute(calls):
+    def run(texts):
+        calls.append(list(texts))
+        return np.stack([np.full(4, len(t), dtype="float32") for t in texts])
+    return run
+
+def test_only_uncached_unique_texts_are_computed():
+    calls = []
+    cache = EmbeddingCache("m", max_items=10)
+    out = cache.encode(["a", "bb", "a"], compute(calls))
+    assert calls == [["a", "bb"]] and out[:, 0].tolist() == [1, 2, 1]
+    cache.encode(["bb", "ccc"], compute(calls))
+    assert calls[-1] == ["ccc"]
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 3
+
+def test_model_name_is_part_of_the_key():
+    assert EmbeddingCache("m1").key("fever") != EmbeddingCache("m2").key("fever")
+
+def test_disk_tier_survives_restart(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    calls = []
+    cache = EmbeddingCache("m", db_path=path)
+    cache.encode(["fever"], compute(calls))
+    cache.close()
+    cache = EmbeddingCache("m", db_path=path)
+    assert cache.encode(["fever"], compute(calls))[0, 0] == 5
+    assert len(calls) == 1 and cache.stats()["disk_hits"] == 1
+    cache.close()
+
+def test_disk_tier_evicts_least_recently_used(tmp_path):
+    path = str(tmp_path / "cache.sqlite")
+    calls = []
+    cache = EmbeddingCache("m", max_items=1, db_path=path, max_disk_items=3)
+    for t in ("a", "b", "c"):
+        cache.encode([t], compute(calls))
+    cache.encode(["a"], compute(calls))     # read back from disk: "b" is now the oldest row
+    cache.encode(["d"], compute(calls))
+    stats = cache.stats()
+    assert stats["disk_size"] == 3 and stats["evicted"] == 1
+    assert cache.db.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0] == 3
+    cache.close()
+    cache = EmbeddingCache("m", max_items=1, db_path=path, max_disk_items=2)
+    assert cache.stats()["disk_size"] == 2
+    calls.clear()
+    cache.encode(["a", "d", "b", "c"], compute(calls))
+    assert calls == [["b", "c"]]
+    cache.close()
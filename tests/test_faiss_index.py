@@ -0,0 +1,90 @@
+# tests/test_faiss_index.py
+import faiss, numpy as np
+from services.faiss_index import read_index
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).random((n, dim), dtype="float32")
+
+def test_read_index_maps_flat_and_ivf(tmp_path):
+    flat = faiss.IndexFlatL2(16); flat.add(_vectors(100))
+    faiss.write_index(flat, str(tmp_path / "flat"))
+    ivf = faiss.IndexIVFFlat(faiss.IndexFlatL2(16), 16, 4); ivf.train(_vectors(100)); ivf.add(_vectors(100))
+    faiss.write_index(ivf, str(tmp_path / "ivf"))
+    for name, n in (("flat", 100), ("ivf", 100)):
+        index, mmapped = read_index(str(tmp_path / name), use_mmap=True)
+        assert mmapped and index.ntotal == n
+        D, I = index.search(_vectors(1, seed=1), 3)
+        assert (I >= 0).all()
+    assert read_index(str(tmp_path / "flat"), use_mmap=False)[1] is False
+
+def test_untrained_base_is_skipped_and_compacts_flat(tmp_path, cfg):
+    from services.faiss_index import SegmentedIndex
+    cfg("faiss", index_type="ivf_flat", nlist=64)
+    index = SegmentedIndex(str(tmp_path / "index"), 16)
+    assert not index.base.is_trained
+    x = _vectors(20)
+    index.add(x)
+    D, I = index.search(x[:3], 2)
+    assert I[:, 0].tolist() == [0, 1, 2]
+    # 20 vectors cannot train 64 lists: the base stays flat instead of failing on every compaction
+    assert index.compact() == 20
+    assert isinstance(index.base, faiss.IndexFlatL2) and index.base.ntotal == 20 and not index.segments
+    index.add(_vectors(5, seed=3))
+    D, I = index.search(x[:3], 2)
+    assert I[:, 0].tolist() == [0, 1, 2]
+
+def test_vdb_with_untrained_index_type_answers_queries(make_vdb, cfg):
+    cfg("faiss", index_type="ivf_pq", nlist=64, pq_m=8)
+    vdb = make_vdb()
+    vdb.add_chunks(["fever and chills", "persistent dry cough", "itchy skin rash"])
+    hits = vdb.query_batch(["dry cough"], top_k=1)
+    assert hits[0][0][0] == "persistent dry cough"
+
+def test_merge_tiers_keeps_ids_and_bounds_segments(tmp_path):
+    from services.faiss_index import SegmentedIndex
+    index = SegmentedIndex(str(tmp_path / "index"), 16, load=False)
+    index.base = faiss.IndexFlatL2(16)
+    x = _vectors(64)
+    for i in range(0, 64, 2):
+        index.add(x[i:i + 2])
+        index.merge_tiers(4)
+    # 32 batches of 2 with fanout 4 end up in a few tiered segments, not 32
+    assert len(index.segments) <= 4 and index.ntotal == 64
+    D, I = index.search(x, 1)
+    assert I[:, 0].tolist() == list(range(64))
+    reloaded = SegmentedIndex(str(tmp_path / "index"), 16)
+    assert reloaded.ntotal == 64 and reloaded.search(x[40:41], 1)[1][0, 0] == 40
+    assert len(list(tmp_path.glob("index.seg.*"))) == len(index.segments)
+
+def test_bulk_adds_rewrite_the_base_geometrically(make_vdb, monkeypatch):
+    from services.faiss_index import SegmentedIndex
+    vdb = make_vdb()
+    compactions = []
+    compact = SegmentedIndex.compact
+    monkeypatch.setattr(SegmentedIndex, "compact",
+                        lambda self, staged=None: compactions.append(self.base.ntotal) or compact(self, staged))
+    for i in range(60):
+        vdb.add_chunks([f"chunk {i} word{i} token{i * 7}"])
+    assert vdb.count() == 60
+    assert 0 < len(compactions) <= 10
+    assert len(vdb.index.segments) <= vdb.max_segments
+
+def test_flat_stand_in_is_retrained_into_the_store_type(tmp_path, cfg):
+    from services.faiss_index import SegmentedIndex
+    cfg("faiss", index_type="ivf_flat", nlist=16)
+    index = SegmentedIndex(str(tmp_path / "index"), 16)
+    x = _vectors(40)
+    index.add(x[:5])
+    assert index.compact() == 5
+    assert isinstance(index.base, faiss.IndexFlatL2)
+    # the recorded type survives a reload, even once the configured default changes
+    cfg("faiss", index_type="flat")
+    index = SegmentedIndex(str(tmp_path / "index"), 16)
+    assert index.index_type == "ivf_flat"
+    index.add(x[5:])
+    assert index.should_compact(max_segments=16, ratio=100.0)
+    assert index.compact() == 35
+    assert isinstance(index.base, faiss.IndexIVFFlat) and index.base.ntotal == 40 and not index.segments
+    index.base.nprobe = 16
+    D, I = index.search(x[[0, 7, 39]], 1)
+    assert I[:, 0].tolist() == [0, 7, 39]
@@ -0,0 +1,33 @@
+# tests/test_ingest.py
+import json
+import pytest
+from services.ingest import chunk_text, ingest
+
+@pytest.fixture(autouse=True)
+def word_tokens(monkeypatch):
+    # tiktoken may try to download its encoding on every call when offline
+    monkeypatch.setattr("services.ingest.approx_tokens", lambda text: len(text.split()))
+
+ABSTRACT = ("Influenza presents with sudden fever, chills and muscle aches. Dry cough and sore throat "
+            "usually follow within a day. Most adults recover within two weeks without treatment. "
+            "Antivirals shorten the illness when started early. Vaccination each season lowers the risk.")
+
+def test_chunk_text_packs_sentences_with_overlap():
+    chunks = chunk_text(ABSTRACT, sentences_per_chunk=2, overlap=1, max_tokens=256)
+    assert chunks[0].startswith("Influenza") and chunks[1].startswith("Dry cough")
+    assert all(c.count(". ") <= 1 for c in chunks)
+
+def test_near_duplicates_are_dropped_before_embedding(make_vdb, fake_model, tmp_path, cfg):
+    cfg("llm", vdb_chunks=2, vdb_chunk_overlap=0)
+    rows = [{"id": f"doc{i}", "text": ABSTRACT, "source": "pubmed"} for i in range(3)]
+    rows.append({"id": "other", "text": "Migraine causes throbbing headache and nausea. Light makes it worse."})
+    corpus = tmp_path / "corpus.jsonl"
+    corpus.write_text("\n".join(json.dumps(r) for r in rows), encoding="utf-8")
+    vdb = make_vdb()
+    fake_model.calls.clear()
+    stats = ingest([str(corpus)], vdb, workers=0, batch_size=4, flush_every=4)
+    assert stats["docs"] == 4 and stats["duplicates"] > 0
+    # every embedded chunk was kept: the copies of the first abstract never reached the model
+    assert sum(fake_model.calls) == stats["chunks"] == vdb.count()
+    assert vdb.meta.get(0)["source"] == "pubmed"
+    assert vdb.query("throbbing headache", top_k=1)[0][0].startswith("Migraine")
@@ -0,0 +1,70 @@
+# tests/test_kg_cache.py
+import time
+from services.kg_cache import CachedKG
+from services.kg_snapshot import SnapshotKG
+
+TRIPLES = [("Influenza", "IS_SYMPTOM", "Fever")]
+
+class CountingKG:
+    """Backend without refresh(): answers retrieve_diseases_with_all_symptoms with the symptom count it was asked for."""
+    def __init__(self):
+        self.calls = []
+
+    def retrieve_diseases_with_all_symptoms(self, symptoms, limit=100):
+        self.calls.append(list(symptoms))
+        return [("Disease", "IS_SYMPTOM", str(len(symptoms)))]
+
+    def close(self):
+        pass
+
+def test_insert_invalidates(graph):
+    kg = CachedKG(graph)
+    assert kg.get_all_symptoms_for_diseases_from_triples(TRIPLES) == {"Influenza": ["Cough", "Fatigue", "Fever"]}
+    assert kg.get_all_symptoms_for_diseases_from_triples(TRIPLES) == {"Influenza": ["Cough", "Fatigue", "Fever"]}
+    assert graph.calls.count("get_all_symptoms_for_diseases_from_triples") == 1
+    kg.insert_triples([("Influenza", "IS_SYMPTOM", "Chills")])
+    assert kg.get_all_symptoms_for_diseases_from_triples(TRIPLES)["Influenza"] == ["Chills", "Cough", "Fatigue", "Fever"]
+
+def test_snapshot_refresh_invalidates(graph):
+    snap = SnapshotKG(graph, refresh_seconds=0)
+    kg = CachedKG(snap)
+    assert kg.retrieve_triples("chills") == []
+    graph.graph["Influenza"].append("Chills")
+    snap.refresh()      # called on the snapshot directly, not through the cache
+    assert kg.version == 1
+    assert kg.retrieve_triples("chills") == [("Influenza", "IS_SYMPTOM", "Chills")]
+
+def test_background_snapshot_refresh_invalidates(graph):
+    snap = SnapshotKG(graph, refresh_seconds=0.05)
+    try:
+        kg = CachedKG(snap)
+        assert kg.get_all_symptoms_for_diseases_from_triples(TRIPLES)["Influenza"] == ["Cough", "Fatigue", "Fever"]
+        graph.graph["Influenza"].append("Chills")
+        deadline = time.monotonic() + 5.0
+        while kg.version == 0 and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert kg.version > 0
+        assert kg.get_all_symptoms_for_diseases_from_triples(TRIPLES)["Influenza"] == ["Chills", "Cough", "Fatigue", "Fever"]
+    finally:
+        snap.close()
+
+def test_duplicate_symptoms_are_distinct_keys():
+    backend = CountingKG()
+    kg = CachedKG(backend)
+    assert kg.retrieve_diseases_with_all_symptoms(["Fever"])[0][2] == "1"
+    assert kg.retrieve_diseases_with_all_symptoms(["fever", "Fever"])[0][2] == "2"
+    assert kg.retrieve_diseases_with_all_symptoms(["Fever", "fever"])[0][2] == "2"
+    assert len(backend.calls) == 2
+
+def test_duplicate_similar_symptom_targets_are_distinct_keys(graph):
+    kg = CachedKG(graph)
+    kg.find_similar_symptoms(["cough"])
+    kg.find_similar_symptoms(["cough", "cough"])
+    kg.find_similar_symptoms(["cough", "cough"])
+    assert graph.calls.count("find_similar_symptoms") == 2
+
+def test_refresh_without_snapshot_backend(graph):
+    for backend in (graph, CountingKG()):
+        kg = CachedKG(backend)
+        assert kg.refresh() is None
+        assert kg.version == 1
@@ -0,0 +1,149 @@
+# tests/test_kg_service.py
+import asyncio, threading
+import pytest
+from services.kg_async import AsyncKGService
+from services.kg_service import INDEXED_QUERIES, LEGACY_QUERIES, KGService, SNAPSHOT_EDGES
+
+class FakeDriver:
+    """Sync Neo4j driver stand-in: answer(cypher, params) gives each statement's rows; records every run."""
+    def __init__(self, answer):
+        self.answer = answer
+        self.runs = []
+        self.sessions = 0
+
+    def session(self):
+        self.sessions += 1
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def run(self, cypher, **params):
+        self.runs.append((cypher, params))
+        return iter(self.answer(cypher, params))
+
+def make_kg(answer, queries=LEGACY_QUERIES, single_round_trip=True):
+    kg = KGService.__new__(KGService)    # no neo4j: the driver is the fake
+    kg.driver = FakeDriver(answer)
+    kg.queries = queries
+    kg.single_round_trip = single_round_trip
+    return kg
+
+def make_async_kg(answer, queries=LEGACY_QUERIES):
+    """AsyncKGService on its own loop thread; its steps are answered by a FakeDriver."""
+    kg = AsyncKGService.__new__(AsyncKGService)
+    kg.loop = asyncio.new_event_loop()
+    kg.thread = threading.Thread(target=kg.loop.run_forever, daemon=True)
+    kg.thread.start()
+    kg.queries, kg.single_round_trip = queries, True
+    kg.driver = FakeDriver(answer)
+    kg.threads = set()
+    async def execute(step):
+        kg.threads.add(threading.current_thread().name)
+        for cypher in step.tiers:
+            rows = list(kg.driver.run(cypher, **step.params))
+            if rows:
+                return rows
+        return []
+    kg._execute = execute
+    return kg
+
+def close_async_kg(kg):
+    kg.loop.call_soon_threadsafe(kg.loop.stop)
+    kg.thread.join(timeout=5.0)
+
+def test_tiers_fall_through_in_one_session():
+    tiers = LEGACY_QUERIES["retrieve_triples"]
+    kg = make_kg(lambda cypher, p: [] if cypher == tiers[0] else [{"s": "Influenza", "p": "REL", "o": "Fever"}])
+    assert kg.retrieve_triples("fever", limit=5) == [("Influenza", "REL", "Fever")]
+    assert [c for c, _ in kg.driver.runs] == list(tiers) and kg.driver.sessions == 1
+    assert kg.driver.runs[1][1] == {"q": "fever", "limit": 5}
+
+def test_read_errors_are_caught_but_snapshot_errors_raise():
+    def fail(cypher, params):
+        raise RuntimeError("connection refused")
+    kg = make_kg(fail)
+    assert kg.retrieve_triples("fever") == []
+    assert kg.retrieve_triples_many(["fever", "fever", "cough"]) == {"fever": [], "cough": []}
+    assert kg.get_all_symptoms_for_diseases_from_triples([("Flu", "IS_SYMPTOM", "Fever")]) == {}
+    with pytest.raises(RuntimeError):
+        kg.snapshot_edges()
+
+def test_multi_step_plan_feeds_the_expansion_into_the_tiers():
+    def answer(cypher, params):
+        if cypher == LEGACY_QUERIES["similar_symptoms"]:
+            return [{"symptom_name": "high fever"}]
+        if "high fever" in params.get("symptoms", ()):
+            return [{"disease": "Influenza", "relationship": "IS_SYMPTOM", "symptom": "high fever"}]
+        return []
+    kg = make_kg(answer, single_round_trip=False)
+    assert kg.retrieve_diseases_with_all_symptoms([" Fever "]) == [("Influenza", "IS_SYMPTOM", "high fever")]
+    similar, tier = kg.driver.runs
+    assert similar[1] == {"targets": ["fever"]}
+    assert tier[1] == {"symptoms": ["high fever"], "symptom_count": 1, "limit": 100}
+    assert kg.retrieve_diseases_with_all_symptoms(["  "]) == [] and len(kg.driver.runs) == 2
+
+def test_schema_ready_and_ensure_schema_switch_to_indexed_queries():
+    kg = make_kg(lambda cypher, p: [{"online": 4}] if "SHOW INDEXES" in cypher else [])
+    assert kg.schema_ready()
+    assert kg.ensure_schema() and kg.queries is INDEXED_QUERIES
+    assert any("CREATE TEXT INDEX" in c for c, _ in kg.driver.runs)
+
+def test_async_service_runs_the_shared_plans_on_its_own_loop():
+    rows = {"disease": "Influenza", "symptom": "Fever"}
+    kg = make_async_kg(lambda cypher, p: [rows] if cypher == SNAPSHOT_EDGES else
+                       [{"q": "fever", "triples": [["Influenza", "IS_SYMPTOM", "Fever"]]}])
+    try:
+        expected = {"fever": [("Influenza", "IS_SYMPTOM", "Fever")], "cough": []}
+        assert kg.retrieve_triples_many(["fever", "cough"]) == expected
+        assert asyncio.run(kg.aretrieve_triples_many(["fever", "cough"])) == expected
+        assert kg.snapshot_edges() == [("Influenza", "Fever")]
+        assert kg.threads == {kg.thread.name}
+    finally:
+        close_async_kg(kg)
+
+def test_unbackfilled_nodes_keep_the_unindexed_queries(cfg):
+    from services.kg_service import STALE_NAME_LC
+    cfg("neo4j", schema="detect")
+    stale = [{"name": "Loaded Later"}]
+    def answer(cypher, params):
+        if "SHOW INDEXES" in cypher:
+            return [{"online": 4}]
+        return stale if cypher == STALE_NAME_LC else []
+    kg = make_kg(answer)
+    kg._select_queries()
+    assert not kg.schema_ready() and kg.queries is LEGACY_QUERIES
+    stale.clear()           # after `python -m services.kg_service` backfilled them
+    kg._select_queries()
+    assert kg.queries is INDEXED_QUERIES
+
+def test_one_trip_query_sends_every_tier_in_a_single_statement():
+    rows = [{"tier": "partial", "disease": "Influenza", "relationship": "IS_SYMPTOM", "symptom": "Fever"},
+            {"tier": "partial", "disease": "Influenza", "relationship": "IS_SYMPTOM", "symptom": "Cough"}]
+    kg = make_kg(lambda cypher, p: rows)
+    tiered = kg.retrieve_diseases_with_all_symptoms_tiered([" Fever ", "", "COUGH"], limit=7)
+    assert tiered == [tuple(r.values()) for r in rows]
+    assert kg.driver.runs == [(LEGACY_QUERIES["diseases_one_trip"], {"symptoms": ["fever", "cough"], "limit": 7})]
+    assert kg.retrieve_diseases_with_all_symptoms(["fever", "cough"]) == [t[1:] for t in tiered]
+    assert len(kg.driver.runs) == 2 and kg.retrieve_diseases_with_all_symptoms_tiered([" "]) == []
+
+def test_one_trip_query_filters_on_name_lc_only_when_indexed():
+    legacy, indexed = LEGACY_QUERIES["diseases_one_trip"], INDEXED_QUERIES["diseases_one_trip"]
+    assert "lc(" not in legacy and "lc(" not in indexed
+    assert "s.name_lc" not in legacy and "toLower(s.name) CONTAINS target" in legacy
+    assert "s.name_lc CONTAINS target" in indexed and "s.name_lc IN search" in indexed
+    # the generic-schema tier has no label to index either way
+    assert "toLower(s.name) IN search" in indexed
+
+def test_triples_for_many_symptoms_take_one_unwind_statement():
+    rows = [{"q": "cough", "triples": [["Common Cold", "IS_SYMPTOM", "Cough"], ["Influenza", "IS_SYMPTOM", "Cough"]]},
+            {"q": "fever", "triples": [["Influenza", "IS_SYMPTOM", "Fever"], ["broken"]]}]
+    kg = make_kg(lambda cypher, p: rows, queries=INDEXED_QUERIES)
+    out = kg.retrieve_triples_many(["fever", "cough", "", "fever", "rash"], limit_per_symptom=3)
+    assert list(out) == ["fever", "cough", "rash"]
+    assert out["fever"] == [("Influenza", "IS_SYMPTOM", "Fever")] and len(out["cough"]) == 2 and out["rash"] == []
+    assert kg.driver.runs == [(INDEXED_QUERIES["triples_many"], {"qs": ["fever", "cough", "rash"], "limit": 3})]
+    assert kg.retrieve_triples_many([]) == {} and len(kg.driver.runs) == 1
@@ -0,0 +1,51 @@
+# tests/test_kg_snapshot.py
+import pytest
+from services.kg_snapshot import SnapshotKG
+
+@pytest.fixture
+def snapshot_kg(graph):
+    kg = SnapshotKG(graph, refresh_seconds=0)
+    graph.calls.clear()
+    return kg
+
+@pytest.mark.parametrize("triples", [
+    [("Influenza", "IS_SYMPTOM", "Fever")],
+    [("Rare Syndrome", "IS_SYMPTOM", "Fever"), ("migraine", "IS_SYMPTOM", "Nausea")],
+    [("Rare Syndrome", "HAS", "x")],
+])
+def test_disease_symptoms_match_neo4j(snapshot_kg, graph, triples):
+    expected = graph.get_all_symptoms_for_diseases_from_triples(triples)
+    graph.calls.clear()
+    assert snapshot_kg.get_all_symptoms_for_diseases_from_triples(triples) == expected
+    assert graph.calls == []
+
+def test_disease_without_symptoms_is_listed(snapshot_kg):
+    assert snapshot_kg.get_all_symptoms_for_diseases_from_triples([("Rare Syndrome", "IS_SYMPTOM", "Fever")]) == \
+        {"Rare Syndrome": []}
+    assert "Rare Syndrome" in snapshot_kg.snapshot.diseases and snapshot_kg.snapshot.n_edges == 7
+
+@pytest.mark.parametrize("q", ["cough", "FEV", "he", "sneezing"])
+def test_triples_and_similar_symptoms_match_neo4j(snapshot_kg, graph, q):
+    assert sorted(snapshot_kg.retrieve_triples(q)) == sorted(graph.retrieve_triples(q))
+    assert snapshot_kg.snapshot.find_similar_symptoms([q.lower()]) == graph.find_similar_symptoms([q.lower()])
+
+def test_unknown_names_fall_back_to_neo4j(snapshot_kg, graph):
+    assert snapshot_kg.retrieve_triples("rash") == []
+    assert snapshot_kg.get_all_symptoms_for_diseases_from_triples([("Lupus", "IS_SYMPTOM", "Rash")]) == {}
+    assert graph.calls == ["retrieve_triples", "get_all_symptoms_for_diseases_from_triples"]
+
+def test_tiered_disease_search_reports_the_first_matching_tier():
+    from tests.conftest import FakeGraph
+    kg = SnapshotKG(FakeGraph({"influenza": ["fever", "cough", "fatigue"], "common cold": ["cough", "sneezing"]}),
+                    refresh_seconds=0)
+    exact = kg.retrieve_diseases_with_all_symptoms_tiered([" Fever", "cough "])
+    assert sorted(exact) == [("exact", "influenza", "IS_SYMPTOM", "cough"), ("exact", "influenza", "IS_SYMPTOM", "fever")]
+    partial = kg.retrieve_diseases_with_all_symptoms_tiered(["cough", "fatigue", "sneezing"])
+    assert {t[0] for t in partial} == {"partial"} and {t[1] for t in partial} == {"influenza", "common cold"}
+    assert sorted(kg.retrieve_diseases_with_all_symptoms(["fever", "cough"])) == sorted(t[1:] for t in exact)
+
+def test_triples_many_asks_neo4j_only_for_the_symptoms_the_snapshot_missed(snapshot_kg, graph):
+    out = snapshot_kg.retrieve_triples_many(["cough", "rash", "cough"], limit_per_symptom=5)
+    assert list(out) == ["cough", "rash"] and out["rash"] == []
+    assert sorted(out["cough"]) == sorted(graph.retrieve_triples("cough"))
+    assert graph.calls.count("retrieve_triples_many") == 1
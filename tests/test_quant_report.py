@@ -0,0 +1,40 @@
+# tests/test_quant_report.py
+import numpy as np
+import pytest
+from services.quant_report import evaluate, load_vectors, recall_at_k
+from services.vector_store import VectorStore, exact_rerank
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).random((n, dim), dtype="float32")
+
+def test_recall_at_k_counts_overlap_per_query():
+    truth = np.array([[1, 2, 3], [4, 5, 6]])
+    found = np.array([[3, 2, 9], [7, 8, 9]])
+    assert recall_at_k(truth, found, 3) == pytest.approx(2 / 6)
+    assert recall_at_k(truth, found, 1) == 0.0
+
+def test_report_compares_compressed_types_with_flat(cfg):
+    cfg("faiss", nlist=4, nprobe=4, pq_m=4, pq_nbits=4)
+    vecs, queries = _vectors(1000), _vectors(20, seed=1)
+    rows = {r["type"]: r for r in evaluate(vecs, queries, ["sq8", "pq", "ivf_pq"], k=5, rerank_factor=4)}
+    assert list(rows) == ["flat", "sq8", "pq", "ivf_pq"]
+    assert rows["flat"]["recall"] == 1.0 and "recall_rerank" not in rows["flat"]
+    assert rows["sq8"]["bytes"] < rows["flat"]["bytes"] / 3 and rows["pq"]["bytes"] < rows["sq8"]["bytes"]
+    for t in ("sq8", "pq", "ivf_pq"):
+        assert rows[t]["recall_rerank"] >= rows[t]["recall"]
+
+def test_types_without_enough_training_points_are_skipped(cfg):
+    cfg("faiss", nlist=4096)
+    rows = evaluate(_vectors(200), _vectors(5, seed=1), ["ivf_flat"], k=3, rerank_factor=2)
+    assert [r["type"] for r in rows] == ["flat"]
+
+def test_vectors_file_is_reranked_exactly(tmp_path):
+    vecs = _vectors(50)
+    store = VectorStore(str(tmp_path / "index"), 16)
+    store.append(vecs[:30]); store.append(vecs[30:], persist=False)
+    assert np.array_equal(load_vectors(str(tmp_path / "index"), 16), vecs[:30])
+    q = vecs[[40, 7]] + 1e-4
+    cand = np.array([[3, 40, 12, -1], [7, 45, 2, 1]])
+    D, I = exact_rerank(store, q, cand, 2)
+    assert I[:, 0].tolist() == [40, 7]
+    assert D[0, 0] == pytest.approx(((vecs[40] - q[0]) ** 2).sum())
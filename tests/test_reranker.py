@@ -0,0 +1,45 @@
+# tests/test_reranker.py
+import time
+from services.reranker import Reranker
+
+class SlowCrossEncoder:
+    """Scores passages by how many query words they contain; takes `load_s` to load."""
+    def __init__(self, load_s: float):
+        time.sleep(load_s)
+        self.calls = 0
+
+    def predict(self, pairs):
+        self.calls += 1
+        return [float(len(set(q.lower().split()) & set(p.lower().split()))) for q, p in pairs]
+
+HITS = [("aspirin for fever", 0.1), ("chest pain and shortness of breath", 0.2), ("fever with chest pain", 0.3)]
+
+def _reranker(monkeypatch, load_s=0.0, **kwargs):
+    reranker = Reranker(model_name="stub", enabled=True, **kwargs)
+    def load(self=reranker):
+        if self.model is None:
+            self.model = SlowCrossEncoder(load_s)
+        return self.model
+    monkeypatch.setattr(reranker, "_model", load)
+    return reranker
+
+def test_model_load_does_not_spend_the_budget(monkeypatch):
+    reranker = _reranker(monkeypatch, load_s=0.3, budget_ms=100, batch_size=1)
+    out = reranker.rerank("chest pain", HITS, top_k=3)
+    assert reranker.over_budget == 0
+    assert [t for t, _ in out][:2] == ["chest pain and shortness of breath", "fever with chest pain"]
+    assert all(d < 1.0 for _, d in out)     # every candidate was scored
+
+def test_scores_are_cached_and_unscored_candidates_keep_their_order(monkeypatch):
+    reranker = _reranker(monkeypatch, candidates=2)
+    first = reranker.rerank("chest pain", HITS, top_k=3)
+    assert [t for t, _ in first] == [HITS[1][0], HITS[0][0]]
+    reranker.rerank("Chest  pain", HITS, top_k=3)
+    assert reranker.model.calls == 1
+    assert reranker.first_stage_k(1) == 2
+
+def test_unavailable_model_disables_reranking(monkeypatch):
+    reranker = Reranker(model_name="stub", enabled=True)
+    monkeypatch.setattr(reranker, "_model", lambda: (_ for _ in ()).throw(OSError("no weights")))
+    assert reranker.rerank("chest pain", HITS, top_k=2) == HITS[:2]
+    assert not reranker.enabled and reranker.first_stage_k(1) == 1
@@ -0,0 +1,31 @@
+# tests/test_result_cache.py
+import time
+from services.result_cache import ResultCache, normalize_query
+
+def test_lru_bound_and_ttl():
+    cache = ResultCache(max_items=2, ttl=0.05)
+    cache.put("a", 1); cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)                       # evicts b, the least recently used
+    assert cache.get("b") is None and cache.get("a") == 1
+    time.sleep(0.06)
+    assert cache.get("c", "gone") == "gone"
+    assert cache.stats()["expired"] == 1 and cache.stats()["hits"] == 2
+    assert normalize_query("  Chest\tPAIN \n") == "chest pain"
+
+def test_vdb_results_are_cached_until_a_write(make_vdb, monkeypatch):
+    vdb = make_vdb()
+    vdb.add_chunks(["dry cough at night", "high fever with chills"])
+    searched = []
+    search = vdb.index.search
+    monkeypatch.setattr(vdb.index, "search", lambda x, k, ids=None: searched.append(len(x)) or search(x, k, ids))
+    first = vdb.query("Fever", top_k=1)
+    assert vdb.query(" fever ", top_k=1) == first and searched == [1]
+    vdb.query("fever", top_k=2)                                   # top_k is part of the key
+    vdb.query("fever", top_k=1, filters={"source": "pubmed"})     # and so are the filters
+    assert len(searched) == 2           # the filter matched no chunk: answered without a search
+    assert vdb.query_batch(["fever", "cough"], top_k=1)[0] == first and searched[-1] == 1
+    n = len(searched)
+    vdb.add_chunks(["fever and rigors after surgery"])
+    hits = vdb.query("fever", top_k=3)
+    assert len(searched) == n + 1 and "fever and rigors after surgery" in [t for t, _ in hits]
@@ -0,0 +1,27 @@
+# tests/test_startup.py
+import os, subprocess, sys
+from services.config import load_config
+from services.startup import TIMINGS, report, timed
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("faiss", "tiktoken", "torch", "sentence_transformers", "transformers", "neo4j", "openai", "spacy")
+
+def test_config_is_parsed_once_and_shared():
+    assert load_config() is load_config()
+    from services import faiss_index, vdb_service
+    assert faiss_index.CFG is vdb_service.CFG is load_config()
+
+def test_importing_the_orchestrator_loads_no_heavy_dependency():
+    code = ("import sys, orchestrator.orchestrator; "
+            f"print(','.join(m for m in {HEAVY!r} if m in sys.modules))")
+    out = subprocess.run([sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, timeout=120)
+    assert out.returncode == 0, out.stderr
+    assert out.stdout.strip() == ""
+
+def test_timed_accumulates_into_the_report():
+    TIMINGS.pop("test step", None)
+    for _ in range(2):
+        with timed("test step"):
+            pass
+    assert TIMINGS["test step"] >= 0.0 and "test step" in report()
+    del TIMINGS["test step"]
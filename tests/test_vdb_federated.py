@@ -0,0 +1,138 @@
+# tests/test_vdb_federated.py
+import threading, time
+from services.vdb_federated import fuse_sources
+
+def test_fuse_sources_ranks_across_scales():
+    fused = fuse_sources({"general": [("a", 0.31), ("b", 0.42)], "nursing": [("c", 0.0), ("a", 0.5)]}, 3)
+    assert [t for t, _, _ in fused] == ["a", "c", "b"]
+    assert fused[0][2] == "general"
+    assert all(0.0 <= d < 1.0 for _, d, _ in fused)
+    assert [d for _, d, _ in fused] == sorted(d for _, d, _ in fused)
+
+def test_lexical_index_does_not_outrank_dense_hits_by_raw_distance(make_fed, cfg):
+    cfg("bm25", enabled=True, mode="dense")
+    fed = make_fed()
+    fed.services["general"].add_chunks(["dry cough at night", "high fever with chills"])
+    fed.services["nursing"].add_chunks(["dry skin lotion for patients", "dry cough at night", "wound dressing change"])
+    fed.services["nursing"].search_mode = "lexical"
+    hits = fed.search(["dry cough"], top_k=4)[0]
+    texts = [t for t, _, _ in hits]
+    assert texts[0] == "dry cough at night"
+    assert len(texts) == len(set(texts))
+    assert all(0.0 <= d < 1.0 for _, d, _ in hits)
+
+def test_dense_indexes_merge_by_cosine_distance(make_fed):
+    fed = make_fed()
+    fed.services["general"].add_chunks(["dry cough at night"])
+    fed.services["nursing"].add_chunks(["wound dressing change", "cough"])
+    hits = fed.search(["cough"], top_k=3)[0]
+    assert hits[0][:1] == ("cough",) and hits[0][2] == "nursing"
+    assert hits[0][1] < hits[1][1]
+
+class GatedPool:
+    """Executor whose tasks start only once `gate` is set, to hold a query between submit and run."""
+    def __init__(self, pool):
+        self.pool = pool
+        self.gate = threading.Event()
+        self.submitted = threading.Event()
+
+    def submit(self, fn, *args):
+        def run():
+            self.gate.wait(5)
+            return fn(*args)
+        fut = self.pool.submit(run)
+        self.submitted.set()
+        return fut
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
+
+def test_swap_waits_for_queries_captured_before_it(make_fed):
+    fed = make_fed(("general",))
+    fed.services["general"].add_chunks(["dry cough at night", "high fever with chills"])
+    old = fed.services["general"]
+    fed.pool = GatedPool(fed.pool)
+    result = {}
+    searcher = threading.Thread(target=lambda: result.setdefault("hits", fed.search(["cough"], top_k=1)))
+    searcher.start()
+    assert fed.pool.submitted.wait(5)
+    fed._swap("general", fed._load("general"))
+    time.sleep(0.2)
+    assert old._inflight == 1 and old.texts[0] == "dry cough at night"     # not retired under the queued query
+    fed.pool.gate.set()
+    searcher.join(5)
+    assert result["hits"][0][0][0] == "dry cough at night"
+    for _ in range(50):
+        if old._inflight == 0:
+            break
+        time.sleep(0.05)
+    assert old._inflight == 0
+
+def test_close_waits_for_acquired_references(make_vdb):
+    vdb = make_vdb()
+    vdb.add_chunks(["dry cough at night"])
+    vdb.acquire()
+    closer = threading.Thread(target=vdb.close, args=(None,))
+    closer.start()
+    time.sleep(0.2)
+    assert closer.is_alive()
+    assert vdb.query_batch(["cough"], top_k=1)[0][0][0] == "dry cough at night"
+    vdb.release()
+    closer.join(5)
+    assert not closer.is_alive()
+
+def test_rebuild_keeps_chunks_written_during_the_swap(make_fed, monkeypatch):
+    from services import index_versions
+    fed = make_fed(("general",))
+    old = fed.services["general"]
+    old.add_chunks(["dry cough at night", "high fever with chills"])
+    activate = index_versions.activate
+    writer = []
+    def late_write_then_activate(*args):
+        # a chunk written by another session after the last catch-up pass
+        writer.append(threading.Thread(target=old.add_chunks, args=(["itchy rash on both arms"],)))
+        writer[0].start()
+        time.sleep(0.2)
+        activate(*args)
+    monkeypatch.setattr(index_versions, "activate", late_write_then_activate)
+    fed.rebuild("general", background=False)
+    writer[0].join(5)
+    new = fed.services["general"]
+    assert new is not old and old.successor is new
+    assert [new.texts[i] for i in range(len(new.texts))] == \
+        ["dry cough at night", "high fever with chills", "itchy rash on both arms"]
+    assert fed.search(["rash"], top_k=1)[0][0][0] == "itchy rash on both arms"
+
+def test_shared_cache_moves_to_the_new_service_on_swap(make_fed, cfg, tmp_path):
+    cfg("embedding_cache", enabled=True, path=str(tmp_path / "cache.sqlite"))
+    fed = make_fed(("general",))
+    old = fed.services["general"]
+    old.add_chunks(["dry cough at night"])
+    fed.rebuild("general", background=False)
+    new = fed.services["general"]
+    old.close(wait=1.0)
+    assert new._owns_cache and new.cache is old.cache and new.cache.db is not None
+    assert fed.search(["cough"], top_k=1)[0][0][0] == "dry cough at night"
+    fed.close()
+    assert new.cache.db is None
+
+def test_reload_during_rebuild_does_not_load_a_second_writer(make_fed, monkeypatch):
+    from services import index_versions
+    fed = make_fed(("general",))
+    fed.services["general"].add_chunks(["dry cough at night"])
+    loads = []
+    load = fed._load
+    monkeypatch.setattr(fed, "_load", lambda name, version=None: loads.append(version) or load(name, version))
+    activate = index_versions.activate
+    reloader = []
+    def activate_then_reload(*args):
+        activate(*args)
+        # a reload noticing the new CURRENT before rebuild() swapped it in
+        reloader.append(threading.Thread(target=fed.refresh))
+        reloader[0].start()
+        time.sleep(0.2)
+    monkeypatch.setattr(index_versions, "activate", activate_then_reload)
+    version = fed.rebuild("general", background=False)
+    reloader[0].join(5)
+    assert loads == [version]
+    assert fed.services["general"].build_version == version
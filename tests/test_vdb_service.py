@@ -0,0 +1,86 @@
+# tests/test_vdb_service.py
+import pytest
+
+@pytest.fixture
+def bm25_vdb(make_vdb, cfg):
+    cfg("bm25", enabled=True, mode="hybrid")
+    vdb = make_vdb()
+    vdb.add_chunks(["dry cough at night", "dry skin lotion", "high fever with chills"])
+    return vdb
+
+def test_lexical_distances_are_rank_based_not_relative_to_the_best_hit(bm25_vdb):
+    rrf_k = bm25_vdb.rrf_k
+    hits = bm25_vdb.query_batch(["dry"], top_k=2, mode="lexical")[0]
+    assert len(hits) == 2
+    assert hits[0][1] == pytest.approx(0.5)
+    assert hits[1][1] == pytest.approx(1.0 - (rrf_k + 1) / (2.0 * (rrf_k + 2)))
+
+def test_hybrid_hit_found_by_both_passes_beats_a_lexical_only_hit(bm25_vdb):
+    hybrid = bm25_vdb.query_batch(["dry cough"], top_k=1, mode="hybrid")[0]
+    lexical = bm25_vdb.query_batch(["dry cough"], top_k=1, mode="lexical")[0]
+    assert hybrid[0][0] == lexical[0][0] == "dry cough at night"
+    assert hybrid[0][1] == pytest.approx(0.0) and lexical[0][1] == pytest.approx(0.5)
+
+def test_indexed_chunks_bypass_the_query_embedding_cache(make_vdb):
+    from services.embedding_cache import EmbeddingCache
+    cache = EmbeddingCache("fake", max_items=100)
+    vdb = make_vdb(cache=cache)
+    vdb.add_chunks(["dry cough at night", "high fever with chills"])
+    assert cache.stats()["misses"] == 0 and not cache.lru
+    vdb.query("fever")
+    vdb.results.clear()
+    vdb.query("fever")
+    assert cache.stats()["misses"] == 1 and cache.stats()["hits"] == 1
+
+def test_close_releases_owned_subsystems_only(make_vdb, cfg, tmp_path):
+    from services.embedding_cache import EmbeddingCache
+    cfg("faiss", rerank=True)
+    cfg("embedding_cache", enabled=True, path=str(tmp_path / "cache.sqlite"))
+    owner = make_vdb()
+    owner.add_chunks(["dry cough at night"])
+    shared = EmbeddingCache("fake", db_path=str(tmp_path / "shared.sqlite"))
+    borrower = make_vdb("nursing", cache=shared)
+    assert owner.vectors is not None and len(owner.vectors) == 1
+    owner.close(); borrower.close()
+    assert owner.cache.db is None and len(owner.vectors) == 0
+    assert shared.db is not None
+    shared.close()
+
+def test_compact_without_segments_is_silent(make_vdb, capsys):
+    vdb = make_vdb()
+    vdb.add_chunks(["dry cough at night"])     # the first write into an empty base compacts right away
+    assert not vdb.index.segments
+    capsys.readouterr()
+    assert vdb.compact() == 0
+    assert "compacted" not in capsys.readouterr().out
+
+CHUNKS = ["dry cough at night", "high fever with chills", "itchy rash on both arms", "throbbing headache and nausea"]
+
+def test_query_batch_embeds_and_searches_once_in_input_order(make_vdb, cfg, monkeypatch):
+    cfg("result_cache", enabled=False)
+    vdb = make_vdb()
+    vdb.add_chunks(CHUNKS)
+    queries = ["headache", "fever chills", "headache", "cough"]
+    encoded, searched = [], []
+    search = vdb.index.search
+    monkeypatch.setattr(vdb.index, "search", lambda x, k, ids=None: searched.append(len(x)) or search(x, k, ids))
+    hits = vdb.query_batch(queries, top_k=2, encoder=lambda texts: encoded.append(list(texts)) or vdb.encode(texts))
+    assert encoded == [queries] and searched == [4]
+    assert [h[0][0] for h in hits] == [CHUNKS[3], CHUNKS[1], CHUNKS[3], CHUNKS[0]]
+    assert all(len(h) == 2 for h in hits)
+    assert hits == [vdb.query(q, top_k=2) for q in queries]
+    assert vdb.query_batch([]) == []
+
+def test_filters_are_applied_inside_the_search(make_vdb, cfg):
+    cfg("bm25", enabled=True, mode="hybrid")
+    vdb = make_vdb()
+    vdb.add_chunks(CHUNKS, metadata=[{"language": "en", "year": 2010}, {"language": "en", "year": 2020},
+                                     {"language": "de", "year": 2020}, {"language": "en", "year": 2022}])
+    recent = {"year": {">=": 2015}, "language": "en"}
+    # the nearest chunk is filtered out, yet a full top_k of matching chunks comes back
+    for mode in ("dense", "lexical", "hybrid"):
+        hits = vdb.query_batch(["dry cough at night"], top_k=2, mode=mode, filters=recent)[0]
+        assert {t for t, _ in hits} <= {CHUNKS[1], CHUNKS[3]}
+    assert len(vdb.query_batch(["dry cough at night"], top_k=2, mode="dense", filters=recent)[0]) == 2
+    assert vdb.query("cough", filters={"source": "nowhere"}) == []
+    assert vdb.query("cough", top_k=1, filters={"year": 2010})[0][0] == CHUNKS[0]